@@ -2,6 +2,7 @@
 ASGI config for alx_backend_graphql project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Under ASGI, point clients at ``/graphql/async`` (crm.views.AsyncCRMGraphQLView).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
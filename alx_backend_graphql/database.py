@@ -0,0 +1,50 @@
+"""
+Database profile: the DATABASES setting, built from the environment.
+
+- CRM_DATABASE_PATH: the SQLite file (default: <BASE_DIR>/db.sqlite3)
+- CRM_DATABASE_CONN_MAX_AGE: seconds a connection is kept open and reused
+  across requests and tasks (default 600; 0 closes it after each request)
+- CRM_DATABASE_READ_PATH: a second SQLite file, kept in sync outside Django
+  (e.g. by a replication tool), served as the "replica" alias; it may lag
+  behind the primary, so a read right after a write can be stale
+- CRM_DATABASE_READ_ONLY=1: without a read path, serve the primary file
+  through a read-only URI connection as "replica"
+
+crm.db applies the SQLite pragmas to every new connection and its router
+sends GraphQL query operations to "replica" when it exists.
+"""
+
+import os
+from pathlib import Path
+
+READ_ALIAS = "replica"
+DEFAULT_CONN_MAX_AGE = 600
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+def _sqlite(name, conn_max_age):
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": name,
+        "CONN_MAX_AGE": conn_max_age,
+        # Persistent connections are checked before reuse after a request ends.
+        "CONN_HEALTH_CHECKS": conn_max_age != 0,
+    }
+
+
+def database_settings(base_dir, environ=os.environ):
+    path = environ.get("CRM_DATABASE_PATH") or str(Path(base_dir) / "db.sqlite3")
+    conn_max_age = int(environ.get("CRM_DATABASE_CONN_MAX_AGE", DEFAULT_CONN_MAX_AGE))
+    databases = {"default": _sqlite(path, conn_max_age)}
+
+    read_path = environ.get("CRM_DATABASE_READ_PATH")
+    if read_path:
+        databases[READ_ALIAS] = _sqlite(read_path, conn_max_age)
+    elif environ.get("CRM_DATABASE_READ_ONLY", "").lower() in TRUE_VALUES:
+        uri = Path(path).resolve().as_uri()
+        databases[READ_ALIAS] = _sqlite(f"{uri}?mode=ro", conn_max_age)
+    if READ_ALIAS in databases:
+        # Tests read from the test copy of the primary.
+        databases[READ_ALIAS]["TEST"] = {"MIRROR": "default"}
+    return databases
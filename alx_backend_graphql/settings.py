@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from .database import READ_ALIAS, database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -85,12 +87,10 @@ WSGI_APPLICATION = 'alx_backend_graphql.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Built from CRM_DATABASE_* environment variables (see .database): persistent
+# connections, plus an optional read-only "replica" alias for GraphQL queries.
+DATABASES = database_settings(BASE_DIR)
+DATABASE_ROUTERS = ["crm.db.ReadReplicaRouter"]
 
 
 # Password validation
@@ -141,6 +141,81 @@ GRAPHENE = {
     "SCHEMA": "alx_backend_graphql.schema.schema"
 }
 
+# CRM settings
+# Rows per bulk_create / IN (...) chunk in the bulk import mutations.
+CRM_BULK_CHUNK_SIZE = 500
+# Products below this stock are topped up by this many units by
+# updateLowStockProducts (when its arguments are omitted) unless a
+# RestockPolicy row overrides them.
+CRM_LOW_STOCK_THRESHOLD = 10
+CRM_RESTOCK_INCREMENT = 10
+# Parsed + validated GraphQL documents kept by the /graphql view (LRU).
+CRM_DOCUMENT_CACHE_SIZE = 256
+# Automatic Persisted Queries: APQ registrations kept in memory (LRU), an
+# optional JSON manifest of known queries, and whether to accept only those.
+CRM_PERSISTED_QUERY_CACHE_SIZE = 1024
+CRM_PERSISTED_QUERY_MANIFEST = None
+CRM_PERSISTED_QUERY_ALLOWLIST_ONLY = False
+# Cached read-query responses: Django cache alias (locmem unless CACHES says
+# otherwise) and entry lifetime in seconds.
+CRM_RESPONSE_CACHE_ENABLED = True
+CRM_RESPONSE_CACHE_ALIAS = "default"
+CRM_RESPONSE_CACHE_TIMEOUT = 60
+# Threads (and so database connections) the async GraphQL view may use at once.
+CRM_ASYNC_MAX_WORKERS = 8
+# Static query cost limits (crm.cost): nesting depth, total cost, and the
+# size assumed for lists/connections without a first/last/limit argument.
+CRM_QUERY_MAX_DEPTH = 10
+CRM_QUERY_MAX_COST = 10000
+CRM_QUERY_DEFAULT_LIST_SIZE = 100
+# Resolver/SQL tracing (crm.tracing) feeding /metrics; per-request traces in
+# the response extensions are sent for "X-CRM-Trace: 1" when this is on
+# (staff users always get them).
+CRM_TRACING_ENABLED = True
+CRM_TRACING_EXTENSIONS = DEBUG
+CRM_METRICS_ENABLED = True
+# Client addresses allowed to scrape /metrics without a staff login.
+CRM_METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+# Shared GraphQL client for cron jobs and tasks (crm.graphql_client): "auto"
+# executes in-process inside Django and over HTTP elsewhere. Standalone
+# scripts read the same names from the environment.
+CRM_GRAPHQL_CLIENT_MODE = "auto"
+CRM_GRAPHQL_URL = "http://127.0.0.1:8000/graphql"
+CRM_GRAPHQL_TIMEOUT = 10
+CRM_GRAPHQL_RETRIES = 3
+CRM_GRAPHQL_RETRY_BACKOFF = 0.5
+# Most operations /graphql accepts in one batched (JSON array) request.
+CRM_GRAPHQL_MAX_BATCH_SIZE = 10
+# crm.db applies its DEFAULT_PRAGMAS (WAL, busy timeout, page cache, mmap) to
+# every new SQLite connection; set CRM_SQLITE_PRAGMAS to replace them. The
+# alias GraphQL query operations read from:
+CRM_READ_DATABASE = READ_ALIAS if READ_ALIAS in DATABASES else None
+# Streaming exports (crm.export): rows fetched per database round trip, and
+# whether /export/<kind> is limited to staff users.
+CRM_EXPORT_CHUNK_SIZE = 2000
+CRM_EXPORT_STAFF_ONLY = True
+# Order writes retried when SQLite reports the database locked by another
+# writer (crm.inventory.retry_on_busy): attempts, and the first backoff in
+# seconds (doubled per attempt, with jitter).
+CRM_STOCK_BUSY_RETRIES = 5
+CRM_STOCK_BUSY_BACKOFF = 0.05
+# Order reminders (crm.reminders): seconds after order_date a reminder is
+# due, and how far ahead a customer's other orders join the same reminder.
+# Queueing a Celery task per new order needs a broker, so it is off here and
+# on in crm.settings; without it the Beat sweep sends the reminders.
+CRM_ORDER_REMINDER_DELAY = 24 * 60 * 60
+CRM_ORDER_REMINDER_BATCH_WINDOW = 60 * 60
+CRM_ORDER_REMINDER_QUEUE = False
+# Mutation audit log (crm.audit): events buffered per process (oldest dropped
+# beyond this), and written in one batch once this many are waiting or the
+# oldest is this many seconds old (a background timer enforces the latter
+# between requests). auditEvents is staff only unless the last setting is off.
+CRM_AUDIT_ENABLED = True
+CRM_AUDIT_BUFFER_SIZE = 10000
+CRM_AUDIT_FLUSH_SIZE = 100
+CRM_AUDIT_FLUSH_INTERVAL = 5
+CRM_AUDIT_STAFF_ONLY = True
+
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
 ]
@@ -1,9 +1,14 @@
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, export_view, metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    # Same schema for ASGI servers; concurrent root fields, no thread held while waiting.
+    path("graphql/async", csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True))),
+    path("metrics", metrics_view),
+    # Streaming NDJSON/CSV exports, filtered like the GraphQL connections.
+    path("export/<str:kind>", export_view),
 ]
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from . import audit, db, signals  # noqa: F401
+        from .persisted import get_persisted_queries
+
+        # Load (and verify) the persisted query manifest at startup, not on the first request.
+        if getattr(settings, "CRM_PERSISTED_QUERY_MANIFEST", None):
+            get_persisted_queries()
@@ -0,0 +1,205 @@
+"""
+Write-behind audit log for the CRM mutations.
+
+``record()`` builds an AuditEvent (who, what, when and the field diff) and,
+once the mutation's transaction commits, appends it to an in-process ring
+buffer: a deque of at most ``CRM_AUDIT_BUFFER_SIZE`` events that drops the
+oldest when full. Nothing touches the database on the mutation's path.
+
+The buffer goes to the AuditEvent table with one bulk_create when it holds
+``CRM_AUDIT_FLUSH_SIZE`` events or its oldest event is
+``CRM_AUDIT_FLUSH_INTERVAL`` seconds old, checked after each request has
+been answered (request_finished) and after each Celery task. A daemon timer
+armed by the first buffered event checks again once the interval is up, so
+an idle worker doesn't hold events until its next request. The buffer is
+also drained when the process exits, and the auditEvents query flushes
+first so it sees this process's own events. A failed flush keeps the events
+for the next attempt.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from celery.signals import task_postrun
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .metrics import registry
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 10000
+DEFAULT_FLUSH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 5
+
+# Set on requests made by code rather than a user (e.g. the local GraphQL client).
+ACTOR_ATTR = "crm_audit_actor"
+
+
+class AuditLog:
+    def __init__(self, buffer_size, flush_size, flush_interval):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._events = deque(maxlen=buffer_size)
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            buffer_size=getattr(settings, "CRM_AUDIT_BUFFER_SIZE", DEFAULT_BUFFER_SIZE),
+            flush_size=getattr(settings, "CRM_AUDIT_FLUSH_SIZE", DEFAULT_FLUSH_SIZE),
+            flush_interval=getattr(settings, "CRM_AUDIT_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL),
+        )
+
+    def __len__(self):
+        return len(self._events)
+
+    def append(self, event):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                registry.inc("crm_audit_dropped_total")
+            self._events.append(event)
+            first = self._oldest is None
+            if first:
+                self._oldest = time.monotonic()
+        if first:
+            self._start_timer()
+
+    def _start_timer(self):
+        timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+        timer.daemon = True
+        timer.start()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush_if_due()
+        finally:
+            # This thread's own connection; nothing else will close it.
+            connections.close_all()
+        with self._lock:
+            pending = bool(self._events)
+        if pending:
+            self._start_timer()
+
+    def is_due(self):
+        with self._lock:
+            if not self._events:
+                return False
+            return (
+                len(self._events) >= self.flush_size
+                or time.monotonic() - self._oldest >= self.flush_interval
+            )
+
+    def flush(self):
+        """Write every buffered event with one bulk_create; returns how many."""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._events)
+                self._events.clear()
+                self._oldest = None
+            if not batch:
+                return 0
+            try:
+                with transaction.atomic():
+                    AuditEvent.objects.bulk_create(batch, batch_size=self.flush_size)
+            except Exception:
+                logger.exception("Could not write %d audit events; keeping them", len(batch))
+                registry.inc("crm_audit_flush_errors_total")
+                self._requeue(batch)
+                return 0
+            registry.inc("crm_audit_flushed_total", len(batch))
+            return len(batch)
+
+    def _requeue(self, batch):
+        with self._lock:
+            pending = batch + list(self._events)
+            overflow = len(pending) - self._events.maxlen
+            if overflow > 0:
+                registry.inc("crm_audit_dropped_total", overflow)
+            self._events.clear()
+            self._events.extend(pending)
+            self._oldest = time.monotonic()
+
+    def flush_if_due(self):
+        return self.flush() if self.is_due() else 0
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._oldest = None
+
+
+@lru_cache(maxsize=None)
+def get_audit_log():
+    audit_log = AuditLog.from_settings()
+    atexit.register(audit_log.flush)
+    return audit_log
+
+
+def audit_enabled():
+    return getattr(settings, "CRM_AUDIT_ENABLED", True)
+
+
+# --- Recording ---
+def actor_of(request):
+    actor = getattr(request, ACTOR_ATTR, None)
+    if actor:
+        return actor
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user.get_username()
+    return "anonymous"
+
+
+def snapshot(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def diff(before, after):
+    """``{field: [old, new]}`` for the fields that differ; missing sides are None."""
+    return {
+        field: [before.get(field), after.get(field)]
+        for field in sorted(set(before) | set(after))
+        if before.get(field) != after.get(field)
+    }
+
+
+def record(request, action, target, changes):
+    """
+    Audit ``action`` on ``target`` (a model instance) by the user behind
+    ``request``. Buffered once the current transaction commits, so rolled
+    back changes are never logged.
+    """
+    if not audit_enabled():
+        return
+    event = AuditEvent(
+        created_at=timezone.now(),
+        actor=actor_of(request),
+        action=action,
+        target_type=type(target).__name__,
+        target_id="" if target.pk is None else str(target.pk),
+        changes=changes,
+    )
+    transaction.on_commit(lambda: get_audit_log().append(event))
+
+
+# --- Flush triggers ---
+@receiver(request_finished)
+def flush_after_request(sender, **kwargs):
+    # Sent once the response has been handed to the client.
+    get_audit_log().flush_if_due()
+
+
+@task_postrun.connect
+def flush_after_task(**kwargs):
+    get_audit_log().flush_if_due()
@@ -0,0 +1,422 @@
+"""
+Benchmark scenarios for the CRM endpoint and jobs.
+
+Every scenario runs the real code path (GraphQL requests go through
+``CRMGraphQLView`` with its middleware) against whatever database is
+configured, usually one filled by ``manage.py generate_crm_data``. Each
+iteration runs inside a transaction that is rolled back, so mutations and
+the cleanup job leave the dataset untouched and every iteration sees the
+same rows. The response cache is off unless asked for: the point is to time
+the resolvers, not the cache.
+
+For each scenario the wall-time percentiles and the SQL query count are
+recorded. ``compare`` flags a regression when a scenario issues more
+queries than the baseline, or its p95 grows by more than ``tolerance``
+(and at least ``MIN_SLACK_MS``, so sub-millisecond noise never fails).
+Baselines are only comparable on the dataset they were recorded against;
+the committed crm/benchmark_baseline.json was recorded on the default
+``generate_crm_data`` dataset (seed 0: 1000 customers, 100 products, 5000
+orders).
+
+Scenarios build their requests with django.test's RequestFactory and turn
+the response cache off with override_settings on purpose: both are plain
+runtime helpers and let the benchmarks drive the real view without a
+server. SQL statements are counted with ``connection.execute_wrapper``.
+
+``stress_order_creation`` is different: it races worker processes creating
+orders against a few hot products, with committed writes, to check that
+stock is never oversold and to measure orders/sec under contention.
+"""
+
+import json
+import math
+import multiprocessing
+import random
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import RequestFactory, override_settings
+
+from .bulk import OrderError, create_order
+from .db import read_database
+from .metrics import registry
+from .models import Customer, Order, Product
+from .tasks import generate_crm_report
+
+DEFAULT_ITERATIONS = 20
+DEFAULT_TOLERANCE = 0.5
+MIN_SLACK_MS = 2.0
+BULK_ORDER_ROWS = 20
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register ``func(fixture)`` as the benchmark scenario ``name``."""
+
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+
+    return register
+
+
+class BaselineMismatch(Exception):
+    pass
+
+
+class Fixture:
+    """Ids and values the scenarios need, looked up once per run."""
+
+    def __init__(self):
+        self.customer_id = Customer.objects.order_by("pk").values_list("pk", flat=True).first()
+        # In stock for every bulk_create_orders row, so no row is rejected.
+        self.product_ids = list(
+            Product.objects.filter(stock__gte=BULK_ORDER_ROWS)
+            .order_by("pk").values_list("pk", flat=True)[:3]
+        )
+        self._view = None
+
+    def graphql(self, query, variables=None):
+        from .views import CRMGraphQLView
+
+        if self._view is None:
+            self._view = CRMGraphQLView.as_view()
+        request = RequestFactory().post(
+            "/graphql", json.dumps({"query": query, "variables": variables}),
+            content_type="application/json",
+        )
+        request.user = AnonymousUser()
+        response = self._view(request)
+        body = json.loads(response.content)
+        if response.status_code != 200 or body.get("errors"):
+            raise RuntimeError(f"Benchmark query failed: {body.get('errors')}")
+        return body["data"]
+
+
+# --- Scenarios ---
+@scenario("list_customers")
+def list_customers(fixture):
+    fixture.graphql("{ allCustomers(first: 50) { edges { node { id name email } } } }")
+
+
+@scenario("list_products")
+def list_products(fixture):
+    fixture.graphql("{ allProducts(first: 50) { edges { node { id name price stock } } } }")
+
+
+@scenario("search_customers")
+def search_customers(fixture):
+    fixture.graphql('{ customers(search: "customer1") { id email } }')
+
+
+@scenario("nested_orders")
+def nested_orders(fixture):
+    fixture.graphql(
+        "{ allOrders(first: 50) { edges { node { id totalAmount orderDate "
+        "customer { name email } products { name price } } } } }"
+    )
+
+
+@scenario("customer_orders")
+def customer_orders(fixture):
+    fixture.graphql(
+        "{ allCustomers(first: 20) { edges { node { name orders { id totalAmount products { name } } } } } }"
+    )
+
+
+@scenario("create_customer")
+def create_customer(fixture):
+    fixture.graphql(
+        'mutation { createCustomer(name: "Bench", email: "bench@example.com") { customer { id } } }'
+    )
+
+
+@scenario("bulk_create_orders")
+def bulk_create_orders(fixture):
+    fixture.graphql(
+        "mutation ($input: [OrderInput!]!) { bulkCreateOrders(input: $input) { orders { id } errors } }",
+        {"input": [{"customerId": fixture.customer_id, "productIds": fixture.product_ids}] * BULK_ORDER_ROWS},
+    )
+
+
+@scenario("order_reminders_job")
+def order_reminders_job(fixture):
+    # The query crm/cron_jobs/send_order_reminders.py sends.
+    fixture.graphql(
+        "query RecentOrders($days: Int!) { recentOrders(days: $days) { id customer { email } } }",
+        {"days": 7},
+    )
+
+
+@scenario("low_stock_job")
+def low_stock_job(fixture):
+    # The mutation crm.cron.update_low_stock sends.
+    fixture.graphql("mutation { updateLowStockProducts { updatedProducts { name stock } message } }")
+
+
+@scenario("crm_report_job")
+def crm_report_job(fixture):
+    generate_crm_report()
+
+
+@scenario("clean_inactive_customers")
+def clean_inactive_customers(fixture):
+    call_command("clean_inactive_customers", stdout=StringIO())
+
+
+# --- Running ---
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@contextmanager
+def count_queries():
+    """Yield a list that gets one entry per SQL statement run on the default connection."""
+    statements = []
+
+    def counter(execute, sql, params, many, context):
+        statements.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(counter):
+        yield statements
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run_scenario(func, fixture, iterations=DEFAULT_ITERATIONS, warmup=1):
+    for _ in range(warmup):
+        with rolled_back():
+            func(fixture)
+
+    timings, query_counts = [], []
+    for _ in range(iterations):
+        with rolled_back(), count_queries() as queries:
+            start = time.perf_counter()
+            func(fixture)
+            timings.append((time.perf_counter() - start) * 1000)
+        query_counts.append(len(queries))
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "queries": max(query_counts),
+    }
+
+
+def dataset_summary():
+    return {
+        "customers": Customer.objects.count(),
+        "products": Product.objects.count(),
+        "orders": Order.objects.count(),
+    }
+
+
+def run_benchmarks(names=None, iterations=DEFAULT_ITERATIONS, warmup=1, response_cache=False, log=None):
+    """Run the named scenarios (default: all); returns a baseline-shaped dict."""
+    unknown = set(names or ()) - set(SCENARIOS)
+    if unknown:
+        raise KeyError(f"Unknown benchmark scenarios: {', '.join(sorted(unknown))}")
+
+    results = {}
+    with override_settings(CRM_RESPONSE_CACHE_ENABLED=response_cache):
+        fixture = Fixture()
+        if fixture.customer_id is None or not fixture.product_ids:
+            raise RuntimeError("Benchmarks need data; run `manage.py generate_crm_data` first.")
+        for name in names or SCENARIOS:
+            results[name] = run_scenario(SCENARIOS[name], fixture, iterations, warmup)
+            if log:
+                log(name, results[name])
+    return {"dataset": dataset_summary(), "scenarios": results}
+
+
+# --- Stock contention ---
+def _init_stress_worker():
+    # Under the "spawn" start method the worker starts with a bare interpreter.
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _stress_worker(job):
+    customer_id, product_ids, attempts, seed = job
+    rng = random.Random(seed)
+    retries_before = registry.value("crm_stock_busy_retries_total")
+    created = rejected = failed = 0
+    timings = []
+    for _ in range(attempts):
+        picked = rng.sample(product_ids, rng.randint(1, len(product_ids)))
+        start = time.perf_counter()
+        try:
+            create_order(customer_id, picked)
+        except OrderError:
+            rejected += 1
+        except OperationalError:
+            failed += 1  # still locked after every retry
+        else:
+            created += 1
+        timings.append((time.perf_counter() - start) * 1000)
+    connection.close()
+    return {
+        "created": created,
+        "rejected": rejected,
+        "failed": failed,
+        "timings": timings,
+        "busy_retries": registry.value("crm_stock_busy_retries_total") - retries_before,
+    }
+
+
+def _stress_reader(job):
+    customer_id, product_ids, reads = job
+    timings = []
+    start = time.perf_counter()
+    # Routed like a GraphQL query: to CRM_READ_DATABASE when there is one.
+    with read_database():
+        for _ in range(reads):
+            read_start = time.perf_counter()
+            list(Product.objects.filter(pk__in=product_ids).values_list("stock", flat=True))
+            Order.objects.filter(customer_id=customer_id).count()
+            timings.append((time.perf_counter() - read_start) * 1000)
+    elapsed = time.perf_counter() - start
+    connections.close_all()
+    return {"timings": timings, "seconds": elapsed}
+
+
+def stress_order_creation(processes=4, attempts=100, products=3, stock=100, seed=0,
+                          readers=0, reads=200, log=None):
+    """
+    Race ``processes`` worker processes, each trying ``attempts`` createOrder
+    calls for a random subset of ``products`` hot products that start with
+    ``stock`` units each, while ``readers`` more processes each read the
+    same rows ``reads`` times. The writes are committed, so the database
+    must be a file or a server; the rows are deleted afterwards.
+
+    Returns the counts, orders/sec, reads/sec and latency percentiles;
+    ``oversold`` lists products whose orders exceed the stock they started
+    with.
+    """
+    if connection.vendor == "sqlite" and connection.is_in_memory_db():
+        raise RuntimeError("The stress benchmark needs a file or server database, not :memory:.")
+    tag = uuid.uuid4().hex[:8]
+    customer = Customer.objects.create(name=f"Stress {tag}", email=f"stress-{tag}@example.com")
+    hot = [
+        Product.objects.create(name=f"Stress {tag} #{i}", price=Decimal("1.00"), stock=stock)
+        for i in range(products)
+    ]
+    product_ids = [product.pk for product in hot]
+    jobs = [(customer.pk, product_ids, attempts, seed + i) for i in range(processes)]
+    reader_jobs = [(customer.pk, product_ids, reads)] * readers
+
+    # Workers must not inherit this process's connections.
+    connections.close_all()
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    try:
+        with context.Pool(processes + readers, initializer=_init_stress_worker) as pool:
+            start = time.perf_counter()
+            reading = pool.map_async(_stress_reader, reader_jobs, chunksize=1)
+            workers = pool.map(_stress_worker, jobs, chunksize=1)
+            elapsed = time.perf_counter() - start
+            readings = reading.get()
+
+        remaining = dict(Product.objects.filter(pk__in=product_ids).values_list("pk", "stock"))
+        sold = Counter(
+            Order.products.through.objects.filter(order__customer=customer)
+            .values_list("product_id", flat=True)
+        )
+        orders = Order.objects.filter(customer=customer).count()
+    finally:
+        Order.objects.filter(customer=customer).delete()
+        customer.delete()
+        Product.objects.filter(pk__in=product_ids).delete()
+
+    created = sum(worker["created"] for worker in workers)
+    timings = [timing for worker in workers for timing in worker["timings"]]
+    result = {
+        "processes": processes,
+        "attempts": processes * attempts,
+        "created": created,
+        "rejected": sum(worker["rejected"] for worker in workers),
+        "failed": sum(worker["failed"] for worker in workers),
+        "busy_retries": sum(worker["busy_retries"] for worker in workers),
+        "seconds": round(elapsed, 3),
+        "orders_per_second": round(created / elapsed, 1),
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "sold": {pk: sold[pk] for pk in product_ids},
+        "oversold": [
+            pk for pk in product_ids
+            if sold[pk] > stock or sold[pk] + remaining[pk] != stock
+        ],
+        "lost_orders": created - orders,
+    }
+    if readings:
+        read_timings = [timing for reader in readings for timing in reader["timings"]]
+        result.update({
+            "reads": len(read_timings),
+            "reads_per_second": round(len(read_timings) / max(r["seconds"] for r in readings), 1),
+            "read_p95_ms": round(percentile(read_timings, 0.95), 3),
+        })
+    if log:
+        log(result)
+    return result
+
+
+# --- Baselines ---
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regression messages for ``results`` against ``baseline``; empty if none."""
+    if results["dataset"] != baseline["dataset"]:
+        raise BaselineMismatch(
+            f"The baseline was recorded against {baseline['dataset']}, "
+            f"this database has {results['dataset']}."
+        )
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        if current["queries"] > previous["queries"]:
+            regressions.append(
+                f"{name}: {current['queries']} SQL queries, baseline {previous['queries']}"
+            )
+        allowed = max(previous["p95_ms"] * (1 + tolerance), previous["p95_ms"] + MIN_SLACK_MS)
+        if current["p95_ms"] > allowed:
+            regressions.append(
+                f"{name}: p95 {current['p95_ms']:.1f} ms, baseline {previous['p95_ms']:.1f} ms "
+                f"(+{tolerance:.0%} allowed)"
+            )
+    return regressions
@@ -0,0 +1,258 @@
+"""
+Batched imports for customers and orders.
+
+The whole batch is validated up front with a constant number of queries,
+then written with bulk_create in chunks of ``CRM_BULK_CHUNK_SIZE`` rows.
+Order/product links go through a single bulk insert into the M2M through
+table, and the daily sales rollups take the batch's deltas in one upsert
+per dimension.
+Problems are reported per row ("Row 3: ...") and never abort the rest of
+the batch.
+
+Orders take their products' stock with one conditional UPDATE for the whole
+batch (crm.inventory.reserve_stock), in the same transaction that inserts
+them; ``create_order`` is the single-order form behind ``createOrder``.
+"""
+
+from collections import Counter
+from decimal import Decimal
+from itertools import chain
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .inventory import InsufficientStock, reserve_stock, retry_on_busy
+from .models import Customer, Order, Product
+from .reminders import queue_reminders, reminder_due_for
+from .response_cache import invalidate
+from .rollups import apply_deltas, day_of, order_deltas
+from .search import get_search_backend
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def get_chunk_size():
+    return getattr(settings, "CRM_BULK_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _by_row(errors):
+    return [f"Row {index}: {message}" for index, message in sorted(errors, key=lambda error: error[0])]
+
+
+# --- Customers ---
+def bulk_create_customers(rows, chunk_size=None):
+    """
+    Create customers from dicts with ``name``, ``email`` and optional ``phone``.
+
+    Returns ``(customers, errors)``.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    errors = []
+    candidates = []
+    seen = set()
+    phone_max = Customer._meta.get_field("phone").max_length
+
+    for index, row in enumerate(rows, start=1):
+        name = (row.get("name") or "").strip()
+        email = (row.get("email") or "").strip()
+        phone = row.get("phone") or None
+        if not name:
+            errors.append((index, "name is required"))
+            continue
+        try:
+            validate_email(email)
+        except ValidationError:
+            errors.append((index, f"invalid email '{email}'"))
+            continue
+        if phone and len(phone) > phone_max:
+            errors.append((index, f"phone is longer than {phone_max} characters"))
+            continue
+        if email in seen:
+            errors.append((index, f"duplicate email '{email}' in batch"))
+            continue
+        seen.add(email)
+        candidates.append((index, Customer(name=name, email=email, phone=phone)))
+
+    existing = set()
+    for chunk in chunked(candidates, chunk_size):
+        existing.update(
+            Customer.objects.filter(email__in=[c.email for _, c in chunk])
+            .values_list("email", flat=True)
+        )
+
+    to_create = []
+    for index, customer in candidates:
+        if customer.email in existing:
+            errors.append((index, f"email '{customer.email}' already exists"))
+        else:
+            to_create.append((index, customer))
+
+    created = []
+    for chunk in chunked(to_create, chunk_size):
+        created.extend(_insert_customer_chunk(chunk, errors))
+    get_search_backend().index_instances(Customer, created)
+    invalidate(Customer)
+    return created, _by_row(errors)
+
+
+def _insert_customer_chunk(chunk, errors):
+    try:
+        with transaction.atomic():
+            return Customer.objects.bulk_create([customer for _, customer in chunk])
+    except IntegrityError:
+        pass
+    # Lost a race with a concurrent insert; fall back to row-by-row for this chunk.
+    created = []
+    for index, customer in chunk:
+        try:
+            with transaction.atomic():
+                customer.save()
+            created.append(customer)
+        except IntegrityError:
+            errors.append((index, f"email '{customer.email}' already exists"))
+    return created
+
+
+# --- Orders ---
+class OrderError(Exception):
+    pass
+
+
+def bulk_create_orders(rows, chunk_size=None):
+    """
+    Create orders from dicts with ``customer_id``, ``product_ids`` and an
+    optional ``order_date``. Each order takes one unit of each of its
+    products from stock (crm.inventory.reserve_stock) and ``total_amount``
+    is computed from the prices read by that same statement; rows whose
+    products ran out are reported like any other problem.
+
+    Returns ``(orders, errors)``.
+    """
+    created, errors = _create_orders(rows, chunk_size or get_chunk_size())
+    return created, _by_row(errors)
+
+
+def create_order(customer_id, product_ids, order_date=None):
+    """Create a single order the same way; raises OrderError on any problem."""
+    row = {"customer_id": customer_id, "product_ids": product_ids, "order_date": order_date}
+    created, errors = _create_orders([row], get_chunk_size())
+    if errors:
+        raise OrderError(errors[0][1])
+    return created[0]
+
+
+def _create_orders(rows, chunk_size):
+    errors = []
+    parsed = []
+
+    for index, row in enumerate(rows, start=1):
+        customer_id = _parse_id(row.get("customer_id"))
+        product_ids = [_parse_id(pid) for pid in row.get("product_ids") or []]
+        if customer_id is None:
+            errors.append((index, "invalid customer id"))
+            continue
+        if not product_ids or None in product_ids:
+            errors.append((index, "at least one valid product id is required"))
+            continue
+        # dict.fromkeys keeps order while dropping repeats.
+        parsed.append((index, customer_id, list(dict.fromkeys(product_ids)), row.get("order_date")))
+
+    customer_ids = sorted({customer_id for _, customer_id, _, _ in parsed})
+    product_ids = sorted({pid for _, _, pids, _ in parsed for pid in pids})
+    known_customers = set()
+    for chunk in chunked(customer_ids, chunk_size):
+        known_customers.update(Customer.objects.filter(pk__in=chunk).values_list("pk", flat=True))
+    known_products = set()
+    for chunk in chunked(product_ids, chunk_size):
+        known_products.update(Product.objects.filter(pk__in=chunk).values_list("pk", flat=True))
+
+    pending = []
+    for index, customer_id, pids, order_date in parsed:
+        if customer_id not in known_customers:
+            errors.append((index, f"customer {customer_id} does not exist"))
+            continue
+        missing = [pid for pid in pids if pid not in known_products]
+        if missing:
+            errors.append((index, f"unknown product ids {missing}"))
+            continue
+        pending.append((index, customer_id, pids, order_date))
+    if not pending:
+        return [], errors
+
+    # Validation ran outside the transaction, so the write transaction starts
+    # with the stock UPDATE and takes the write lock at once.
+    created, stock_errors = retry_on_busy(lambda: _write_orders(pending, chunk_size))
+    invalidate(Order, Product)
+    return created, errors + stock_errors
+
+
+def _reserve_stock(pending):
+    """
+    Stock for the whole batch in one statement; if some product runs short,
+    order by order in row order, so the earlier rows get the stock.
+
+    Returns ``(reserved rows, prices, errors)``.
+    """
+    quantities = Counter(pid for _, _, pids, _ in pending for pid in pids)
+    try:
+        return pending, reserve_stock(quantities), []
+    except InsufficientStock as e:
+        if len(pending) == 1:
+            return [], {}, [(pending[0][0], str(e))]
+    reserved, prices, errors = [], {}, []
+    for item in pending:
+        index, _, pids, _ = item
+        try:
+            prices.update(reserve_stock(dict.fromkeys(pids, 1)))
+        except InsufficientStock as e:
+            errors.append((index, str(e)))
+        else:
+            reserved.append(item)
+    return reserved, prices, errors
+
+
+def _write_orders(pending, chunk_size):
+    created = []
+    Through = Order.products.through
+    with transaction.atomic():
+        reserved, prices, errors = _reserve_stock(pending)
+        orders = []
+        for _, customer_id, pids, order_date in reserved:
+            order = Order(
+                customer_id=customer_id,
+                total_amount=sum((prices[pid] for pid in pids), Decimal("0")),
+            )
+            if order_date is not None:
+                order.order_date = order_date
+            order.reminder_due_at = reminder_due_for(order.order_date)
+            orders.append((order, pids))
+
+        for chunk in chunked(orders, chunk_size):
+            created.extend(Order.objects.bulk_create([order for order, _ in chunk]))
+        links = [
+            Through(order_id=order.pk, product_id=pid)
+            for order, pids in orders
+            for pid in pids
+        ]
+        Through.objects.bulk_create(links, batch_size=chunk_size)
+        apply_deltas(chain.from_iterable(
+            order_deltas(day_of(order.order_date), order.customer_id, order.total_amount,
+                         {pid: prices[pid] for pid in pids})
+            for order, pids in orders
+        ))
+        queue_reminders(created)
+    return created, errors
@@ -0,0 +1,45 @@
+"""
+Bounded thread pool for running ORM work from async views.
+
+``run_in_pool(func)`` is ``sync_to_async`` on a shared pool of
+``CRM_ASYNC_MAX_WORKERS`` threads instead of asgiref's single
+thread-sensitive thread, so independent pieces of work really overlap while
+the number of threads (and database connections) stays capped. Connections
+are closed around every call, the way Django does at request boundaries.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+DEFAULT_MAX_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "CRM_ASYNC_MAX_WORKERS", DEFAULT_MAX_WORKERS),
+                thread_name_prefix="crm-graphql",
+            )
+        return _executor
+
+
+def run_in_pool(func):
+    """Wrap ``func`` so awaiting it runs it on the shared pool."""
+
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False, executor=get_executor())
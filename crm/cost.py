@@ -0,0 +1,210 @@
+"""
+Static cost and depth analysis for GraphQL operations.
+
+Cost is estimated from the document alone, before anything executes:
+
+    cost(field) = weight(field) + multiplier(field) * cost(sub-selection)
+
+- weight: 1 for fields returning an object, 0 for scalars and enums, unless
+  ``FIELD_WEIGHTS``/``CRM_QUERY_FIELD_WEIGHTS`` says otherwise ("Type.field")
+- multiplier: for lists and connections, the ``first``/``last``/``limit``
+  argument (a variable's default value counts), else
+  ``CRM_QUERY_DEFAULT_LIST_SIZE``; 1 for everything else
+- a connection's ``edges``/``node``/``pageInfo`` are free: the connection
+  field already paid for the page
+
+Depth counts nested field levels. Introspection fields (``__schema``,
+``__typename``, ...) are free, so GraphiQL keeps working. ``QueryCostRule``
+rejects operations over ``CRM_QUERY_MAX_COST`` or ``CRM_QUERY_MAX_DEPTH``.
+"""
+
+from django.conf import settings
+from graphene.relay import Connection
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    InlineFragmentNode,
+    IntValueNode,
+    ValidationRule,
+    VariableNode,
+    get_named_type,
+    get_nullable_type,
+    is_list_type,
+)
+from graphql.language import FragmentDefinitionNode
+
+from .persisted import LRUCache
+
+DEFAULT_MAX_COST = 10000
+DEFAULT_MAX_DEPTH = 10
+DEFAULT_LIST_SIZE = 100
+
+PAGINATION_ARGUMENTS = ("first", "last", "limit")
+
+# Fields that cost more than a row fetch.
+FIELD_WEIGHTS = {
+    "Query.crmStats": 10,
+}
+
+
+class QueryCost:
+    def __init__(self, cost, depth):
+        self.cost = cost
+        self.depth = depth
+
+    def as_extension(self):
+        return {
+            "requestedCost": self.cost,
+            "maxCost": get_max_cost(),
+            "depth": self.depth,
+            "maxDepth": get_max_depth(),
+        }
+
+
+def get_max_cost():
+    return getattr(settings, "CRM_QUERY_MAX_COST", DEFAULT_MAX_COST)
+
+
+def get_max_depth():
+    return getattr(settings, "CRM_QUERY_MAX_DEPTH", DEFAULT_MAX_DEPTH)
+
+
+def _is_connection(graphql_type):
+    graphene_type = getattr(graphql_type, "graphene_type", None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, Connection)
+
+
+def _is_connection_wrapper(graphql_type):
+    # edges/node/pageInfo are plumbing; the connection field itself is the fetch.
+    # graphene builds Edge types on the fly, so recognise them by shape.
+    fields = getattr(graphql_type, "fields", None) or {}
+    is_edge = graphql_type.name.endswith("Edge") and {"node", "cursor"} <= set(fields)
+    return is_edge or _is_connection(graphql_type)
+
+
+class _CostCalculator:
+    def __init__(self, schema, fragments, operation):
+        self.schema = schema
+        self.fragments = fragments
+        self.weights = {**FIELD_WEIGHTS, **getattr(settings, "CRM_QUERY_FIELD_WEIGHTS", {})}
+        self.list_size = getattr(settings, "CRM_QUERY_DEFAULT_LIST_SIZE", DEFAULT_LIST_SIZE)
+        self.variable_defaults = {
+            definition.variable.name.value: definition.default_value
+            for definition in operation.variable_definitions or ()
+        }
+
+    def selection_set(self, parent_type, selection_set, depth, visiting=frozenset()):
+        cost, max_depth = 0, depth
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self.field(parent_type, selection, depth + 1, visiting)
+            elif isinstance(selection, InlineFragmentNode):
+                condition = selection.type_condition
+                fragment_type = self.schema.get_type(condition.name.value) if condition else parent_type
+                field_cost, field_depth = self.selection_set(
+                    fragment_type, selection.selection_set, depth, visiting
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visiting:
+                    continue
+                field_cost, field_depth = self.selection_set(
+                    self.schema.get_type(fragment.type_condition.name.value),
+                    fragment.selection_set,
+                    depth,
+                    visiting | {name},
+                )
+            else:
+                continue
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+        return cost, max_depth
+
+    def field(self, parent_type, node, depth, visiting):
+        name = node.name.value
+        fields = getattr(parent_type, "fields", None) or {}
+        if name.startswith("__") or name not in fields:
+            # Introspection is free; unknown fields are reported by other rules.
+            return 0, depth - 1
+        field = fields[name]
+        named_type = get_named_type(field.type)
+
+        child_cost, child_depth = 0, depth
+        if node.selection_set is not None and hasattr(named_type, "fields"):
+            child_cost, child_depth = self.selection_set(named_type, node.selection_set, depth, visiting)
+
+        if _is_connection_wrapper(parent_type):
+            return child_cost, child_depth
+        weight = self.weights.get(
+            f"{parent_type.name}.{name}", 1 if hasattr(named_type, "fields") else 0
+        )
+        return weight + self.multiplier(parent_type, field, node) * child_cost, child_depth
+
+    def multiplier(self, parent_type, field, node):
+        nullable = get_nullable_type(field.type)
+        if not is_list_type(nullable) and not _is_connection(nullable):
+            return 1
+        for argument in node.arguments or ():
+            if argument.name.value not in PAGINATION_ARGUMENTS:
+                continue
+            value = argument.value
+            if isinstance(value, VariableNode):
+                value = self.variable_defaults.get(value.name.value)
+            if isinstance(value, IntValueNode):
+                return int(value.value)
+        if _is_connection(nullable):
+            return min(self.list_size, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        return self.list_size
+
+
+def operation_cost(schema, document, operation):
+    """``QueryCost`` of one operation definition of ``document``."""
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    root_type = schema.get_root_type(operation.operation)
+    if root_type is None:
+        return QueryCost(0, 0)
+    cost, depth = _CostCalculator(schema, fragments, operation).selection_set(
+        root_type, operation.selection_set, 0
+    )
+    return QueryCost(cost, depth)
+
+
+_cost_cache = LRUCache(256)
+
+
+def cached_operation_cost(schema, document, operation, document_key):
+    """``operation_cost`` memoized per document key (the query's sha256) and operation."""
+    key = (document_key, operation.name.value if operation.name else None)
+    cost = _cost_cache.get(key)
+    if cost is None:
+        cost = operation_cost(schema, document, operation)
+        _cost_cache.set(key, cost)
+    return cost
+
+
+class QueryCostRule(ValidationRule):
+    """Reject operations deeper than CRM_QUERY_MAX_DEPTH or costlier than CRM_QUERY_MAX_COST."""
+
+    def enter_operation_definition(self, node, *args):
+        result = operation_cost(self.context.schema, self.context.document, node)
+        name = f"Operation '{node.name.value}'" if node.name else "Operation"
+        if result.depth > get_max_depth():
+            self.report_error(GraphQLError(
+                f"{name} has depth {result.depth}, exceeding the limit of {get_max_depth()}.",
+                node,
+                extensions={"code": "QUERY_TOO_DEEP", "cost": result.as_extension()},
+            ))
+        if result.cost > get_max_cost():
+            self.report_error(GraphQLError(
+                f"{name} has cost {result.cost}, exceeding the budget of {get_max_cost()}.",
+                node,
+                extensions={"code": "QUERY_TOO_EXPENSIVE", "cost": result.as_extension()},
+            ))
+        return self.SKIP
@@ -4,10 +4,13 @@ Cron jobs for the CRM app.
 
 - log_crm_heartbeat: Appends a heartbeat line to /tmp/crm_heartbeat_log.txt
   Format: DD/MM/YYYY-HH:MM:SS CRM is alive
-  Also queries GraphQL `{ hello }` and appends status info.
+  Also queries GraphQL `{ __typename }` and appends status info.
 
 - update_low_stock: Calls the updateLowStockProducts mutation and logs updated products.
   Appends to /tmp/low_stock_updates_log.txt with timestamped lines.
+
+Both go through the shared client (crm.graphql_client), which runs them
+in-process when django-crontab invokes them.
 """
 
 from datetime import datetime
@@ -18,10 +21,20 @@ import traceback
 from gql.transport.requests import RequestsHTTPTransport
 from gql import gql, Client
 
+from .graphql_client import execute
+
 # --- Paths ---
 LOG_PATH = "/tmp/crm_heartbeat_log.txt"
 LOW_STOCK_LOG = "/tmp/low_stock_updates_log.txt"
-GRAPHQL_URL = "http://127.0.0.1:8000/graphql"
+
+UPDATE_LOW_STOCK_MUTATION = """
+mutation UpdateLowStock($inc: Int) {
+  updateLowStockProducts(increment: $inc) {
+    message
+    updatedProducts { id name stock }
+  }
+}
+"""
 
 
 # --- Utils ---
@@ -37,19 +50,12 @@ def log_crm_heartbeat():
 
     extra = ""
     try:
-        transport = RequestsHTTPTransport(
-            url=GRAPHQL_URL,
-            verify=False,
-            retries=1,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        query = gql("{ hello }")
-        result = client.execute(query)
-
-        if "hello" in result:
-            extra = " (GraphQL hello OK)"
+        result = execute("{ __typename }")
+
+        if result.get("__typename") == "Query":
+            extra = " (GraphQL OK)"
         else:
-            extra = " (GraphQL responded, but no hello)"
+            extra = " (GraphQL responded unexpectedly)"
     except Exception as e:
         extra = f" (GraphQL error: {type(e).__name__}: {e})"
 
@@ -68,24 +74,9 @@ def update_low_stock():
     Calls the updateLowStockProducts mutation and logs updated products.
     Appends lines to /tmp/low_stock_updates_log.txt with a timestamp.
     """
-    transport = RequestsHTTPTransport(
-        url=GRAPHQL_URL,
-        verify=True,
-        retries=3,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=False)
-
-    mutation = gql("""
-        mutation UpdateLowStock($inc: Int) {
-          updateLowStockProducts(increment: $inc) {
-            message
-            updatedProducts { id name stock }
-          }
-        }
-    """)
-
     try:
-        result = client.execute(mutation, variable_values={"inc": 10})
+        # No increment: the server applies CRM_RESTOCK_INCREMENT.
+        result = execute(UPDATE_LOW_STOCK_MUTATION)
         payload = result.get("updateLowStockProducts") or {}
         message = payload.get("message", "No message")
         products = payload.get("updatedProducts") or []
@@ -2,81 +2,46 @@
 """
 Query local GraphQL endpoint for orders in the last 7 days and log reminders.
 Logs to /tmp/order_reminders_log.txt and prints "Order reminders processed!".
+
+Scheduled reminders now come from Celery (crm.reminders); this script only
+remains for ad-hoc listings of recent orders.
+
+Requests go through the shared client (crm.graphql_client); its URL, timeout
+and retries come from the CRM_GRAPHQL_* environment variables.
 """
 
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
+import os
 import sys
 
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+# Run as a plain script from cron: make the project importable.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
-GRAPHQL_URL = "http://localhost:8000/graphql"
-LOG_FILE = "/tmp/order_reminders_log.txt"
+from crm.graphql_client import execute  # noqa: E402
 
-transport = RequestsHTTPTransport(
-    url=GRAPHQL_URL,
-    verify=False,
-    retries=3,
-    # If your GraphQL needs auth, add headers here like:
-    # headers={"Authorization": "Bearer <TOKEN>"}
-)
-client = Client(transport=transport, fetch_schema_from_transport=False)
+LOG_FILE = "/tmp/order_reminders_log.txt"
+REMINDER_WINDOW_DAYS = 7
 
-# Variants to try (adjust to match your schema if needed)
-QUERY_VARIANTS = [
-    """query { orders { id orderDate customer { email } } }""",
-    """query { orders { id order_date customer { email } } }""",
-    """query { allOrders { id orderDate customer { email } } }""",
-    """query { allOrders { id order_date customer { email } } }""",
-]
+# The server filters on order_date, so only the reminder window comes back.
+RECENT_ORDERS_QUERY = """
+query RecentOrders($days: Int!) {
+  recentOrders(days: $days) { id customer { email } }
+}
+"""
 
-def try_fetch_orders():
-    for q in QUERY_VARIANTS:
-        try:
-            result = client.execute(gql(q))
-            orders = result.get("orders") or result.get("allOrders")
-            if orders is not None:
-                return orders
-        except Exception:
-            continue
-    return None
-
-def parse_iso_datetime(s):
-    if not s:
-        return None
-    try:
-        if isinstance(s, (int, float)):
-            return datetime.fromtimestamp(s, tz=timezone.utc)
-        if isinstance(s, str) and s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        dt = datetime.fromisoformat(s)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt
-    except Exception:
-        return None
+def fetch_recent_orders(days=REMINDER_WINDOW_DAYS):
+    result = execute(RECENT_ORDERS_QUERY, {"days": days})
+    return result["recentOrders"]
 
 def main():
-    orders = try_fetch_orders()
-    if orders is None:
-        print("ERROR: Could not fetch orders from GraphQL endpoint.", file=sys.stderr)
+    try:
+        orders = fetch_recent_orders()
+    except Exception as e:
+        print(f"ERROR: Could not fetch orders from GraphQL endpoint: {e}", file=sys.stderr)
         sys.exit(1)
 
-    one_week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    lines_to_log = []
-
-    for o in orders:
-        oid = o.get("id") if isinstance(o, dict) else None
-        cust = o.get("customer") if isinstance(o, dict) else {}
-        email = cust.get("email") if isinstance(cust, dict) else None
-
-        raw_date = o.get("orderDate") or o.get("order_date") or o.get("order_date")
-        dt = parse_iso_datetime(raw_date) if raw_date else None
-
-        if dt and dt >= one_week_ago:
-            ts = datetime.now(timezone.utc).isoformat()
-            line = f"{ts} - Order {oid} - {email}"
-            lines_to_log.append(line)
+    ts = datetime.now(timezone.utc).isoformat()
+    lines_to_log = [f"{ts} - Order {o['id']} - {o['customer']['email']}" for o in orders]
 
     # append to log file
     if lines_to_log:
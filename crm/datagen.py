@@ -0,0 +1,181 @@
+"""
+Synthetic CRM data for benchmarks and load tests.
+
+``generate_dataset`` bulk-loads customers, products and orders with
+``bulk_create`` and explicit primary keys, so nothing is read back, and fills
+the order/product through table with batched multi-row inserts. Each
+chunk is one transaction. The same ``seed`` (and ``end``) always produces
+the same rows:
+
+- product popularity is skewed: low product ids show up in most orders
+- each order links 1..``max_products_per_order`` distinct products, mostly few
+- order dates are spread over the ``days`` days before ``end``
+
+Signals don't fire for bulk inserts, so the search index, the sales rollups
+and the response cache are brought up to date once at the end (skip with
+``derived=False``).
+"""
+
+import random
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import Customer, Order, Product
+from .response_cache import invalidate
+from .rollups import backfill_rollups
+from .search import chunked_rows, get_search_backend
+
+DEFAULT_CHUNK_SIZE = 10000
+
+FIRST_NAMES = (
+    "Alice", "Bob", "Carol", "Dave", "Erin", "Frank", "Grace", "Heidi", "Ivan", "Judy",
+    "Mallory", "Niaj", "Olivia", "Peggy", "Rupert", "Sybil", "Trent", "Victor", "Walter", "Yara",
+)
+LAST_NAMES = (
+    "Smith", "Johnson", "Okafor", "Garcia", "Nguyen", "Müller", "Rossi", "Tanaka", "Silva", "Kowalski",
+)
+PRODUCT_WORDS = (
+    "Laptop", "Phone", "Tablet", "Monitor", "Keyboard", "Mouse", "Headset", "Camera", "Router", "Speaker",
+)
+
+
+def _next_pk(model):
+    return (model.objects.aggregate(top=Max("pk"))["top"] or 0) + 1
+
+
+def _chunks(start, count, size):
+    for offset in range(0, count, size):
+        yield start + offset, min(size, count - offset)
+
+
+def _product_count(rng, max_products):
+    # Mostly one or two products per order, occasionally up to the maximum.
+    return min(max_products, 1 + int(rng.expovariate(0.8)))
+
+
+def _pick_products(rng, product_pks, count):
+    picked = set()
+    while len(picked) < count:
+        # Squaring a uniform draw skews picks towards the first (popular) products.
+        picked.add(product_pks[int(len(product_pks) * rng.random() ** 2)])
+    return sorted(picked)
+
+
+def generate_customers(rng, count, chunk_size=DEFAULT_CHUNK_SIZE, log=None):
+    first_pk = _next_pk(Customer)
+    for start, size in _chunks(first_pk, count, chunk_size):
+        customers = [
+            Customer(
+                pk=pk,
+                name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                email=f"customer{pk}@example.com",
+                phone=f"+1{rng.randrange(10 ** 9, 10 ** 10)}" if rng.random() < 0.8 else None,
+            )
+            for pk in range(start, start + size)
+        ]
+        with transaction.atomic():
+            Customer.objects.bulk_create(customers, batch_size=chunk_size)
+        if log:
+            log(f"Customers: {start + size - first_pk}/{count}")
+    return list(range(first_pk, first_pk + count))
+
+
+def generate_products(rng, count, chunk_size=DEFAULT_CHUNK_SIZE, log=None):
+    first_pk = _next_pk(Product)
+    prices = {}
+    for start, size in _chunks(first_pk, count, chunk_size):
+        products = []
+        for pk in range(start, start + size):
+            price = Decimal(rng.randrange(199, 200000)) / 100
+            prices[pk] = price
+            products.append(Product(
+                pk=pk,
+                name=f"{rng.choice(PRODUCT_WORDS)} {pk}",
+                price=price,
+                stock=rng.randrange(0, 200),
+            ))
+        with transaction.atomic():
+            Product.objects.bulk_create(products, batch_size=chunk_size)
+        if log:
+            log(f"Products: {start + size - first_pk}/{count}")
+    return prices
+
+
+def generate_orders(
+    rng, count, customer_pks, product_prices, max_products_per_order=5, days=365, end=None,
+    chunk_size=DEFAULT_CHUNK_SIZE, log=None,
+):
+    if count and (not customer_pks or not product_prices):
+        raise ValueError("Orders need at least one customer and one product.")
+    product_pks = sorted(product_prices)
+    max_products = min(max_products_per_order, len(product_pks))
+    window = int(timedelta(days=days).total_seconds())
+    through = Order.products.through
+    insert_links = (
+        f"INSERT INTO {connection.ops.quote_name(through._meta.db_table)} (order_id, product_id) VALUES "
+    )
+
+    first_pk = _next_pk(Order)
+    links_written = 0
+    for start, size in _chunks(first_pk, count, chunk_size):
+        orders, links = [], []
+        for pk in range(start, start + size):
+            products = _pick_products(rng, product_pks, _product_count(rng, max_products))
+            orders.append(Order(
+                pk=pk,
+                customer_id=customer_pks[rng.randrange(len(customer_pks))],
+                order_date=end - timedelta(seconds=rng.randrange(window)),
+                total_amount=sum((product_prices[product] for product in products), Decimal("0")),
+            ))
+            links.extend((pk, product) for product in products)
+        with transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=chunk_size)
+            with connection.cursor() as cursor:
+                # Multi-row statements rather than executemany(), which graphene's
+                # DjangoDebug cursor wrapper can't log.
+                for rows in chunked_rows(links, 2):
+                    cursor.execute(
+                        insert_links + ", ".join(["(%s, %s)"] * len(rows)),
+                        [value for row in rows for value in row],
+                    )
+        links_written += len(links)
+        if log:
+            log(f"Orders: {start + size - first_pk}/{count}")
+    return links_written
+
+
+def generate_dataset(
+    customers=1000, products=100, orders=5000, seed=0, max_products_per_order=5, days=365,
+    end=None, chunk_size=DEFAULT_CHUNK_SIZE, derived=True, log=None,
+):
+    """
+    Add ``customers``, ``products`` and ``orders`` rows; returns the row counts written.
+
+    ``end`` defaults to the start of today (UTC), so a given seed yields the
+    same data all day; pass it explicitly for byte-identical datasets.
+    """
+    rng = random.Random(seed)
+    if end is None:
+        end = datetime.combine(datetime.now(dt_timezone.utc).date(), dt_time.min, tzinfo=dt_timezone.utc)
+
+    customer_pks = generate_customers(rng, customers, chunk_size, log)
+    product_prices = generate_products(rng, products, chunk_size, log)
+    if orders and not customer_pks:
+        customer_pks = list(Customer.objects.values_list("pk", flat=True))
+    if orders and not product_prices:
+        product_prices = dict(Product.objects.values_list("pk", "price"))
+    links = generate_orders(
+        rng, orders, customer_pks, product_prices, max_products_per_order, days, end, chunk_size, log
+    )
+
+    if derived:
+        backend = get_search_backend()
+        backend.rebuild(Customer)
+        backend.rebuild(Product)
+        if orders:
+            backfill_rollups(end.date() - timedelta(days=days), end.date() + timedelta(days=1))
+        invalidate(Customer, Product, Order)
+    return {"customers": customers, "products": products, "orders": orders, "order_products": links}
@@ -0,0 +1,106 @@
+"""
+Connection tuning and read routing for the CRM databases.
+
+``configure_sqlite`` runs on every new SQLite connection and applies
+``CRM_SQLITE_PRAGMAS``:
+
+- journal_mode=WAL: readers never wait for the writer, nor the writer for
+  readers, so cron, Celery and web processes can share one file
+- synchronous=NORMAL: with WAL, commits stay atomic and only fsync at
+  checkpoints
+- busy_timeout: writers queue for the lock instead of failing at once
+- cache_size / mmap_size: a larger page cache and memory-mapped reads
+
+journal_mode is left alone on read-only and in-memory connections, which
+cannot switch to WAL.
+
+``ReadReplicaRouter`` sends reads to ``CRM_READ_DATABASE`` while
+``read_database()`` is active (the GraphQL view turns it on for query
+operations) and every write to "default". Mutations therefore read their
+own writes from the primary, and so does every later operation of the same
+request (a batch) once a mutation has run in it.
+
+Only the read-only URI replica (CRM_DATABASE_READ_ONLY) is always current.
+A CRM_DATABASE_READ_PATH replica is synced outside Django and can lag
+behind the primary, so responses read from any replica are never stored in
+the response cache: they could be stale under the versions of the new
+writes.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,
+    "cache_size": -64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+_reading = ContextVar("crm_read_database", default=False)
+
+# Set on a request once it has run a mutation.
+WROTE_ATTR = "_crm_wrote"
+
+
+def is_read_only(connection):
+    return "mode=ro" in str(connection.settings_dict["NAME"])
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "CRM_SQLITE_PRAGMAS", DEFAULT_PRAGMAS)
+    skip_journal = is_read_only(connection) or connection.is_in_memory_db()
+    for name, value in pragmas.items():
+        if name == "journal_mode" and skip_journal:
+            continue
+        # The raw connection: no debug cursor or execute wrappers at connect time.
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+
+
+# --- Routing ---
+@contextmanager
+def read_database(active=True):
+    """Route reads in this context to ``CRM_READ_DATABASE`` (if configured)."""
+    token = _reading.set(active)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+def get_read_alias():
+    alias = getattr(settings, "CRM_READ_DATABASE", None)
+    return alias if alias and _reading.get() else None
+
+
+def may_read_replica(request, is_query):
+    """Whether an operation of ``request`` may read from the replica."""
+    return is_query and not getattr(request, WROTE_ATTR, False)
+
+
+def mark_written(request):
+    setattr(request, WROTE_ATTR, True)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return get_read_alias()
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would write back to the alias an instance was read from.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # every alias holds the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != getattr(settings, "CRM_READ_DATABASE", None)
@@ -1,15 +1,32 @@
 import django_filters
-from .models import Customer, Product, Order
+from .models import AuditEvent, Customer, Product, Order
+from .search import orders_matching, search_filter, search_queryset
+
+
+def filter_search(queryset, name, value):
+    return search_queryset(queryset, value)
+
+
+def filter_contains(queryset, name, value):
+    # Substring match through the search index instead of LIKE '%x%'.
+    return search_filter(queryset, value, fields=(name,))
+
 
 class CustomerFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
-    email = django_filters.CharFilter(field_name="email", lookup_expr="icontains")
+    search = django_filters.CharFilter(method=filter_search)
+    name = django_filters.CharFilter(field_name="name", method=filter_contains)
+    email = django_filters.CharFilter(field_name="email", method=filter_contains)
     created_at__gte = django_filters.DateTimeFilter(field_name="created_at", lookup_expr="gte")
     created_at__lte = django_filters.DateTimeFilter(field_name="created_at", lookup_expr="lte")
     phone_pattern = django_filters.CharFilter(method="filter_phone_pattern")
 
     def filter_phone_pattern(self, queryset, name, value):
-        return queryset.filter(phone__startswith=value)
+        if not value:
+            return queryset
+        # A half-open range instead of LIKE 'x%' so the phone index is usable
+        # on every backend, whatever the LIKE collation.
+        upper = value[:-1] + chr(ord(value[-1]) + 1)
+        return queryset.filter(phone__gte=value, phone__lt=upper)
 
     class Meta:
         model = Customer
@@ -17,7 +34,8 @@ class CustomerFilter(django_filters.FilterSet):
 
 
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
+    search = django_filters.CharFilter(method=filter_search)
+    name = django_filters.CharFilter(field_name="name", method=filter_contains)
     price__gte = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
     price__lte = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
     stock__gte = django_filters.NumberFilter(field_name="stock", lookup_expr="gte")
@@ -29,14 +47,30 @@ class ProductFilter(django_filters.FilterSet):
 
 
 class OrderFilter(django_filters.FilterSet):
+    search = django_filters.CharFilter(method=filter_search)
     total_amount__gte = django_filters.NumberFilter(field_name="total_amount", lookup_expr="gte")
     total_amount__lte = django_filters.NumberFilter(field_name="total_amount", lookup_expr="lte")
     order_date__gte = django_filters.DateTimeFilter(field_name="order_date", lookup_expr="gte")
     order_date__lte = django_filters.DateTimeFilter(field_name="order_date", lookup_expr="lte")
-    customer_name = django_filters.CharFilter(field_name="customer__name", lookup_expr="icontains")
-    product_name = django_filters.CharFilter(field_name="products__name", lookup_expr="icontains")
-    product_id = django_filters.NumberFilter(field_name="products__id")
+    customer_name = django_filters.CharFilter(method="filter_customer_name")
+    product_name = django_filters.CharFilter(method="filter_product_name")
+    product_id = django_filters.NumberFilter(field_name="products__id", distinct=True)
+
+    def filter_customer_name(self, queryset, name, value):
+        return orders_matching(queryset, customer_value=value, customer_fields=("name",))
+
+    def filter_product_name(self, queryset, name, value):
+        return orders_matching(queryset, product_value=value)
 
     class Meta:
         model = Order
         fields = ["total_amount", "order_date", "customer_name", "product_name", "product_id"]
+
+
+class AuditEventFilter(django_filters.FilterSet):
+    created_at__gte = django_filters.DateTimeFilter(field_name="created_at", lookup_expr="gte")
+    created_at__lte = django_filters.DateTimeFilter(field_name="created_at", lookup_expr="lte")
+
+    class Meta:
+        model = AuditEvent
+        fields = ["actor", "action", "target_type", "target_id", "created_at"]
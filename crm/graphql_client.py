@@ -0,0 +1,304 @@
+"""
+Shared GraphQL client for the cron jobs, Celery tasks and scripts.
+
+``get_client()`` returns one client per process:
+
+- ``LocalClient`` when running inside a configured Django process (cron via
+  django-crontab, Celery workers, management commands): operations execute
+  against ``alx_backend_graphql.schema.schema`` directly, with no HTTP at all
+- ``HTTPClient`` otherwise (standalone scripts): a single gql session over a
+  keep-alive ``requests`` session with a pooled adapter. Connection failures
+  are retried for every operation; 429/5xx responses and read timeouts only
+  for queries, since a mutation may already have been applied.
+
+``execute_batch`` sends several operations at once: one POST with a JSON
+array body over HTTP, one shared request context in-process.
+
+The HTTP client validates operations against a locally cached SDL file
+(``CRM_GRAPHQL_SCHEMA_FILE``). The first run without it fetches the schema
+by introspection and writes the file; delete it after schema changes, or
+regenerate it with ``manage.py graphql_schema --out <file>.graphql``.
+
+Everything is configured in one place: Django settings when they are
+configured, else environment variables of the same name.
+
+- CRM_GRAPHQL_CLIENT_MODE: "auto" (default), "local" or "http"
+- CRM_GRAPHQL_URL, CRM_GRAPHQL_TIMEOUT (seconds), CRM_GRAPHQL_RETRIES,
+  CRM_GRAPHQL_RETRY_BACKOFF (backoff factor, seconds), CRM_GRAPHQL_POOL_SIZE
+- CRM_GRAPHQL_SCHEMA_FILE
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+from gql import Client, GraphQLRequest
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from gql.transport.requests import RequestsHTTPTransport
+from graphql import GraphQLError, OperationType, build_schema, get_operation_ast, parse, print_schema
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ReadTimeout
+from urllib3.util.retry import Retry
+
+MODE_AUTO = "auto"
+MODE_LOCAL = "local"
+MODE_HTTP = "http"
+
+DEFAULTS = {
+    "CRM_GRAPHQL_CLIENT_MODE": MODE_AUTO,
+    "CRM_GRAPHQL_URL": "http://127.0.0.1:8000/graphql",
+    "CRM_GRAPHQL_TIMEOUT": 10,
+    "CRM_GRAPHQL_RETRIES": 3,
+    "CRM_GRAPHQL_RETRY_BACKOFF": 0.5,
+    "CRM_GRAPHQL_POOL_SIZE": 10,
+    "CRM_GRAPHQL_SCHEMA_FILE": os.path.join(tempfile.gettempdir(), "crm_schema.graphql"),
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _django_ready():
+    try:
+        from django.apps import apps
+        from django.conf import settings
+    except ImportError:
+        return False
+    return settings.configured and apps.ready
+
+
+def get_config(name):
+    """``name`` from Django settings, else the environment, else ``DEFAULTS``."""
+    default = DEFAULTS[name]
+    if _django_ready():
+        from django.conf import settings
+
+        value = getattr(settings, name, None)
+        if value is not None:
+            return value
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return type(default)(value) if isinstance(default, (int, float)) else value
+
+
+def _is_mutation(query, operation_name=None):
+    try:
+        operation = get_operation_ast(parse(query), operation_name)
+    except GraphQLError:
+        return False
+    return operation is not None and operation.operation == OperationType.MUTATION
+
+
+def _is_retryable(error):
+    if isinstance(error, TransportServerError):
+        return error.code in RETRY_STATUSES
+    return isinstance(error, ReadTimeout)
+
+
+class LocalClient:
+    """Executes operations in-process against the project schema."""
+
+    @staticmethod
+    def _request():
+        from django.contrib.auth.models import AnonymousUser
+        from django.http import HttpRequest
+
+        # The request carries the DataLoaders, as in the view.
+        request = HttpRequest()
+        request.method = "POST"
+        request.user = AnonymousUser()
+        request.crm_audit_actor = "system"
+        return request
+
+    @staticmethod
+    def _execute(request, query, variables, operation_name):
+        from alx_backend_graphql.schema import schema
+
+        from .db import mark_written, may_read_replica, read_database
+        from .loaders import LOADERS_ATTR
+        from .views import CRMExecutionContext
+
+        mutation = _is_mutation(query, operation_name)
+        with read_database(may_read_replica(request, not mutation)):
+            result = schema.execute(
+                query,
+                variable_values=variables,
+                operation_name=operation_name,
+                context_value=request,
+                execution_context_class=CRMExecutionContext,
+            )
+        if mutation:
+            # Later operations of a batch must see its writes: fresh loader
+            # caches, and reads from the primary.
+            request.__dict__.pop(LOADERS_ATTR, None)
+            mark_written(request)
+        if result.errors:
+            raise TransportQueryError(
+                str(result.errors[0]),
+                errors=[error.formatted for error in result.errors],
+                data=result.data,
+            )
+        return result.data
+
+    def execute(self, query, variables=None, operation_name=None):
+        return self._execute(self._request(), query, variables, operation_name)
+
+    def execute_batch(self, operations):
+        request = self._request()
+        return [
+            self._execute(request, query, variables, None) for query, variables in operations
+        ]
+
+    def close(self):
+        pass
+
+
+class HTTPClient:
+    """A gql session kept open for the life of the process."""
+
+    def __init__(self, url, timeout, retries, backoff, pool_size, schema_file):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.schema_file = schema_file
+        self._session = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _load_schema(self):
+        try:
+            with open(self.schema_file) as f:
+                return build_schema(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _save_schema(self, schema):
+        try:
+            with open(self.schema_file, "w") as f:
+                f.write(print_schema(schema))
+        except OSError:
+            pass  # Only a cache: fetch again next time.
+
+    def _connect(self):
+        transport = RequestsHTTPTransport(url=self.url, timeout=self.timeout)
+        schema = self._load_schema()
+        client = Client(
+            transport=transport,
+            schema=schema,
+            fetch_schema_from_transport=schema is None,
+            execute_timeout=self.timeout,
+        )
+        session = client.connect_sync()
+        # The transport's requests.Session stays open (keep-alive) until close();
+        # give it a pool sized for concurrent callers. urllib3's default
+        # allowed_methods exclude POST, so it only retries requests that never
+        # reached the server; _send retries the rest for queries.
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(
+                total=self.retries,
+                backoff_factor=self.backoff,
+                status_forcelist=RETRY_STATUSES,
+            ),
+        )
+        for prefix in ("http://", "https://"):
+            transport.session.mount(prefix, adapter)
+        if schema is None and client.schema is not None:
+            self._save_schema(client.schema)
+        self._client = client
+        return session
+
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = self._connect()
+            return self._session
+
+    def _send(self, send, retry):
+        """Call ``send()``, retrying server errors and read timeouts when ``retry``."""
+        for attempt in range(self.retries + 1):
+            try:
+                return send()
+            except (TransportServerError, ReadTimeout) as e:
+                if not retry or attempt == self.retries or not _is_retryable(e):
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def execute(self, query, variables=None, operation_name=None):
+        request = GraphQLRequest(query, variable_values=variables, operation_name=operation_name)
+        session = self.session()
+        return self._send(
+            lambda: session.execute(request), retry=not _is_mutation(query, operation_name)
+        )
+
+    def execute_batch(self, operations):
+        requests = [GraphQLRequest(query, variable_values=variables) for query, variables in operations]
+        session = self.session()
+        return self._send(
+            lambda: session.execute_batch(requests),
+            retry=not any(_is_mutation(query) for query, _ in operations),
+        )
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close_sync()
+            self._session = self._client = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mode():
+    mode = get_config("CRM_GRAPHQL_CLIENT_MODE")
+    if mode == MODE_AUTO:
+        return MODE_LOCAL if _django_ready() else MODE_HTTP
+    if mode not in (MODE_LOCAL, MODE_HTTP):
+        raise ValueError(f"Unknown CRM_GRAPHQL_CLIENT_MODE: {mode!r}")
+    return mode
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            if get_mode() == MODE_LOCAL:
+                _client = LocalClient()
+            else:
+                _client = HTTPClient(
+                    url=get_config("CRM_GRAPHQL_URL"),
+                    timeout=get_config("CRM_GRAPHQL_TIMEOUT"),
+                    retries=get_config("CRM_GRAPHQL_RETRIES"),
+                    backoff=get_config("CRM_GRAPHQL_RETRY_BACKOFF"),
+                    pool_size=get_config("CRM_GRAPHQL_POOL_SIZE"),
+                    schema_file=get_config("CRM_GRAPHQL_SCHEMA_FILE"),
+                )
+        return _client
+
+
+def reset_client():
+    """Close and forget the shared client (after configuration changes)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+def execute(query, variables=None, operation_name=None):
+    """Run ``query`` with the shared client; returns ``data`` or raises TransportQueryError."""
+    return get_client().execute(query, variables, operation_name)
+
+
+def execute_batch(operations):
+    """
+    Run ``(query, variables)`` pairs as one batch; returns their ``data`` in order.
+
+    Raises TransportQueryError if any operation fails.
+    """
+    return get_client().execute_batch(list(operations))
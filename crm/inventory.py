@@ -0,0 +1,213 @@
+"""
+Stock maintenance for the CRM.
+
+restock_low_stock() tops up every product below its threshold with a single
+set-based statement:
+
+    UPDATE crm_product
+       SET stock = stock + COALESCE(policy.increment, <increment>)
+     WHERE stock < <max threshold>
+       AND stock < COALESCE(policy.threshold, <threshold>)
+    RETURNING id, name, price, stock, COALESCE(policy.increment, <increment>)
+
+The arithmetic happens in the database, so concurrent order writes can't be
+lost. Backends without UPDATE ... RETURNING lock, update and re-select
+inside one transaction instead.
+
+reserve_stock() takes the stock an order needs with one conditional
+statement over all of its products:
+
+    UPDATE crm_product
+       SET stock = stock - <n>
+     WHERE id IN (...) AND stock >= <n>
+    RETURNING id, price
+
+<n> is a CASE over the ids when the quantities differ. Either every
+product had enough stock or nothing is taken, so concurrent orders can
+never oversell.
+
+retry_on_busy() re-runs a whole write transaction when SQLite reports the
+database locked by another writer.
+"""
+
+import random
+import time
+from itertools import count
+
+from django.conf import settings
+from django.db import OperationalError, connections, router, transaction
+from django.db.models import Case, F, IntegerField, Max, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.sql import UpdateQuery
+
+from .metrics import registry
+from .models import Product, RestockPolicy
+from .response_cache import invalidate
+
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+DEFAULT_RESTOCK_INCREMENT = 10
+DEFAULT_BUSY_RETRIES = 5
+DEFAULT_BUSY_BACKOFF = 0.05
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"insufficient stock for products {self.product_ids}")
+
+
+def supports_update_returning(connection):
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def _compile_update(queryset, values):
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    return query.get_compiler(queryset.db).as_sql()
+
+
+def restock_low_stock(increment=None, threshold=None):
+    """
+    Add stock to every product below its threshold; return the updated products.
+
+    ``threshold``/``increment`` default to ``CRM_LOW_STOCK_THRESHOLD`` and
+    ``CRM_RESTOCK_INCREMENT``; a ``RestockPolicy`` row overrides both per product.
+    Each product's ``restocked_by`` is the increment applied to it.
+    """
+    if threshold is None:
+        threshold = getattr(settings, "CRM_LOW_STOCK_THRESHOLD", DEFAULT_LOW_STOCK_THRESHOLD)
+    if increment is None:
+        increment = getattr(settings, "CRM_RESTOCK_INCREMENT", DEFAULT_RESTOCK_INCREMENT)
+
+    policy = RestockPolicy.objects.filter(product=OuterRef("pk"))
+    product_threshold = Coalesce(Subquery(policy.values("threshold")[:1]), Value(threshold))
+    product_increment = Coalesce(Subquery(policy.values("increment")[:1]), Value(increment))
+    # Sargable upper bound so the stock index narrows the rows first.
+    max_threshold = max(
+        threshold, RestockPolicy.objects.aggregate(m=Max("threshold"))["m"] or 0
+    )
+
+    queryset = Product.objects.filter(stock__lt=max_threshold).filter(stock__lt=product_threshold)
+    values = {"stock": F("stock") + product_increment}
+    using = router.db_for_write(Product)
+    connection = connections[using]
+
+    with transaction.atomic(using=using):
+        if supports_update_returning(connection):
+            sql, params = _compile_update(queryset.using(using), values)
+            columns = ", ".join(
+                connection.ops.quote_name(field.column) for field in Product._meta.concrete_fields
+            )
+            increment_query = Product.objects.using(using).annotate(restocked_by=product_increment).query
+            increment_sql, increment_params = increment_query.get_compiler(using).compile(
+                increment_query.annotations["restocked_by"]
+            )
+            updated = list(Product.objects.using(using).raw(
+                f"{sql} RETURNING {columns}, {increment_sql} AS restocked_by",
+                (*params, *increment_params),
+            ))
+            updated.sort(key=lambda product: product.pk)
+        else:
+            pks = list(queryset.using(using).select_for_update().values_list("pk", flat=True))
+            Product.objects.using(using).filter(pk__in=pks).update(stock=F("stock") + product_increment)
+            updated = list(
+                Product.objects.using(using)
+                .filter(pk__in=pks)
+                .annotate(restocked_by=product_increment)
+                .order_by("pk")
+            )
+
+    if updated:
+        invalidate(Product)
+    return updated
+
+
+# --- Order reservations ---
+def _amounts(quantities):
+    """The per-row quantity: a constant, or a CASE over the product ids."""
+    distinct = set(quantities.values())
+    if len(distinct) == 1:
+        return Value(distinct.pop())
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def reserve_stock(quantities, using=None):
+    """
+    Take ``quantities`` ({product id: units}) out of stock, all or nothing.
+
+    Returns ``{product id: price}`` as read by the decrementing statement, so
+    totals match the rows that were reserved. Raises InsufficientStock, with
+    stock untouched, when any product is short or missing. Call it inside
+    the transaction that writes the order, so both commit or roll back
+    together; callers invalidate cached Product responses after commit.
+    """
+    quantities = {pk: quantity for pk, quantity in quantities.items() if quantity}
+    if not quantities:
+        return {}
+    using = using or router.db_for_write(Product)
+    connection = connections[using]
+    amount = _amounts(quantities)
+    queryset = Product.objects.using(using).filter(pk__in=list(quantities), stock__gte=amount)
+    values = {"stock": F("stock") - amount}
+
+    with transaction.atomic(using=using):
+        if supports_update_returning(connection):
+            sql, params = _compile_update(queryset, values)
+            columns = ", ".join(
+                connection.ops.quote_name(Product._meta.get_field(name).column)
+                for name in ("id", "price")
+            )
+            prices = {
+                product.pk: product.price
+                for product in Product.objects.using(using).raw(f"{sql} RETURNING {columns}", params)
+            }
+            if len(prices) == len(quantities):
+                return prices
+            short = set(quantities) - set(prices)
+        else:
+            locked = Product.objects.using(using).select_for_update().filter(pk__in=list(quantities))
+            prices = dict(locked.values_list("pk", "price"))
+            if queryset.update(**values) == len(quantities):
+                return prices
+            short = None
+        # Give back what the statement took from the products that had enough.
+        transaction.set_rollback(True, using=using)
+
+    if short is None:
+        stock = dict(
+            Product.objects.using(using).filter(pk__in=list(quantities)).values_list("pk", "stock")
+        )
+        short = [pk for pk, quantity in quantities.items() if stock.get(pk, 0) < quantity]
+    raise InsufficientStock(short)
+
+
+def is_busy_error(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def retry_on_busy(func, using=None):
+    """
+    Call ``func``, a complete write transaction, again with jittered
+    exponential backoff while the database reports itself locked by another
+    writer (SQLite waits up to its own timeout first). Inside an outer
+    transaction the error is raised at once: only the outermost caller can
+    start over.
+    """
+    using = using or router.db_for_write(Product)
+    retries = getattr(settings, "CRM_STOCK_BUSY_RETRIES", DEFAULT_BUSY_RETRIES)
+    backoff = getattr(settings, "CRM_STOCK_BUSY_BACKOFF", DEFAULT_BUSY_BACKOFF)
+    for attempt in count():
+        try:
+            return func()
+        except OperationalError as e:
+            if attempt >= retries or not is_busy_error(e) or connections[using].in_atomic_block:
+                raise
+        registry.inc("crm_stock_busy_retries_total")
+        time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
@@ -0,0 +1,85 @@
+"""
+Per-request DataLoaders for the CRM schema.
+
+Each loader collects the keys requested while a list is being resolved and
+fetches them with a single ``IN (...)`` query once the execution context
+dispatches its deferred callbacks (see ``crm.views.CRMGraphQLView``).
+
+- customer_by_id:      Customer rows keyed on customer id (OrderType.customer)
+- product_by_id:       Product rows keyed on product id (DailySalesRollupType.product)
+- products_by_order:   Product lists keyed on order id (OrderType.products)
+- orders_by_customer:  Order lists keyed on customer id (CustomerType.orders)
+- orders_by_product:   Order lists keyed on product id (ProductType.orders)
+"""
+
+from collections import defaultdict
+
+from graphql_sync_dataloaders import SyncDataLoader
+
+from .models import Customer, Order, Product
+
+LOADERS_ATTR = "_crm_loaders"
+
+
+# --- Batch functions ---
+def load_customers(customer_ids):
+    customers = Customer.objects.in_bulk(customer_ids)
+    return [customers.get(pk) for pk in customer_ids]
+
+
+def load_products(product_ids):
+    products = Product.objects.in_bulk(product_ids)
+    return [products.get(pk) for pk in product_ids]
+
+
+def load_products_by_order(order_ids):
+    grouped = defaultdict(list)
+    links = (
+        Order.products.through.objects.filter(order_id__in=order_ids)
+        .select_related("product")
+        .order_by("product_id")
+    )
+    for link in links:
+        grouped[link.order_id].append(link.product)
+    return [grouped[pk] for pk in order_ids]
+
+
+def load_orders_by_customer(customer_ids):
+    grouped = defaultdict(list)
+    for order in Order.objects.filter(customer_id__in=customer_ids).order_by("id"):
+        grouped[order.customer_id].append(order)
+    return [grouped[pk] for pk in customer_ids]
+
+
+def load_orders_by_product(product_ids):
+    grouped = defaultdict(list)
+    links = (
+        Order.products.through.objects.filter(product_id__in=product_ids)
+        .select_related("order")
+        .order_by("order_id")
+    )
+    for link in links:
+        grouped[link.product_id].append(link.order)
+    return [grouped[pk] for pk in product_ids]
+
+
+# --- Registry ---
+class CRMLoaders:
+    """Bundle of loaders whose caches live for a single GraphQL request."""
+
+    def __init__(self):
+        self.customer_by_id = SyncDataLoader(load_customers)
+        self.product_by_id = SyncDataLoader(load_products)
+        self.products_by_order = SyncDataLoader(load_products_by_order)
+        self.orders_by_customer = SyncDataLoader(load_orders_by_customer)
+        self.orders_by_product = SyncDataLoader(load_orders_by_product)
+
+
+def get_loaders(info):
+    """Return the loaders attached to this request, creating them on first use."""
+    context = info.context
+    loaders = getattr(context, LOADERS_ATTR, None)
+    if loaders is None:
+        loaders = CRMLoaders()
+        setattr(context, LOADERS_ATTR, loaders)
+    return loaders
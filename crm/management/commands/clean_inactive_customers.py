@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from crm.models import Customer, Order
+
+
+class Command(BaseCommand):
+    help = "Delete customers without an order in the last --days days, in id-ordered batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365,
+                            help="Inactivity window in days (default: 365).")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Customers per delete transaction (default: 1000).")
+        parser.add_argument("--sleep", type=float, default=0,
+                            help="Seconds to pause between batches (default: 0).")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only count the customers that would be deleted.")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        recent = Order.objects.filter(customer=OuterRef("pk"), order_date__gte=cutoff)
+        # NOT EXISTS (SELECT ... FROM crm_order WHERE customer_id = ... AND order_date >= ...)
+        inactive = Customer.objects.filter(~Exists(recent)).order_by("pk")
+        batch_size = options["batch_size"]
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+
+        total = 0
+        last_pk = 0
+        while True:
+            ids = list(inactive.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            if not options["dry_run"]:
+                ids = self.delete_batch(inactive, ids)
+            total += len(ids)
+            self.stdout.write(f"{verb} {total} customers (up to id {last_pk})")
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} inactive customers."))
+
+    def delete_batch(self, inactive, ids):
+        """
+        Delete one batch of customers with their orders and order links.
+
+        Goes through QuerySet.delete() so the model signals keep the search
+        index, the daily sales rollups and the response cache current.
+        """
+        with transaction.atomic():
+            # Re-check inside the transaction: an order may have arrived meanwhile.
+            ids = list(inactive.filter(pk__in=ids).values_list("pk", flat=True))
+            Customer.objects.filter(pk__in=ids).delete()
+        return ids
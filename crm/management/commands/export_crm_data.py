@@ -0,0 +1,58 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.export import (
+    CONTENT_TYPES,
+    DEFAULT_CHUNK_SIZE,
+    EXPORTS,
+    FORMAT_NDJSON,
+    ExportError,
+    stream_export,
+)
+
+
+class Command(BaseCommand):
+    help = "Stream orders or customers to a file (or stdout) as NDJSON or CSV, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(EXPORTS))
+        parser.add_argument("--format", choices=sorted(CONTENT_TYPES), default=FORMAT_NDJSON,
+                            help="Output format (default: ndjson).")
+        parser.add_argument("--output", "-o", default="-",
+                            help="File to write; '-' for stdout (default). A .gz name implies --gzip.")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output.")
+        parser.add_argument("--chunk-size", type=int, default=None,
+                            help="Rows per database round trip (default: CRM_EXPORT_CHUNK_SIZE, "
+                                 f"else {DEFAULT_CHUNK_SIZE}).")
+        parser.add_argument("--filter", action="append", default=[], metavar="NAME=VALUE",
+                            help="FilterSet parameter, e.g. --filter order_date__gte=2024-01-01; repeatable.")
+
+    def handle(self, *args, **options):
+        params = {}
+        for item in options["filter"]:
+            name, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"--filter expects NAME=VALUE, got '{item}'.")
+            params[name] = value
+
+        output = options["output"]
+        compress = options["gzip"] or output.endswith(".gz")
+        try:
+            blocks = stream_export(
+                options["kind"], params, options["format"], compress, options["chunk_size"]
+            )
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        if output == "-":
+            stream = sys.stdout.buffer
+            for block in blocks:
+                stream.write(block)
+            stream.flush()
+            return
+        written = 0
+        with open(output, "wb") as f:
+            for block in blocks:
+                written += f.write(block)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {output}."))
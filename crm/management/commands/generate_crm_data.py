@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.datagen import DEFAULT_CHUNK_SIZE, generate_dataset
+
+
+class Command(BaseCommand):
+    help = "Bulk-load a deterministic synthetic dataset of customers, products and orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=1000,
+                            help="Customers to create (default: 1000).")
+        parser.add_argument("--products", type=int, default=100,
+                            help="Products to create (default: 100).")
+        parser.add_argument("--orders", type=int, default=5000,
+                            help="Orders to create (default: 5000).")
+        parser.add_argument("--seed", type=int, default=0,
+                            help="Random seed; the same seed gives the same data (default: 0).")
+        parser.add_argument("--max-products-per-order", type=int, default=5,
+                            help="Upper bound of the order/product fan-out (default: 5).")
+        parser.add_argument("--days", type=int, default=365,
+                            help="Spread order dates over this many days before today (default: 365).")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f"Rows per insert transaction (default: {DEFAULT_CHUNK_SIZE}).")
+        parser.add_argument("--skip-derived", action="store_true",
+                            help="Don't rebuild the search index and sales rollups afterwards.")
+
+    def handle(self, *args, **options):
+        for name in ("customers", "products", "orders"):
+            if options[name] < 0:
+                raise CommandError(f"--{name} must not be negative.")
+        if options["max_products_per_order"] < 1 or options["days"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--max-products-per-order, --days and --chunk-size must be at least 1.")
+
+        started = time.perf_counter()
+        try:
+            counts = generate_dataset(
+                customers=options["customers"],
+                products=options["products"],
+                orders=options["orders"],
+                seed=options["seed"],
+                max_products_per_order=options["max_products_per_order"],
+                days=options["days"],
+                chunk_size=options["chunk_size"],
+                derived=not options["skip_derived"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['customers']} customers, {counts['products']} products, "
+            f"{counts['orders']} orders ({counts['order_products']} order lines) "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
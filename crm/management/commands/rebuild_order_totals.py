@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from crm.models import Order
+from crm.response_cache import invalidate
+
+
+class Command(BaseCommand):
+    help = "Recompute Order.total_amount from product prices in id-range chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000,
+                            help="Orders per UPDATE statement (default: 10000).")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        bounds = Order.objects.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is None:
+            self.stdout.write("No orders to rebuild.")
+            return
+
+        updated = 0
+        for start in range(bounds["low"], bounds["high"] + 1, chunk_size):
+            # Short transactions so writers are never blocked for the whole rebuild.
+            with transaction.atomic():
+                updated += Order.objects.filter(
+                    pk__gte=start, pk__lt=start + chunk_size
+                ).refresh_totals()
+            self.stdout.write(f"Rebuilt totals up to order id {start + chunk_size - 1} ({updated} orders)")
+            invalidate(Order)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt totals for {updated} orders."))
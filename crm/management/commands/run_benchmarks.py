@@ -0,0 +1,79 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+import crm
+from crm.benchmarks import (
+    DEFAULT_ITERATIONS,
+    DEFAULT_TOLERANCE,
+    SCENARIOS,
+    BaselineMismatch,
+    compare,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(crm.__file__), "benchmark_baseline.json")
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the CRM benchmark scenarios and fail on regressions against a stored baseline "
+        "(the committed one is for `generate_crm_data` with its defaults)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), dest="scenarios",
+                            help="Scenario to run; repeat for several (default: all).")
+        parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS,
+                            help=f"Timed runs per scenario (default: {DEFAULT_ITERATIONS}).")
+        parser.add_argument("--warmup", type=int, default=1,
+                            help="Untimed runs per scenario first (default: 1).")
+        parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                            help="Baseline JSON file (default: crm/benchmark_baseline.json).")
+        parser.add_argument("--update-baseline", action="store_true",
+                            help="Store these results as the new baseline instead of comparing.")
+        parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                            help=f"Allowed relative p95 growth (default: {DEFAULT_TOLERANCE}).")
+        parser.add_argument("--response-cache", action="store_true",
+                            help="Leave the response cache on while benchmarking.")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be at least 1.")
+
+        def log(name, result):
+            self.stdout.write(
+                f"{name:<26} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                f"p99 {result['p99_ms']:>9.2f} ms  {result['queries']:>4} queries"
+            )
+
+        try:
+            results = run_benchmarks(
+                options["scenarios"], options["iterations"], options["warmup"],
+                response_cache=options["response_cache"], log=log,
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        path = options["baseline"]
+        if options["update_baseline"]:
+            baseline = load_baseline(path) or {"dataset": results["dataset"], "scenarios": {}}
+            if baseline["dataset"] == results["dataset"]:
+                # Keep the scenarios this run skipped.
+                results["scenarios"] = {**baseline["scenarios"], **results["scenarios"]}
+            save_baseline(path, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {path}."))
+            return
+
+        baseline = load_baseline(path)
+        if baseline is None:
+            raise CommandError(f"No baseline at {path}; run with --update-baseline to record one.")
+        try:
+            regressions = compare(results, baseline, options["tolerance"])
+        except BaselineMismatch as e:
+            raise CommandError(f"{e} Re-record it with --update-baseline.")
+        if regressions:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
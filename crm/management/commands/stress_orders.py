@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmarks import stress_order_creation
+
+
+class Command(BaseCommand):
+    help = (
+        "Race worker processes creating orders against a few hot products; "
+        "fail if stock is oversold and report orders/sec."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4, help="Worker processes (default: 4).")
+        parser.add_argument("--attempts", type=int, default=100,
+                            help="Orders each worker tries to create (default: 100).")
+        parser.add_argument("--products", type=int, default=3,
+                            help="Hot products the orders draw from (default: 3).")
+        parser.add_argument("--stock", type=int, default=100,
+                            help="Starting stock of each hot product (default: 100).")
+        parser.add_argument("--readers", type=int, default=0,
+                            help="Extra processes reading the hot rows meanwhile (default: 0).")
+        parser.add_argument("--reads", type=int, default=200,
+                            help="Reads per reader process (default: 200).")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if min(options["processes"], options["attempts"], options["products"]) < 1:
+            raise CommandError("--processes, --attempts and --products must be at least 1.")
+        try:
+            result = stress_order_creation(
+                options["processes"], options["attempts"], options["products"],
+                options["stock"], options["seed"], options["readers"], options["reads"],
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"{result['attempts']} attempts from {result['processes']} processes in {result['seconds']:.2f} s: "
+            f"{result['created']} created, {result['rejected']} out of stock, {result['failed']} failed "
+            f"({result['busy_retries']} busy retries)"
+        )
+        self.stdout.write(
+            f"{result['orders_per_second']:.1f} orders/sec  p50 {result['p50_ms']:.2f} ms  "
+            f"p95 {result['p95_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms"
+        )
+        if "reads" in result:
+            self.stdout.write(
+                f"{result['reads']} reads from {options['readers']} readers: "
+                f"{result['reads_per_second']:.1f} reads/sec  p95 {result['read_p95_ms']:.2f} ms"
+            )
+        self.stdout.write("Sold per product: " + ", ".join(
+            f"{pk}: {count}/{options['stock']}" for pk, count in result["sold"].items()
+        ))
+        if result["oversold"] or result["lost_orders"]:
+            raise CommandError(
+                f"Stock accounting broken: oversold products {result['oversold']}, "
+                f"{result['lost_orders']} orders missing."
+            )
+        self.stdout.write(self.style.SUCCESS("No stock was oversold."))
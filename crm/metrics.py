@@ -0,0 +1,76 @@
+"""
+In-process metrics for the CRM GraphQL endpoint, in Prometheus text format.
+
+Counters and summaries live in this process only; with several workers,
+scrape each one (or put them behind a multiprocess-aware exporter).
+"""
+
+import threading
+from collections import defaultdict
+
+COUNTER = "counter"
+SUMMARY = "summary"
+
+METRICS = {
+    "crm_graphql_requests_total": (COUNTER, "GraphQL operations executed."),
+    "crm_graphql_request_duration_seconds": (SUMMARY, "Wall time per GraphQL operation."),
+    "crm_graphql_resolver_duration_seconds": (SUMMARY, "Wall time per resolver, by field."),
+    "crm_graphql_sql_queries_total": (COUNTER, "SQL queries issued, by resolver field."),
+    "crm_graphql_sql_duration_seconds_total": (COUNTER, "SQL time, by resolver field."),
+    "crm_graphql_n_plus_one_total": (COUNTER, "Repeated SQL shapes detected, by resolver field."),
+    "crm_response_cache_hits_total": (COUNTER, "Responses served from the response cache."),
+    "crm_response_cache_misses_total": (COUNTER, "Response cache lookups that missed."),
+    "crm_stock_busy_retries_total": (COUNTER, "Order writes retried after SQLite reported busy."),
+    "crm_audit_flushed_total": (COUNTER, "Audit events written to the AuditEvent table."),
+    "crm_audit_flush_errors_total": (COUNTER, "Audit buffer flushes that failed and were kept."),
+    "crm_audit_dropped_total": (COUNTER, "Audit events dropped because the buffer was full."),
+}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] += value
+
+    def observe(self, name, seconds, **labels):
+        self.inc(f"{name}_count", 1, **labels)
+        self.inc(f"{name}_sum", seconds, **labels)
+
+    def value(self, name, **labels):
+        return self._values.get((name, tuple(sorted(labels.items()))), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self, extra=()):
+        """Prometheus text exposition of every metric, plus ``extra`` (name, value) samples."""
+        with self._lock:
+            samples = sorted(self._values.items()) + [((name, ()), value) for name, value in extra]
+        lines = []
+        for metric, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            names = (f"{metric}_count", f"{metric}_sum") if kind == SUMMARY else (metric,)
+            for (name, labels), value in samples:
+                if name in names:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
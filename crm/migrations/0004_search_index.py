@@ -0,0 +1,38 @@
+from django.db import migrations
+
+FTS_TABLES = {
+    "crm_customer": ("name", "email"),
+    "crm_product": ("name",),
+}
+
+
+def create_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table, columns in FTS_TABLES.items():
+        cols = ", ".join(columns)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts "
+            f"USING fts5({cols}, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {table}_fts (rowid, {cols}) SELECT id, {cols} FROM {table}"
+        )
+
+
+def drop_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table in FTS_TABLES:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_tables, drop_fts_tables),
+    ]
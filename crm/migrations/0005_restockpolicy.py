@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestockPolicy',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='restock_policy', serialize=False, to='crm.product')),
+                ('threshold', models.PositiveIntegerField()),
+                ('increment', models.PositiveIntegerField()),
+            ],
+        ),
+    ]
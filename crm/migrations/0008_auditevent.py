@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:22
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_order_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('actor', models.CharField(max_length=150)),
+                ('action', models.CharField(max_length=64)),
+                ('target_type', models.CharField(max_length=64)),
+                ('target_id', models.CharField(blank=True, max_length=64)),
+                ('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at', 'id'], name='crm_audit_created_id_idx'), models.Index(fields=['target_type', 'target_id'], name='crm_audit_target_idx')],
+            },
+        ),
+    ]
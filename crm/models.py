@@ -1,7 +1,12 @@
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 class Customer(models.Model):
@@ -10,6 +15,14 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True) 
 
+    class Meta:
+        indexes = [
+            # Keyset pagination and created_at range filters.
+            models.Index(fields=["created_at", "id"], name="crm_customer_created_id_idx"),
+            # Prefix lookups from CustomerFilter.phone_pattern.
+            models.Index(fields=["phone"], name="crm_customer_phone_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -19,20 +32,163 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["price"], name="crm_product_price_idx"),
+            models.Index(fields=["stock"], name="crm_product_stock_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save handler skip order-total refreshes when the price is unchanged.
+        if "price" in field_names:
+            instance._loaded_price = instance.price
+        return instance
+
     def __str__(self):
         return self.name
 
 
+class RestockPolicy(models.Model):
+    """Per-product override of the low-stock threshold and restock increment."""
+
+    product = models.OneToOneField(
+        Product, primary_key=True, related_name="restock_policy", on_delete=models.CASCADE
+    )
+    threshold = models.PositiveIntegerField()
+    increment = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"Restock {self.product_id}: +{self.increment} below {self.threshold}"
+
+
+class OrderQuerySet(models.QuerySet):
+    def refresh_totals(self):
+        """
+        Recompute total_amount for these orders in one statement:
+        UPDATE crm_order SET total_amount = (SELECT SUM(price) ...) WHERE ...
+        """
+        totals = (
+            Order.products.through.objects.filter(order_id=OuterRef("pk"))
+            .values("order_id")
+            .annotate(total=Sum("product__price"))
+            .values("total")
+        )
+        amount = Order._meta.get_field("total_amount")
+        return self.update(
+            total_amount=Coalesce(
+                Subquery(totals, output_field=amount),
+                Value(Decimal("0")),
+                output_field=amount,
+            )
+        )
+
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, related_name="orders", on_delete=models.CASCADE)
     products = models.ManyToManyField(Product, related_name="orders")
     order_date = models.DateTimeField(default=timezone.now)
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Set on creation (crm.reminders); reminder_sent_at is stamped once when sent.
+    reminder_due_at = models.DateTimeField(null=True, blank=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination and order_date range filters.
+            models.Index(fields=["order_date", "id"], name="crm_order_date_id_idx"),
+            # The reminder sweep: only orders still waiting for their reminder.
+            models.Index(
+                fields=["reminder_due_at"],
+                condition=models.Q(reminder_sent_at__isnull=True),
+                name="crm_order_reminder_due_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the rollup handlers take a re-dated/re-assigned order out of its old buckets.
+        if {"order_date", "customer_id", "total_amount"} <= set(field_names):
+            instance._loaded_bucket = (
+                instance.order_date, instance.customer_id, instance.total_amount
+            )
+        return instance
 
     def calculate_total(self):
-        total = sum([p.price for p in self.products.all()])
+        total = self.products.aggregate(total=Sum("price"))["total"] or Decimal("0")
         self.total_amount = total
-        self.save()
+        self.save(update_fields=["total_amount"])
 
     def __str__(self):
         return f"Order #{self.id} - {self.customer.name}"
+
+
+class DailySalesRollup(models.Model):
+    """
+    Pre-aggregated sales per day. Each row is one of:
+
+    - a day total (customer and product both null)
+    - a (day, customer) bucket
+    - a (day, product) bucket, revenue being that product's share
+    """
+
+    day = models.DateField()
+    customer = models.ForeignKey(
+        Customer, null=True, blank=True, related_name="daily_sales", on_delete=models.CASCADE
+    )
+    product = models.ForeignKey(
+        Product, null=True, blank=True, related_name="daily_sales", on_delete=models.CASCADE
+    )
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day"],
+                condition=models.Q(customer__isnull=True, product__isnull=True),
+                name="crm_rollup_day_total_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["day", "customer"],
+                condition=models.Q(customer__isnull=False),
+                name="crm_rollup_day_customer_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["day", "product"],
+                condition=models.Q(product__isnull=False),
+                name="crm_rollup_day_product_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} customer={self.customer_id} product={self.product_id}: {self.revenue}"
+
+
+class AuditEvent(models.Model):
+    """
+    One mutation's change to one object. Rows are only ever inserted, in
+    batches, by crm.audit; ``changes`` maps field names to ``[old, new]``.
+    """
+
+    created_at = models.DateTimeField()
+    actor = models.CharField(max_length=150)
+    action = models.CharField(max_length=64)
+    target_type = models.CharField(max_length=64)
+    target_id = models.CharField(max_length=64, blank=True)
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination and created_at range filters.
+            models.Index(fields=["created_at", "id"], name="crm_audit_created_id_idx"),
+            # History of one object.
+            models.Index(fields=["target_type", "target_id"], name="crm_audit_target_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.created_at} {self.actor} {self.action} {self.target_type} {self.target_id}"
@@ -0,0 +1,157 @@
+"""
+Selection-set-aware queryset optimizer for the CRM schema.
+
+Walks the GraphQL selection of the field being resolved (fragments, inline
+fragments and @skip/@include included) and turns it into:
+
+- .only() with just the columns the client asked for
+- select_related() for forward foreign keys (Order.customer)
+- prefetch_related() with Prefetch querysets trimmed the same way for
+  many-to-many and reverse relations (Order.products, Customer.orders)
+
+Types opt in by subclassing ``OptimizedDjangoObjectType``; DjangoListField
+and connection fields call ``get_queryset`` for us. For connections the plan
+is built from the ``edges { node { ... } }`` selection.
+"""
+
+from django.db.models import Prefetch
+from graphene.relay import Connection
+from graphene.utils.str_converters import to_camel_case
+from graphene_django import DjangoObjectType
+from graphene_django.utils import maybe_queryset
+from graphql import get_named_type
+from graphql.execution.collect_fields import collect_sub_fields
+
+
+class QueryPlan:
+    """Columns and relations needed to satisfy one selection set."""
+
+    def __init__(self, model):
+        self.model = model
+        self.only = {model._meta.pk.name}
+        self.select_related = {}
+        self.prefetch_related = {}
+        self.restrict_columns = True
+
+    def apply(self, queryset):
+        """Apply this plan (and nested select_related plans) to ``queryset``."""
+        queryset = self._apply_relations(queryset, "")
+        only = self._collect_only()
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
+
+    def _apply_relations(self, queryset, prefix):
+        for name, plan in self.select_related.items():
+            queryset = queryset.select_related(prefix + name)
+            queryset = plan._apply_relations(queryset, prefix + name + "__")
+        for name, plan in self.prefetch_related.items():
+            related_qs = plan.apply(plan.model._default_manager.all())
+            queryset = queryset.prefetch_related(Prefetch(prefix + name, queryset=related_qs))
+        return queryset
+
+    def _collect_only(self, prefix=""):
+        if not self.restrict_columns:
+            return None
+        only = {prefix + column for column in self.only}
+        for name, plan in self.select_related.items():
+            nested = plan._collect_only(prefix + name + "__")
+            if nested is None:
+                return None
+            only |= nested
+        return only
+
+
+def _model_field_names(graphene_type):
+    """Map GraphQL field names of a graphene type to its python attribute names."""
+    names = {}
+    for attname, field in graphene_type._meta.fields.items():
+        names[getattr(field, "name", None) or to_camel_case(attname)] = attname
+    return names
+
+
+def build_plan(model, graphql_type, field_nodes, info):
+    """Build a ``QueryPlan`` for ``model`` from the sub-selection of ``field_nodes``."""
+    plan = QueryPlan(model)
+    graphene_type = getattr(graphql_type, "graphene_type", None)
+    if graphene_type is None or not hasattr(graphene_type._meta, "fields"):
+        plan.restrict_columns = False
+        return plan
+
+    names = _model_field_names(graphene_type)
+    selections = collect_sub_fields(
+        info.schema, info.fragments, info.variable_values, graphql_type, field_nodes
+    )
+    for nodes in selections.values():
+        gql_name = nodes[0].name.value
+        if gql_name.startswith("__"):
+            continue
+        attname = names.get(gql_name)
+        try:
+            model_field = model._meta.get_field(attname) if attname else None
+        except Exception:
+            model_field = None
+        if model_field is None:
+            # A computed field may read any column; don't defer anything.
+            plan.restrict_columns = False
+            continue
+
+        if not model_field.is_relation:
+            plan.only.add(model_field.attname)
+            continue
+
+        child_type = get_named_type(graphql_type.fields[gql_name].type)
+        child = build_plan(model_field.related_model, child_type, nodes, info)
+        if model_field.many_to_one or (model_field.one_to_one and model_field.concrete):
+            plan.only.add(model_field.name)
+            plan.select_related[model_field.name] = child
+        else:
+            if model_field.one_to_many:
+                # Reverse FK: the prefetch needs the FK column to match rows up.
+                child.only.add(model_field.field.attname)
+            plan.prefetch_related[model_field.name] = child
+    return plan
+
+
+def _sub_field_nodes(graphql_type, field_nodes, info, name):
+    """All nodes selecting ``name`` (under any alias) below ``field_nodes``."""
+    selections = collect_sub_fields(
+        info.schema, info.fragments, info.variable_values, graphql_type, field_nodes
+    )
+    return [
+        node
+        for nodes in selections.values()
+        for node in nodes
+        if node.name.value == name
+    ]
+
+
+def _unwrap_connection(graphql_type, field_nodes, info):
+    """Step from a Relay connection down through ``edges { node }``."""
+    edges = _sub_field_nodes(graphql_type, field_nodes, info, "edges")
+    edge_type = get_named_type(graphql_type.fields["edges"].type)
+    nodes = _sub_field_nodes(edge_type, edges, info, "node") if edges else []
+    return get_named_type(edge_type.fields["node"].type), nodes
+
+
+def optimize_queryset(queryset, info):
+    """Trim ``queryset`` to what the current GraphQL selection needs."""
+    queryset = maybe_queryset(queryset)
+    graphql_type = get_named_type(info.return_type)
+    field_nodes = info.field_nodes
+    graphene_type = getattr(graphql_type, "graphene_type", None)
+    if graphene_type is not None and issubclass(graphene_type, Connection):
+        graphql_type, field_nodes = _unwrap_connection(graphql_type, field_nodes, info)
+    plan = build_plan(queryset.model, graphql_type, field_nodes, info)
+    return plan.apply(queryset)
+
+
+class OptimizedDjangoObjectType(DjangoObjectType):
+    """DjangoObjectType whose querysets are optimized for the requested fields."""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return optimize_queryset(queryset, info)
@@ -0,0 +1,155 @@
+"""
+Keyset (seek) pagination for Relay connections.
+
+Cursors encode the ordering key of the last row seen, e.g. ``(order_date, id)``
+for orders, so the next page is fetched with
+
+    WHERE order_date >= x AND (order_date > x OR (order_date = x AND id > y))
+    ORDER BY order_date, id LIMIT n + 1
+
+instead of an OFFSET. Deep pages cost the same as the first one as long as
+the ordering columns are indexed.
+"""
+
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene_django import DjangoConnectionField
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.settings import graphene_settings
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+
+CURSOR_PREFIX = "keyset:"
+
+
+# --- Cursors ---
+def _cursor_value(value):
+    # Full precision: a truncated timestamp would no longer match its own row.
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(instance, ordering):
+    values = [getattr(instance, key) for key in ordering]
+    raw = CURSOR_PREFIX + json.dumps(values, default=_cursor_value)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        if not raw.startswith(CURSOR_PREFIX):
+            raise ValueError(cursor)
+        values = json.loads(raw[len(CURSOR_PREFIX):])
+        if len(values) != len(ordering):
+            raise ValueError(cursor)
+        return [
+            model._meta.get_field(key).to_python(value)
+            for key, value in zip(ordering, values)
+        ]
+    except Exception:
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+
+
+def seek_filter(ordering, values, lookup):
+    """Expand ``(k1, k2, ...) <lookup> (v1, v2, ...)`` into an index-friendly Q."""
+    condition = Q()
+    for i, key in enumerate(ordering):
+        term = Q(**{f"{key}__{lookup}": values[i]})
+        for prev_key, prev_value in zip(ordering[:i], values[:i]):
+            term &= Q(**{prev_key: prev_value})
+        condition |= term
+    # Redundant bound on the leading column lets the planner range-scan the index.
+    return Q(**{f"{ordering[0]}__{lookup}e": values[0]}) & condition
+
+
+def _ensure_loaded(queryset, ordering):
+    """Keep the ordering columns loaded if the optimizer restricted .only()."""
+    existing, defer = queryset.query.deferred_loading
+    if existing and not defer:
+        queryset = queryset.only(*existing, *ordering)
+    return queryset
+
+
+def get_ordering(node_type):
+    """Keyset ordering declared on the node type as ``pagination_ordering``."""
+    return tuple(getattr(node_type, "pagination_ordering", ("id",)))
+
+
+# --- Connection field ---
+class KeysetPaginationMixin:
+    """
+    Replaces DjangoConnectionField's offset slicing with keyset pagination.
+
+    The ordering comes from ``pagination_ordering`` on the node type and must
+    end with a unique column (normally ``id``) so cursors are unambiguous.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # DjangoConnectionField always adds `offset`; seeking has no use for it.
+        # DjangoFilterConnectionField keeps its own arguments in _base_args.
+        base_args = getattr(self, "_base_args", None)
+        if base_args is None:
+            base_args = self.args
+        base_args.pop("offset", None)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        ordering = get_ordering(connection._meta.node)
+        first = args.get("first")
+        last = args.get("last")
+        after = args.get("after")
+        before = args.get("before")
+
+        if first is not None and last is not None:
+            raise GraphQLError("Pass either `first` or `last`, not both.")
+        if (first is not None and first < 0) or (last is not None and last < 0):
+            raise GraphQLError("`first` and `last` must be non-negative.")
+        if first is None and last is None:
+            first = max_limit or graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+        queryset = _ensure_loaded(maybe_queryset(iterable), ordering)
+        model = queryset.model
+        if after:
+            queryset = queryset.filter(seek_filter(ordering, decode_cursor(after, model, ordering), "gt"))
+        if before:
+            queryset = queryset.filter(seek_filter(ordering, decode_cursor(before, model, ordering), "lt"))
+
+        if last is not None:
+            rows = list(queryset.order_by(*[f"-{key}" for key in ordering])[: last + 1])
+            has_previous_page = len(rows) > last
+            rows = rows[:last][::-1]
+            has_next_page = bool(before)
+        else:
+            rows = list(queryset.order_by(*ordering)[: first + 1])
+            has_next_page = len(rows) > first
+            rows = rows[:first]
+            has_previous_page = bool(after)
+
+        edges = [
+            connection.Edge(node=row, cursor=encode_cursor(row, ordering))
+            for row in rows
+        ]
+        return connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+
+
+class KeysetConnectionField(KeysetPaginationMixin, DjangoConnectionField):
+    pass
+
+
+class KeysetFilterConnectionField(KeysetPaginationMixin, DjangoFilterConnectionField):
+    pass
@@ -0,0 +1,160 @@
+"""
+Automatic Persisted Queries and the parsed-document cache for the CRM view.
+
+Clients send ``extensions.persistedQuery.sha256Hash`` instead of (or along
+with) the query text, following the Apollo APQ protocol:
+
+1. hash only, unknown          -> ``PersistedQueryNotFound`` error
+2. hash + query                -> hash is verified, query is remembered
+3. hash only, known            -> the remembered query runs
+
+Queries listed in the ``CRM_PERSISTED_QUERY_MANIFEST`` JSON file (a
+``{sha256: query}`` object or a list of queries) are always known; with
+``CRM_PERSISTED_QUERY_ALLOWLIST_ONLY`` nothing else is accepted.
+
+Independently of APQ, ``DocumentCache`` keeps the last
+``CRM_DOCUMENT_CACHE_SIZE`` parsed and validated documents, so a repeated
+query skips parse() and validate() entirely.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from graphql import GraphQLError
+
+DEFAULT_DOCUMENT_CACHE_SIZE = 256
+DEFAULT_PERSISTED_QUERY_CACHE_SIZE = 1024
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry past ``maxsize``."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PersistedQueries:
+    """Pinned manifest queries plus an LRU of queries registered through APQ."""
+
+    def __init__(self, manifest=None, allowlist_only=False, cache_size=DEFAULT_PERSISTED_QUERY_CACHE_SIZE):
+        self.manifest = dict(manifest or {})
+        self.allowlist_only = allowlist_only
+        self.registered = LRUCache(cache_size)
+
+    @classmethod
+    def from_settings(cls):
+        path = getattr(settings, "CRM_PERSISTED_QUERY_MANIFEST", None)
+        return cls(
+            manifest=load_manifest(path) if path else None,
+            allowlist_only=getattr(settings, "CRM_PERSISTED_QUERY_ALLOWLIST_ONLY", False),
+            cache_size=getattr(
+                settings, "CRM_PERSISTED_QUERY_CACHE_SIZE", DEFAULT_PERSISTED_QUERY_CACHE_SIZE
+            ),
+        )
+
+    def get(self, sha256):
+        return self.manifest.get(sha256) or self.registered.get(sha256)
+
+    def resolve(self, query, extensions):
+        """Return the query text to run for a request, raising GraphQLError if there is none."""
+        persisted = (extensions or {}).get("persistedQuery")
+        if not persisted:
+            if query and self.allowlist_only and query_hash(query) not in self.manifest:
+                raise GraphQLError("Query is not in the persisted query allowlist.")
+            return query
+
+        if not isinstance(persisted, dict):
+            raise GraphQLError("persistedQuery must be a JSON object.")
+        sha256 = persisted.get("sha256Hash")
+        if persisted.get("version", 1) != 1 or not sha256 or not isinstance(sha256, str):
+            raise GraphQLError("Unsupported persisted query.")
+        if not query:
+            query = self.get(sha256)
+            if query is None:
+                raise GraphQLError(
+                    PERSISTED_QUERY_NOT_FOUND, extensions={"code": "PERSISTED_QUERY_NOT_FOUND"}
+                )
+            return query
+
+        if query_hash(query) != sha256:
+            raise GraphQLError("Provided sha256Hash does not match query.")
+        if sha256 not in self.manifest:
+            if self.allowlist_only:
+                raise GraphQLError("Query is not in the persisted query allowlist.")
+            self.registered.set(sha256, query)
+        return query
+
+
+def load_manifest(path):
+    with open(path) as f:
+        entries = json.load(f)
+    if isinstance(entries, list):
+        return {query_hash(query): query for query in entries}
+    for sha256, query in entries.items():
+        if query_hash(query) != sha256:
+            raise ValueError(f"Manifest {path}: hash {sha256} does not match its query.")
+    return entries
+
+
+def parse_extensions(value):
+    # GET requests carry extensions as a JSON string.
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise GraphQLError("Extensions are invalid JSON.")
+    return value if isinstance(value, dict) else None
+
+
+class DocumentCache(LRUCache):
+    """LRU of validated DocumentNodes keyed on the query's sha256."""
+
+    @classmethod
+    def from_settings(cls):
+        return cls(getattr(settings, "CRM_DOCUMENT_CACHE_SIZE", DEFAULT_DOCUMENT_CACHE_SIZE))
+
+
+@lru_cache(maxsize=None)
+def get_persisted_queries():
+    return PersistedQueries.from_settings()
+
+
+@lru_cache(maxsize=None)
+def get_document_cache():
+    return DocumentCache.from_settings()
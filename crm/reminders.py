@@ -0,0 +1,134 @@
+"""
+Order reminders, sent once per order and batched per customer.
+
+Each new order gets ``reminder_due_at = order_date + CRM_ORDER_REMINDER_DELAY``
+(a pre_save handler in crm.signals, or bulk_create_orders). After the
+creating transaction commits, a ``send_order_reminders`` Celery task is
+queued for the customer with that time as its ETA. Once one of a
+customer's orders is due, the reminder also covers their other orders due
+within ``CRM_ORDER_REMINDER_BATCH_WINDOW``, so orders placed close together
+are announced together and the later tasks find nothing left to do. Nothing
+is sent for a customer before their earliest unsent order is due.
+
+Claiming stamps ``reminder_sent_at`` and commits before anything is
+delivered, so an order is reminded at most once however many tasks race for
+it or retry. The Celery Beat ``sweep_order_reminders`` task sends whatever a
+lost or never-queued task missed; it reads only the partial index on
+still-unsent orders instead of the order history.
+Orders without ``reminder_due_at`` (created before reminders existed, or
+generated data) are never reminded.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+REMINDER_LOG_FILE = "/tmp/order_reminders_log.txt"
+DEFAULT_DELAY = 24 * 60 * 60
+DEFAULT_BATCH_WINDOW = 60 * 60
+CLAIM_CHUNK_SIZE = 500
+
+
+def get_delay():
+    return timedelta(seconds=getattr(settings, "CRM_ORDER_REMINDER_DELAY", DEFAULT_DELAY))
+
+
+def get_batch_window():
+    return timedelta(
+        seconds=getattr(settings, "CRM_ORDER_REMINDER_BATCH_WINDOW", DEFAULT_BATCH_WINDOW)
+    )
+
+
+def reminder_due_for(order_date):
+    return order_date + get_delay()
+
+
+def pending_reminders(until):
+    """Unsent reminders due at or before ``until`` (served by crm_order_reminder_due_idx)."""
+    return Order.objects.filter(reminder_sent_at__isnull=True, reminder_due_at__lte=until)
+
+
+# --- Queueing ---
+def queue_reminders(orders):
+    """
+    Queue one reminder task per (customer, due time) of ``orders`` once the
+    current transaction commits. A no-op unless CRM_ORDER_REMINDER_QUEUE is on;
+    the sweep covers anything not queued.
+    """
+    if not getattr(settings, "CRM_ORDER_REMINDER_QUEUE", False):
+        return
+    jobs = {
+        (order.customer_id, order.reminder_due_at)
+        for order in orders
+        if order.reminder_due_at is not None and order.reminder_sent_at is None
+    }
+    for customer_id, due in jobs:
+        transaction.on_commit(lambda customer_id=customer_id, due=due: _enqueue(customer_id, due))
+
+
+def _enqueue(customer_id, due):
+    from .tasks import send_order_reminders
+
+    try:
+        send_order_reminders.apply_async((customer_id, due.isoformat()), eta=due, retry=False)
+    except Exception:
+        # The order is saved; the next sweep sends its reminder instead.
+        logger.warning("Could not queue the reminder for customer %s", customer_id, exc_info=True)
+
+
+# --- Sending ---
+def deliver(email, order_ids, now):
+    """Send one reminder covering ``order_ids`` (appended to REMINDER_LOG_FILE)."""
+    ids = ", ".join(str(pk) for pk in order_ids)
+    with open(REMINDER_LOG_FILE, "a") as f:
+        f.write(f"{now.isoformat()} - Reminder to {email} - Orders {ids}\n")
+
+
+def send_due_reminders(customer_id=None, now=None):
+    """
+    Send one reminder per customer with an order due by ``now``, covering
+    their orders due within the batch window; limited to ``customer_id``
+    when given. Returns the number of orders reminded.
+    """
+    now = now or timezone.now()
+    due = pending_reminders(now)
+    orders = pending_reminders(now + get_batch_window())
+    if customer_id is not None:
+        due = due.filter(customer_id=customer_id)
+        orders = orders.filter(customer_id=customer_id)
+    orders = orders.filter(customer_id__in=due.values("customer_id"))
+
+    with transaction.atomic():
+        # Concurrent senders skip each other's rows (where the database supports
+        # row locks) and the reminder_sent_at guard makes every claim one-shot.
+        claimed = list(
+            orders.select_for_update(skip_locked=True, of=("self",))
+            .order_by("customer_id", "pk")
+            .values_list("pk", "customer_id", "customer__email")
+        )
+        if not claimed:
+            return 0
+        pks = [pk for pk, _, _ in claimed]
+        for start in range(0, len(pks), CLAIM_CHUNK_SIZE):
+            Order.objects.filter(
+                pk__in=pks[start:start + CLAIM_CHUNK_SIZE], reminder_sent_at__isnull=True
+            ).update(reminder_sent_at=now)
+
+    # Delivered only once the claim is committed, so a retry can't send twice.
+    batches = defaultdict(list)
+    for pk, _, email in claimed:
+        batches[email].append(pk)
+    for email, order_ids in batches.items():
+        try:
+            deliver(email, order_ids, now)
+        except Exception:
+            logger.exception("Could not deliver the reminder for orders %s to %s", order_ids, email)
+    return len(claimed)
@@ -0,0 +1,97 @@
+"""
+Server-side reporting aggregates for the CRM.
+
+crm_stats() answers "how many customers, how many orders, how much revenue"
+with one aggregate statement instead of shipping every order to the caller,
+optionally restricted to an order_date range and broken down by day, week
+or customer.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Count, F, IntegerField, Max, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncWeek
+
+from .models import Customer, Order
+
+GROUP_BY_DAY = "day"
+GROUP_BY_WEEK = "week"
+GROUP_BY_CUSTOMER = "customer"
+
+GROUP_KEYS = {
+    GROUP_BY_DAY: TruncDay("order_date"),
+    GROUP_BY_WEEK: TruncWeek("order_date"),
+}
+
+
+class SubqueryCount(Subquery):
+    """``(SELECT COUNT(*) FROM (<queryset>))`` usable as a scalar expression."""
+
+    template = "(SELECT COUNT(*) FROM (%(subquery)s) _count)"
+    output_field = IntegerField()
+
+
+def _in_range(queryset, field, date_from, date_to):
+    if date_from is not None:
+        queryset = queryset.filter(**{f"{field}__gte": date_from})
+    if date_to is not None:
+        queryset = queryset.filter(**{f"{field}__lt": date_to})
+    return queryset
+
+
+def _money(value):
+    # SQLite hands SUM() back without the column's scale.
+    return Decimal(value).quantize(Decimal("0.01"))
+
+
+def _revenue():
+    amount = Order._meta.get_field("total_amount")
+    return Coalesce(Sum("total_amount"), Value(Decimal("0")), output_field=amount)
+
+
+def crm_stats(date_from=None, date_to=None, group_by=None):
+    """
+    Return ``{"customer_count", "order_count", "revenue", "groups"}``.
+
+    Orders are counted by order_date in ``[date_from, date_to)`` and customers
+    by created_at over the same range. ``groups`` is empty unless ``group_by``
+    is one of ``day``, ``week`` or ``customer``.
+    """
+    orders = _in_range(Order.objects.order_by(), "order_date", date_from, date_to)
+    customers = _in_range(Customer.objects.order_by(), "created_at", date_from, date_to)
+    customer_count = SubqueryCount(customers.values("pk"))
+
+    # MAX() keeps the uncorrelated customer count inside the single aggregate
+    # statement; the COALESCE fallback covers a range without any orders.
+    stats = orders.aggregate(
+        order_count=Count("pk"),
+        revenue=_revenue(),
+        customer_count=Coalesce(Max(customer_count), customer_count),
+    )
+    stats["revenue"] = _money(stats["revenue"])
+    stats["groups"] = crm_stats_groups(orders, group_by) if group_by else []
+    return stats
+
+
+def crm_stats_groups(orders, group_by):
+    """Per-day, per-week or per-customer breakdown of ``orders``."""
+    if group_by == GROUP_BY_CUSTOMER:
+        key = F("customer_id")
+    elif group_by in GROUP_KEYS:
+        key = GROUP_KEYS[group_by]
+    else:
+        raise ValueError(f"Unknown group_by: {group_by}")
+
+    rows = orders.values(key=key).annotate(
+        order_count=Count("pk"),
+        revenue=_revenue(),
+        customer_count=Count("customer_id", distinct=True),
+    )
+    return [
+        {
+            **row,
+            "key": row["key"].isoformat() if hasattr(row["key"], "isoformat") else str(row["key"]),
+            "revenue": _money(row["revenue"]),
+        }
+        for row in rows.order_by("key")
+    ]
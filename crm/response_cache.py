@@ -0,0 +1,205 @@
+"""
+Response cache for read-only GraphQL operations.
+
+A cached response is keyed on the normalized document (``print_ast`` of the
+parsed query), the operation name, the variables and the user, plus the
+current *version tag* of every model the operation can read. Writes bump
+those tags (crm.signals for ORM saves/deletes/M2M changes, ``invalidate()``
+for code that bypasses signals such as bulk_create or queryset.update()), so
+a stale entry is never looked up again; it simply ages out of the cache.
+
+Version tags are random tokens rather than counters, so an evicted tag can't
+come back with an old value and resurrect stale entries.
+
+The models an operation depends on come from the object types its selection
+reaches; root fields that aggregate behind a plain ObjectType declare theirs
+in ``ROOT_FIELD_DEPENDENCIES``. Operations with an unknown dependency are not
+cached.
+"""
+
+import hashlib
+import json
+import threading
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, get_named_type, print_ast, visit
+
+from .models import Customer, DailySalesRollup, Order, Product
+from .persisted import LRUCache
+
+DEFAULT_TIMEOUT = 60
+KEY_PREFIX = "crm:response"
+
+# Writes to the key model also change what queries over these models return
+# (order totals follow product prices, rollups follow orders).
+INVALIDATES = {
+    Customer: (Customer,),
+    Product: (Product, Order, DailySalesRollup),
+    Order: (Order, DailySalesRollup),
+    DailySalesRollup: (DailySalesRollup,),
+}
+
+# Orders are filtered by customer and product names, not just their own columns.
+MODEL_DEPENDENCIES = {
+    Order: (Order, Customer, Product),
+}
+
+ROOT_FIELD_DEPENDENCIES = {
+    "crmStats": (Customer, Order),
+}
+
+# Results that change with the clock rather than with writes, and the audit
+# log, which is written behind the mutations rather than by them.
+UNCACHEABLE_ROOT_FIELDS = {"recentOrders", "auditEvents"}
+
+
+def _tag_key(model):
+    return f"{KEY_PREFIX}:version:{model._meta.label_lower}"
+
+
+class _DependencyCollector(Visitor):
+    def __init__(self, schema, type_info):
+        super().__init__()
+        self.query_type = schema.query_type
+        self.type_info = type_info
+        self.models = set()
+        self.cacheable = True
+
+    def enter_field(self, node, *args):
+        name = node.name.value
+        is_root = self.type_info.get_parent_type() is self.query_type
+        if is_root and name in UNCACHEABLE_ROOT_FIELDS:
+            self.cacheable = False
+        elif is_root and name in ROOT_FIELD_DEPENDENCIES:
+            self.models.update(ROOT_FIELD_DEPENDENCIES[name])
+            return
+        model = _model_of(get_named_type(self.type_info.get_type()))
+        if model is not None:
+            self.models.update(MODEL_DEPENDENCIES.get(model, (model,)))
+        elif is_root and not name.startswith("__"):
+            self.cacheable = False
+
+
+def _model_of(named_type):
+    meta = getattr(getattr(named_type, "graphene_type", None), "_meta", None)
+    # Connections expose their model through the node type.
+    node = getattr(meta, "node", None)
+    if node is not None:
+        meta = node._meta
+    return getattr(meta, "model", None)
+
+
+def collect_dependencies(schema, document):
+    """Models ``document`` can read, or ``None`` if that can't be determined."""
+    type_info = TypeInfo(schema)
+    collector = _DependencyCollector(schema, type_info)
+    visit(document, TypeInfoVisitor(type_info, collector))
+    if not collector.cacheable or not collector.models:
+        return None
+    return frozenset(collector.models)
+
+
+class ResponseCache:
+    """Versioned read-through cache for query results, with hit/miss counters."""
+
+    def __init__(self, alias="default", timeout=DEFAULT_TIMEOUT, plan_cache_size=256):
+        self.alias = alias
+        self.timeout = timeout
+        self._plans = LRUCache(plan_cache_size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            alias=getattr(settings, "CRM_RESPONSE_CACHE_ALIAS", "default"),
+            timeout=getattr(settings, "CRM_RESPONSE_CACHE_TIMEOUT", DEFAULT_TIMEOUT),
+        )
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    # --- Versions ---
+    def invalidate(self, *models):
+        tags = {
+            _tag_key(target): uuid.uuid4().hex
+            for model in models
+            for target in INVALIDATES.get(model, (model,))
+        }
+        self.cache.set_many(tags, timeout=None)
+
+    def _versions(self, models):
+        keys = sorted(_tag_key(model) for model in models)
+        versions = self.cache.get_many(keys)
+        missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+        if missing:
+            self.cache.set_many(missing, timeout=None)
+            versions.update(missing)
+        return [versions[key] for key in keys]
+
+    # --- Entries ---
+    def plan(self, schema, document, document_key):
+        """``(normalized_hash, dependencies)`` for a document, computed once."""
+        plan = self._plans.get(document_key)
+        if plan is None:
+            normalized = hashlib.sha256(print_ast(document).encode("utf-8")).hexdigest()
+            plan = (normalized, collect_dependencies(schema, document))
+            self._plans.set(document_key, plan)
+        return plan
+
+    def key(self, normalized, dependencies, operation_name, variables, user_key):
+        payload = json.dumps(
+            [normalized, operation_name, variables or {}, user_key, self._versions(dependencies)],
+            sort_keys=True,
+            default=str,
+        )
+        return f"{KEY_PREFIX}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key):
+        data = self.cache.get(key)
+        self._count(data is not None)
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, timeout=self.timeout)
+
+
+def user_cache_key(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return "anonymous"
+
+
+@lru_cache(maxsize=None)
+def get_response_cache():
+    return ResponseCache.from_settings()
+
+
+def response_cache_enabled():
+    return getattr(settings, "CRM_RESPONSE_CACHE_ENABLED", True)
+
+
+def invalidate(*models):
+    """Bump the version tags of ``models``; call after writes that skip signals."""
+    response_cache = get_response_cache()
+    response_cache.invalidate(*models)
+    # Bump again at commit: a reader may have cached the pre-commit rows
+    # under the first new tag in the meantime.
+    transaction.on_commit(lambda: response_cache.invalidate(*models))
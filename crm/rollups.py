@@ -0,0 +1,308 @@
+"""
+Maintenance of the DailySalesRollup table.
+
+Writes keep the rollups current incrementally. apply_deltas() adds signed
+``(order_count, revenue)`` deltas to the day, (day, customer) and
+(day, product) rows with one upsert per dimension:
+
+    INSERT INTO crm_dailysalesrollup (day, customer_id, product_id, order_count, revenue)
+    VALUES (...), (...)
+    ON CONFLICT (day, customer_id) WHERE customer_id IS NOT NULL
+    DO UPDATE SET order_count = order_count + excluded.order_count,
+                  revenue = revenue + excluded.revenue
+
+so a new order costs a couple of indexed row writes whatever the day's
+volume, and concurrent writers can't lose each other's increments. Deltas
+that only take orders or revenue away adjust existing rows with one
+UPDATE ... SET order_count = order_count + CASE ... END instead. The
+signal handlers (crm.signals) derive the deltas from the order or links
+being written (order_deltas()/link_deltas()); code that bypasses signals
+(bulk_create) must apply them itself. Backends without conflict targets
+update with F() expressions and insert the missing rows.
+
+refresh_rollups() recomputes the buckets of a day range from the raw orders
+with three GROUP BY queries and swaps them in with one delete and one bulk
+insert. It is the repair path: the backfill_sales_rollups task runs it over
+arbitrary ranges in chunks, and writes that reprice many orders at once
+(a product's price changing or the product being deleted) recompute the
+buckets of those orders with refresh_for_orders().
+"""
+
+import operator
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import reduce
+
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySalesRollup, Order
+from .response_cache import invalidate
+
+DIMENSION_DAY = "day"
+DIMENSION_CUSTOMER = "customer"
+DIMENSION_PRODUCT = "product"
+
+
+def day_of(moment):
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return timezone.localtime(moment).date()
+
+
+def _bounds(date_from, date_to):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(date_from, time.min), tz),
+        timezone.make_aware(datetime.combine(date_to, time.min), tz),
+    )
+
+
+def refresh_rollups(date_from, date_to, customer_ids=None, product_ids=None):
+    """
+    Recompute rollups for days in ``[date_from, date_to)``.
+
+    Day totals are always rebuilt. ``customer_ids``/``product_ids`` limit
+    which per-customer/per-product buckets are rebuilt: ``None`` means all,
+    an empty collection means none.
+    """
+    start, end = _bounds(date_from, date_to)
+    orders = Order.objects.order_by().filter(order_date__gte=start, order_date__lt=end)
+    links = Order.products.through.objects.order_by().filter(
+        order__order_date__gte=start, order__order_date__lt=end
+    )
+    existing = DailySalesRollup.objects.filter(day__gte=date_from, day__lt=date_to)
+
+    stale = [existing.filter(customer__isnull=True, product__isnull=True)]
+    rows = [
+        DailySalesRollup(day=row["day"], order_count=row["order_count"], revenue=row["revenue"])
+        for row in orders.annotate(day=TruncDate("order_date")).values("day").annotate(
+            order_count=Count("pk"), revenue=Sum("total_amount")
+        )
+    ]
+
+    if customer_ids is None or customer_ids:
+        by_customer = orders
+        stale_customers = existing.filter(customer__isnull=False)
+        if customer_ids is not None:
+            by_customer = by_customer.filter(customer_id__in=customer_ids)
+            stale_customers = stale_customers.filter(customer_id__in=customer_ids)
+        stale.append(stale_customers)
+        rows += [
+            DailySalesRollup(customer_id=row["customer_id"], day=row["day"],
+                             order_count=row["order_count"], revenue=row["revenue"])
+            for row in by_customer.annotate(day=TruncDate("order_date"))
+            .values("day", "customer_id")
+            .annotate(order_count=Count("pk"), revenue=Sum("total_amount"))
+        ]
+
+    if product_ids is None or product_ids:
+        by_product = links
+        stale_products = existing.filter(product__isnull=False)
+        if product_ids is not None:
+            by_product = by_product.filter(product_id__in=product_ids)
+            stale_products = stale_products.filter(product_id__in=product_ids)
+        stale.append(stale_products)
+        rows += [
+            DailySalesRollup(product_id=row["product_id"], day=row["day"],
+                             order_count=row["order_count"], revenue=row["revenue"])
+            for row in by_product.annotate(day=TruncDate("order__order_date"))
+            .values("day", "product_id")
+            .annotate(order_count=Count("order_id"), revenue=Sum("product__price"))
+        ]
+
+    with transaction.atomic():
+        for queryset in stale:
+            queryset.delete()
+        DailySalesRollup.objects.bulk_create(rows)
+    invalidate(DailySalesRollup)
+    return len(rows)
+
+
+def refresh_for_buckets(buckets):
+    """
+    Recompute the buckets touched by some orders.
+
+    ``buckets`` is an iterable of ``(day, customer_id, product_ids)``.
+    """
+    by_day = defaultdict(lambda: (set(), set()))
+    for day, customer_id, product_ids in buckets:
+        customers, products = by_day[day]
+        if customer_id is not None:
+            customers.add(customer_id)
+        products.update(product_ids)
+    for day, (customers, products) in by_day.items():
+        refresh_rollups(day, day + timedelta(days=1), customer_ids=customers, product_ids=products)
+
+
+def buckets_for_orders(orders):
+    """``(day, customer_id, product_ids)`` for saved orders, with one link query."""
+    orders = list(orders)
+    products = defaultdict(set)
+    links = Order.products.through.objects.filter(order_id__in=[o.pk for o in orders])
+    for order_id, product_id in links.values_list("order_id", "product_id"):
+        products[order_id].add(product_id)
+    return [(day_of(o.order_date), o.customer_id, products[o.pk]) for o in orders]
+
+
+def refresh_for_orders(orders):
+    refresh_for_buckets(buckets_for_orders(orders))
+
+
+# --- Incremental updates ---
+# Each dimension's rows and the partial unique index they upsert on.
+_CONFLICT_TARGETS = (
+    (lambda key: key[1] is None and key[2] is None,
+     "(day) WHERE customer_id IS NULL AND product_id IS NULL"),
+    (lambda key: key[1] is not None,
+     "(day, customer_id) WHERE customer_id IS NOT NULL"),
+    (lambda key: key[2] is not None,
+     "(day, product_id) WHERE product_id IS NOT NULL"),
+)
+
+
+def order_deltas(day, customer_id, total, prices, sign=1):
+    """
+    Deltas for adding (``sign=1``) or removing (``sign=-1``) a whole order.
+
+    ``prices`` maps the order's product ids to their prices. Yields
+    ``((day, customer_id, product_id), order_count, revenue)``.
+    """
+    yield (day, None, None), sign, sign * total
+    yield (day, customer_id, None), sign, sign * total
+    for product_id, price in prices.items():
+        yield (day, None, product_id), sign, sign * price
+
+
+def link_deltas(links, sign=1):
+    """
+    Deltas for adding or removing products of existing orders.
+
+    ``links`` holds ``(day, customer_id, product_id, price)``; the order's
+    revenue moves by the price while its count stays the same.
+    """
+    for day, customer_id, product_id, price in links:
+        yield (day, None, None), 0, sign * price
+        yield (day, customer_id, None), 0, sign * price
+        yield (day, None, product_id), sign, sign * price
+
+
+def apply_deltas(deltas):
+    """
+    Add ``(key, order_count, revenue)`` deltas to their rollup rows.
+
+    Deltas that add orders upsert their rows; the rest only adjust rows that
+    exist, in one UPDATE, and rows left without orders are deleted as a
+    recompute would leave them out.
+    """
+    merged = defaultdict(lambda: [0, Decimal("0")])
+    for key, order_count, revenue in deltas:
+        merged[key][0] += order_count
+        merged[key][1] += revenue
+    inserts = {key: delta for key, delta in merged.items() if delta[0] > 0}
+    updates = {key: delta for key, delta in merged.items()
+               if key not in inserts and (delta[0] or delta[1])}
+    if not inserts and not updates:
+        return 0
+
+    using = router.db_for_write(DailySalesRollup)
+    connection = connections[using]
+    rollups = DailySalesRollup.objects.using(using)
+    with transaction.atomic(using=using):
+        if connection.features.supports_update_conflicts_with_target:
+            for matches, target in _CONFLICT_TARGETS:
+                rows = [(key, delta) for key, delta in inserts.items() if matches(key)]
+                if rows:
+                    _upsert(connection, target, rows)
+        else:
+            for (day, customer_id, product_id), (order_count, revenue) in inserts.items():
+                bucket = rollups.filter(day=day, customer_id=customer_id, product_id=product_id)
+                if not bucket.update(order_count=F("order_count") + order_count,
+                                     revenue=F("revenue") + revenue):
+                    bucket.create(day=day, customer_id=customer_id, product_id=product_id,
+                                  order_count=order_count, revenue=revenue)
+        if updates:
+            buckets = {key: Q(day=key[0], customer_id=key[1], product_id=key[2]) for key in updates}
+            counts = [When(buckets[key], then=Value(n)) for key, (n, _) in updates.items()]
+            amounts = [When(buckets[key], then=Value(amount)) for key, (_, amount) in updates.items()]
+            rollups.filter(reduce(operator.or_, buckets.values())).update(
+                order_count=F("order_count") + Case(*counts, output_field=IntegerField()),
+                revenue=F("revenue") + Case(
+                    *amounts, output_field=DailySalesRollup._meta.get_field("revenue")
+                ),
+            )
+            if any(order_count < 0 for order_count, _ in updates.values()):
+                rollups.filter(day__in={day for day, _, _ in updates}, order_count=0).delete()
+    invalidate(DailySalesRollup)
+    return len(inserts) + len(updates)
+
+
+def _upsert(connection, target, rows):
+    qn = connection.ops.quote_name
+    table = qn(DailySalesRollup._meta.db_table)
+    revenue_field = DailySalesRollup._meta.get_field("revenue")
+    columns = ", ".join(qn(column) for column in
+                        ("day", "customer_id", "product_id", "order_count", "revenue"))
+    params = []
+    for (day, customer_id, product_id), (order_count, revenue) in rows:
+        params += [
+            connection.ops.adapt_datefield_value(day), customer_id, product_id, order_count,
+            connection.ops.adapt_decimalfield_value(
+                revenue, revenue_field.max_digits, revenue_field.decimal_places
+            ),
+        ]
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    count, revenue = qn("order_count"), qn("revenue")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) VALUES {values} ON CONFLICT {target} "
+            f"DO UPDATE SET {count} = {table}.{count} + excluded.{count}, "
+            f"{revenue} = {table}.{revenue} + excluded.{revenue}",
+            params,
+        )
+
+
+# --- Reads ---
+def rollups_queryset(date_from, date_to, dimension=DIMENSION_DAY, customer_id=None, product_id=None):
+    """Rollup rows of one dimension for days in ``[date_from, date_to)``."""
+    queryset = DailySalesRollup.objects.filter(day__gte=date_from, day__lt=date_to)
+    if dimension == DIMENSION_DAY:
+        queryset = queryset.filter(customer__isnull=True, product__isnull=True)
+    elif dimension == DIMENSION_CUSTOMER:
+        queryset = queryset.filter(customer__isnull=False)
+    elif dimension == DIMENSION_PRODUCT:
+        queryset = queryset.filter(product__isnull=False)
+    else:
+        raise ValueError(f"Unknown dimension: {dimension}")
+    if customer_id is not None:
+        queryset = queryset.filter(customer_id=customer_id)
+    if product_id is not None:
+        queryset = queryset.filter(product_id=product_id)
+    return queryset.order_by("day", "customer_id", "product_id")
+
+
+# --- Backfill ---
+def backfill_rollups(date_from=None, date_to=None, chunk_days=31):
+    """
+    Rebuild every bucket in ``[date_from, date_to)``, ``chunk_days`` at a time.
+
+    Defaults to the whole order history. Returns the number of rows written.
+    """
+    if date_from is None or date_to is None:
+        first = Order.objects.order_by("order_date").values_list("order_date", flat=True).first()
+        last = Order.objects.order_by("-order_date").values_list("order_date", flat=True).first()
+        if first is None:
+            return 0
+        date_from = date_from or day_of(first)
+        date_to = date_to or day_of(last) + timedelta(days=1)
+
+    written = 0
+    start = date_from
+    while start < date_to:
+        end = min(start + timedelta(days=chunk_days), date_to)
+        written += refresh_rollups(start, end)
+        start = end
+    return written
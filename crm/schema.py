@@ -1,45 +1,237 @@
+from datetime import timedelta
+
 import graphene
-from graphene_django.types import DjangoObjectType
-from .models import Customer, Product, Order
+from django.utils import timezone
+from graphene_django import DjangoListField
+from graphql import GraphQLError
+from graphene_django.utils import bypass_get_queryset
+from django.conf import settings
+from .models import AuditEvent, Customer, Product, Order, DailySalesRollup
+from . import audit
+from .loaders import get_loaders
+from .optimizer import OptimizedDjangoObjectType
+from .bulk import bulk_create_customers, bulk_create_orders, create_order
+from .inventory import restock_low_stock
+from .filters import AuditEventFilter, CustomerFilter, ProductFilter, OrderFilter
+from .pagination import KeysetFilterConnectionField
+from .reports import crm_stats, GROUP_BY_CUSTOMER, GROUP_BY_DAY, GROUP_BY_WEEK
+from .rollups import rollups_queryset, DIMENSION_CUSTOMER, DIMENSION_DAY, DIMENSION_PRODUCT
+from .search import search_queryset
 from crm.models import Product
 
 
 # ---------------- Types ----------------
-class CustomerType(DjangoObjectType):
+def _prefetched(root, name):
+    """Return the related objects if the optimizer already prefetched them."""
+    cache = getattr(root, "_prefetched_objects_cache", {})
+    if name in cache:
+        return list(cache[name])
+    return None
+
+
+class CustomerType(OptimizedDjangoObjectType):
     class Meta:
         model = Customer
-        fields = ("id", "name", "email")
+        fields = ("id", "name", "email", "orders")
+        use_connection = True
+
+    # Declared explicitly so the reverse relation stays a list, not a connection.
+    orders = DjangoListField(lambda: OrderType, required=True)
 
+    pagination_ordering = ("created_at", "id")
 
-class ProductType(DjangoObjectType):
+    def resolve_orders(root, info, **kwargs):
+        prefetched = _prefetched(root, "orders")
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).orders_by_customer.load(root.pk)
+
+
+class ProductType(OptimizedDjangoObjectType):
     class Meta:
         model = Product
-        fields = ("id", "name", "price", "stock")
+        fields = ("id", "name", "price", "stock", "orders")
+        use_connection = True
+
+    orders = DjangoListField(lambda: OrderType, required=True)
 
+    pagination_ordering = ("id",)
 
-class OrderType(DjangoObjectType):
+    def resolve_orders(root, info, **kwargs):
+        prefetched = _prefetched(root, "orders")
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).orders_by_product.load(root.pk)
+
+
+class OrderType(OptimizedDjangoObjectType):
     class Meta:
         model = Order
         fields = ("id", "order_date", "customer", "products", "total_amount")
+        use_connection = True
 
+    products = DjangoListField(ProductType, required=True)
 
-# ---------------- Queries ----------------
-class Query(graphene.ObjectType):
-    customers = graphene.List(CustomerType)
-    products = graphene.List(ProductType)
-    orders = graphene.List(OrderType)
+    pagination_ordering = ("order_date", "id")
 
-    def resolve_customers(root, info, **kwargs):
-        return Customer.objects.all()
+    @bypass_get_queryset
+    def resolve_customer(root, info, **kwargs):
+        if Order.customer.is_cached(root):
+            return root.customer
+        return get_loaders(info).customer_by_id.load(root.customer_id)
 
     def resolve_products(root, info, **kwargs):
-        return Product.objects.all()
+        prefetched = _prefetched(root, "products")
+        if prefetched is not None:
+            return prefetched
+        return get_loaders(info).products_by_order.load(root.pk)
 
-    def resolve_orders(root, info, **kwargs):
-        return Order.objects.all()
+
+# ---------------- Reporting ----------------
+class StatsGroupBy(graphene.Enum):
+    DAY = GROUP_BY_DAY
+    WEEK = GROUP_BY_WEEK
+    CUSTOMER = GROUP_BY_CUSTOMER
+
+
+class CRMStatsGroupType(graphene.ObjectType):
+    key = graphene.String()
+    order_count = graphene.Int()
+    customer_count = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+class CRMStatsType(graphene.ObjectType):
+    customer_count = graphene.Int()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+    groups = graphene.List(CRMStatsGroupType)
+
+
+class RollupDimension(graphene.Enum):
+    DAY = DIMENSION_DAY
+    CUSTOMER = DIMENSION_CUSTOMER
+    PRODUCT = DIMENSION_PRODUCT
+
+
+class DailySalesRollupType(OptimizedDjangoObjectType):
+    class Meta:
+        model = DailySalesRollup
+        fields = ("day", "customer", "product", "order_count", "revenue")
+
+    @bypass_get_queryset
+    def resolve_customer(root, info, **kwargs):
+        if root.customer_id is None:
+            return None
+        if DailySalesRollup.customer.is_cached(root):
+            return root.customer
+        return get_loaders(info).customer_by_id.load(root.customer_id)
+
+    @bypass_get_queryset
+    def resolve_product(root, info, **kwargs):
+        if root.product_id is None:
+            return None
+        if DailySalesRollup.product.is_cached(root):
+            return root.product
+        return get_loaders(info).product_by_id.load(root.product_id)
+
+
+class AuditEventType(OptimizedDjangoObjectType):
+    class Meta:
+        model = AuditEvent
+        fields = ("id", "created_at", "actor", "action", "target_type", "target_id", "changes")
+        use_connection = True
+
+    # Newest last: the append-only table is read in insertion order.
+    pagination_ordering = ("created_at", "id")
+
+
+# ---------------- Queries ----------------
+class Query(graphene.ObjectType):
+    customers = DjangoListField(CustomerType, search=graphene.String())
+    products = DjangoListField(ProductType, search=graphene.String())
+    orders = DjangoListField(OrderType, search=graphene.String())
+    # Orders placed in the last `days` days, served from the order_date index.
+    recent_orders = DjangoListField(OrderType, days=graphene.Int(default_value=7))
+
+    # Filterable, keyset-paginated connections; prefer these over the plain lists.
+    all_customers = KeysetFilterConnectionField(CustomerType, filterset_class=CustomerFilter)
+    all_products = KeysetFilterConnectionField(ProductType, filterset_class=ProductFilter)
+    all_orders = KeysetFilterConnectionField(OrderType, filterset_class=OrderFilter)
+    # Mutation audit log (crm.audit); staff only unless CRM_AUDIT_STAFF_ONLY is off.
+    audit_events = KeysetFilterConnectionField(AuditEventType, filterset_class=AuditEventFilter)
+
+    crm_stats = graphene.Field(
+        CRMStatsType,
+        date_from=graphene.DateTime(),
+        date_to=graphene.DateTime(),
+        group_by=StatsGroupBy(),
+    )
+
+    # Reads the pre-aggregated DailySalesRollup table; dateTo is exclusive.
+    sales_rollups = DjangoListField(
+        DailySalesRollupType,
+        date_from=graphene.Date(required=True),
+        date_to=graphene.Date(required=True),
+        dimension=RollupDimension(),
+        customer_id=graphene.ID(),
+        product_id=graphene.ID(),
+    )
+
+    def resolve_customers(root, info, search=None, **kwargs):
+        return search_queryset(Customer.objects.all(), search)
+
+    def resolve_products(root, info, search=None, **kwargs):
+        return search_queryset(Product.objects.all(), search)
+
+    def resolve_orders(root, info, search=None, **kwargs):
+        return search_queryset(Order.objects.all(), search)
+
+    def resolve_recent_orders(root, info, days=7, **kwargs):
+        if days < 1:
+            raise GraphQLError("`days` must be at least 1.")
+        since = timezone.now() - timedelta(days=days)
+        return Order.objects.filter(order_date__gte=since).order_by("order_date", "id")
+
+    def resolve_audit_events(root, info, **kwargs):
+        user = getattr(info.context, "user", None)
+        if getattr(settings, "CRM_AUDIT_STAFF_ONLY", True) and not (user and user.is_staff):
+            raise GraphQLError("Only staff users can read the audit log.")
+        # A deliberate write from a query: this process's buffered events go to
+        # the table first, so a client reading right after its own mutation
+        # sees it. Other processes' buffers are flushed by their own triggers.
+        audit.get_audit_log().flush()
+        return AuditEvent.objects.all()
+
+    def resolve_crm_stats(root, info, date_from=None, date_to=None, group_by=None):
+        stats = crm_stats(
+            date_from=date_from,
+            date_to=date_to,
+            group_by=group_by.value if group_by else None,
+        )
+        return CRMStatsType(
+            customer_count=stats["customer_count"],
+            order_count=stats["order_count"],
+            revenue=stats["revenue"],
+            groups=[CRMStatsGroupType(**group) for group in stats["groups"]],
+        )
+
+    def resolve_sales_rollups(root, info, date_from, date_to, dimension=None,
+                              customer_id=None, product_id=None, **kwargs):
+        return rollups_queryset(
+            date_from,
+            date_to,
+            dimension=dimension.value if dimension else DIMENSION_DAY,
+            customer_id=customer_id,
+            product_id=product_id,
+        )
 
 
 # ---------------- Mutations ----------------
+# Customer fields recorded in the audit log's diffs.
+CUSTOMER_AUDIT_FIELDS = ("name", "email", "phone")
+
+
 class CreateCustomer(graphene.Mutation):
     class Arguments:
         name = graphene.String(required=True)
@@ -51,6 +243,8 @@ class CreateCustomer(graphene.Mutation):
     def mutate(cls, root, info, name, email):
         customer = Customer(name=name, email=email)
         customer.save()
+        audit.record(info.context, "createCustomer", customer,
+                     audit.diff({}, audit.snapshot(customer, CUSTOMER_AUDIT_FIELDS)))
         return CreateCustomer(customer=customer)
 
 
@@ -69,11 +263,14 @@ class UpdateCustomer(graphene.Mutation):
         except Customer.DoesNotExist:
             raise Exception("Customer not found")
 
+        before = audit.snapshot(customer, CUSTOMER_AUDIT_FIELDS)
         if name is not None:
             customer.name = name
         if email is not None:
             customer.email = email
         customer.save()
+        audit.record(info.context, "updateCustomer", customer,
+                     audit.diff(before, audit.snapshot(customer, CUSTOMER_AUDIT_FIELDS)))
 
         return UpdateCustomer(customer=customer)
 
@@ -88,29 +285,87 @@ class DeleteCustomer(graphene.Mutation):
     def mutate(cls, root, info, id):
         try:
             customer = Customer.objects.get(pk=id)
+            before = audit.snapshot(customer, CUSTOMER_AUDIT_FIELDS)
+            target = Customer(pk=customer.pk)  # delete() clears customer.pk
             customer.delete()
+            audit.record(info.context, "deleteCustomer", target, audit.diff(before, {}))
             return DeleteCustomer(ok=True)
         except Customer.DoesNotExist:
             return DeleteCustomer(ok=False)
 
 
+# ---------------- Bulk Mutations ----------------
+class CustomerInput(graphene.InputObjectType):
+    name = graphene.String(required=True)
+    email = graphene.String(required=True)
+    phone = graphene.String()
+
+
+class OrderInput(graphene.InputObjectType):
+    customer_id = graphene.ID(required=True)
+    product_ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+    order_date = graphene.DateTime()
+
+
+class CreateOrder(graphene.Mutation):
+    class Arguments:
+        input = OrderInput(required=True)
+
+    order = graphene.Field(OrderType)
+
+    @classmethod
+    def mutate(cls, root, info, input):
+        order = create_order(input.customer_id, input.product_ids, input.get("order_date"))
+        audit.record(info.context, "createOrder", order, {
+            "customer_id": [None, order.customer_id],
+            "product_ids": [None, [int(pk) for pk in input.product_ids]],
+            "total_amount": [None, order.total_amount],
+        })
+        return CreateOrder(order=order)
+
+
+class BulkCreateCustomers(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(graphene.NonNull(CustomerInput), required=True)
+
+    customers = graphene.List(CustomerType)
+    errors = graphene.List(graphene.String)
+
+    @classmethod
+    def mutate(cls, root, info, input):
+        customers, errors = bulk_create_customers(input)
+        return BulkCreateCustomers(customers=customers, errors=errors)
+
+
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(graphene.NonNull(OrderInput), required=True)
+
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+
+    @classmethod
+    def mutate(cls, root, info, input):
+        orders, errors = bulk_create_orders(input)
+        return BulkCreateOrders(orders=orders, errors=errors)
+
+
 # ---------------- New Mutation: UpdateLowStockProducts ----------------
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
-        increment = graphene.Int(required=False, default_value=10)
+        # Omitted: the CRM_* settings. A RestockPolicy row overrides both.
+        increment = graphene.Int(required=False)
+        threshold = graphene.Int(required=False)
 
     updated_products = graphene.List(ProductType)
     message = graphene.String()
 
     @classmethod
-    def mutate(cls, root, info, increment=10):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated = []
-
-        for product in low_stock_products:
-            product.stock += increment
-            product.save()
-            updated.append(product)
+    def mutate(cls, root, info, increment=None, threshold=None):
+        updated = restock_low_stock(increment=increment, threshold=threshold)
+        for product in updated:
+            audit.record(info.context, "updateLowStockProducts", product,
+                         {"stock": [product.stock - product.restocked_by, product.stock]})
 
         msg = f"Updated {len(updated)} products" if updated else "No products needed restocking"
         return UpdateLowStockProducts(updated_products=updated, message=msg)
@@ -121,6 +376,9 @@ class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     update_customer = UpdateCustomer.Field()
     delete_customer = DeleteCustomer.Field()
+    create_order = CreateOrder.Field()
+    bulk_create_customers = BulkCreateCustomers.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
 
 
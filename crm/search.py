@@ -0,0 +1,177 @@
+"""
+Substring search for the CRM models.
+
+``icontains`` compiles to ``LIKE '%x%'``, which can never use a b-tree index.
+The default backend on SQLite keeps FTS5 trigram tables next to the model
+tables so substring matches become index lookups:
+
+- crm_customer_fts(name, email)   rowid = Customer.id
+- crm_product_fts(name)           rowid = Product.id
+
+Other databases fall back to ``IContainsSearchBackend`` until a dedicated
+backend (e.g. pg_trgm) is configured with ``CRM_SEARCH_BACKEND``. The index
+is kept in sync from model signals (see ``crm.signals``); code that bypasses
+signals (bulk_create, queryset.update) must call ``index_instances`` itself.
+"""
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Customer, Product, Order
+
+# Searchable columns per model, in FTS column order.
+SEARCH_FIELDS = {
+    Customer: ("name", "email"),
+    Product: ("name",),
+}
+
+# Trigram tokens need at least three characters to match anything.
+MIN_TRIGRAM_LENGTH = 3
+
+# Stay under SQLite's default limit of 999 bound parameters per statement.
+MAX_QUERY_PARAMS = 999
+
+
+def chunked_rows(rows, params_per_row):
+    size = max(1, MAX_QUERY_PARAMS // params_per_row)
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class SearchBackend:
+    """Interface for pluggable search backends."""
+
+    def filter(self, queryset, value, fields=None):
+        """Restrict ``queryset`` to rows where any of ``fields`` contains ``value``."""
+        raise NotImplementedError
+
+    def index_instances(self, model, instances):
+        """Add or refresh ``instances`` in the index."""
+
+    def remove_instances(self, model, pks):
+        """Drop the rows with primary keys ``pks`` from the index."""
+
+    def rebuild(self, model):
+        """Re-index every row of ``model``."""
+
+
+class IContainsSearchBackend(SearchBackend):
+    """Portable fallback: plain ``icontains`` lookups, no index to maintain."""
+
+    def filter(self, queryset, value, fields=None):
+        fields = fields or SEARCH_FIELDS[queryset.model]
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f"{field}__icontains": value})
+        return queryset.filter(condition)
+
+
+class SQLiteFTSSearchBackend(SearchBackend):
+    """FTS5 trigram index maintained alongside the model tables."""
+
+    @staticmethod
+    def table_name(model):
+        return f"{model._meta.db_table}_fts"
+
+    @staticmethod
+    def match_expression(value, fields):
+        phrase = '"{}"'.format(value.replace('"', '""'))
+        return "{{{}}} : {}".format(" ".join(fields), phrase)
+
+    def matching_pks(self, model, value, fields=None):
+        """SQL fragment selecting the pks of ``model`` matching ``value``."""
+        fields = fields or SEARCH_FIELDS[model]
+        table = self.table_name(model)
+        return RawSQL(
+            f"SELECT rowid FROM {table} WHERE {table} MATCH %s",
+            [self.match_expression(value, fields)],
+        )
+
+    def filter(self, queryset, value, fields=None):
+        if len(value) < MIN_TRIGRAM_LENGTH:
+            return IContainsSearchBackend().filter(queryset, value, fields)
+        return queryset.filter(pk__in=self.matching_pks(queryset.model, value, fields))
+
+    def index_instances(self, model, instances):
+        fields = SEARCH_FIELDS[model]
+        rows = [
+            (obj.pk, *[getattr(obj, field) or "" for field in fields])
+            for obj in instances
+        ]
+        if not rows:
+            return
+        self.remove_instances(model, [row[0] for row in rows])
+        table = self.table_name(model)
+        placeholders = "({})".format(", ".join(["%s"] * (len(fields) + 1)))
+        # Multi-row statements rather than executemany(), which graphene's
+        # DjangoDebug cursor wrapper can't log.
+        with connection.cursor() as cursor:
+            for chunk in chunked_rows(rows, len(fields) + 1):
+                cursor.execute(
+                    f"INSERT INTO {table} (rowid, {', '.join(fields)}) "
+                    f"VALUES {', '.join([placeholders] * len(chunk))}",
+                    [value for row in chunk for value in row],
+                )
+
+    def remove_instances(self, model, pks):
+        table = self.table_name(model)
+        pks = list(pks)
+        with connection.cursor() as cursor:
+            for chunk in chunked_rows(pks, 1):
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk,
+                )
+
+    def rebuild(self, model):
+        fields = ", ".join(SEARCH_FIELDS[model])
+        table = self.table_name(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, {fields}) "
+                f"SELECT id, {fields} FROM {model._meta.db_table}"
+            )
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, "CRM_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == "sqlite":
+        return SQLiteFTSSearchBackend()
+    return IContainsSearchBackend()
+
+
+# --- Query helpers ---
+def search_filter(queryset, value, fields=None):
+    """Substring-match ``value`` against ``fields`` of a Customer/Product queryset."""
+    return get_search_backend().filter(queryset, value, fields)
+
+
+def orders_matching(queryset, customer_value=None, product_value=None, customer_fields=None):
+    """Orders whose customer or any of whose products match, without an M2M join."""
+    condition = Q()
+    if customer_value:
+        customers = search_filter(Customer.objects.all(), customer_value, customer_fields)
+        condition |= Q(customer__in=customers.values("pk"))
+    if product_value:
+        products = search_filter(Product.objects.all(), product_value)
+        links = Order.products.through.objects.filter(product__in=products.values("pk"))
+        condition |= Q(pk__in=links.values("order_id"))
+    return queryset.filter(condition)
+
+
+def search_queryset(queryset, value):
+    """Apply the free-text ``search`` argument to a CRM queryset."""
+    if not value:
+        return queryset
+    if queryset.model is Order:
+        return orders_matching(queryset, customer_value=value, product_value=value)
+    return search_filter(queryset, value)
@@ -21,6 +21,9 @@ CRONJOBS = [
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
 
+# New orders queue their reminder task with an ETA (see crm.reminders).
+CRM_ORDER_REMINDER_QUEUE = True
+
 from celery.schedules import crontab
 
 CELERY_BEAT_SCHEDULE = {
@@ -28,5 +31,9 @@ CELERY_BEAT_SCHEDULE = {
         "task": "crm.tasks.generate_crm_report",
         "schedule": crontab(day_of_week="mon", hour=6, minute=0),
     },
+    "sweep-order-reminders": {
+        "task": "crm.tasks.sweep_order_reminders",
+        "schedule": crontab(minute="*/15"),
+    },
 }
 
@@ -0,0 +1,182 @@
+"""
+Model signal handlers for the CRM app, connected in ``CrmConfig.ready``.
+"""
+
+from itertools import chain
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Customer, Order, Product
+from .reminders import queue_reminders, reminder_due_for
+from .response_cache import invalidate
+from .rollups import apply_deltas, day_of, link_deltas, order_deltas, refresh_for_orders
+from .search import get_search_backend
+
+
+# --- Search index ---
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+def index_search_fields(sender, instance, **kwargs):
+    get_search_backend().index_instances(sender, [instance])
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    get_search_backend().remove_instances(sender, [instance.pk])
+
+
+# --- Order totals ---
+def _orders_containing(product_pks):
+    links = Order.products.through.objects.filter(product_id__in=product_pks)
+    return Order.objects.filter(pk__in=links.values("order_id"))
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def refresh_totals_on_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            Order.objects.filter(pk=instance.pk).refresh_totals()
+            instance.refresh_from_db(fields=["total_amount"])
+        return
+
+    # product.orders.add/remove/clear(): pk_set holds order ids, except on clear.
+    if action == "pre_clear":
+        instance._cleared_order_pks = list(instance.orders.values_list("pk", flat=True))
+    elif action == "post_clear":
+        Order.objects.filter(pk__in=instance.__dict__.pop("_cleared_order_pks", [])).refresh_totals()
+    elif action in ("post_add", "post_remove"):
+        Order.objects.filter(pk__in=pk_set).refresh_totals()
+
+
+@receiver(post_save, sender=Product)
+def refresh_totals_on_price_change(sender, instance, created, update_fields, **kwargs):
+    if created or (update_fields is not None and "price" not in update_fields):
+        return
+    if getattr(instance, "_loaded_price", None) == instance.price:
+        return
+    orders = _orders_containing([instance.pk])
+    orders.refresh_totals()
+    refresh_for_orders(orders)
+    instance._loaded_price = instance.price
+
+
+@receiver(pre_delete, sender=Product)
+def remember_orders_of_deleted_product(sender, instance, **kwargs):
+    # The through rows are gone (without m2m_changed) by the time post_delete runs.
+    instance._affected_order_pks = list(
+        _orders_containing([instance.pk]).values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def refresh_totals_on_product_delete(sender, instance, **kwargs):
+    orders = Order.objects.filter(pk__in=instance.__dict__.pop("_affected_order_pks", []))
+    orders.refresh_totals()
+    refresh_for_orders(orders)
+
+
+# --- Daily sales rollups ---
+# Connected after the totals handlers so they see fresh total_amounts.
+def _bucket(order):
+    return (order.order_date, order.customer_id, order.total_amount)
+
+
+def _linked(instance, reverse, pks=None):
+    """``(day, customer_id, product_id, price)`` for the links of ``instance``."""
+    links = Order.products.through.objects.filter(
+        **{"product_id" if reverse else "order_id": instance.pk}
+    )
+    if pks is not None:
+        links = links.filter(**{"order_id__in" if reverse else "product_id__in": pks})
+    return [
+        (day_of(order_date), customer_id, product_id, price)
+        for order_date, customer_id, product_id, price in links.values_list(
+            "order__order_date", "order__customer_id", "product_id", "product__price"
+        )
+    ]
+
+
+@receiver(post_save, sender=Order)
+def update_rollups_on_order_save(sender, instance, created, **kwargs):
+    loaded = getattr(instance, "_loaded_bucket", None)
+    if created:
+        # The products are linked afterwards, through m2m_changed.
+        apply_deltas(order_deltas(
+            day_of(instance.order_date), instance.customer_id, instance.total_amount, {}
+        ))
+    elif loaded is None:
+        # Saved without being loaded: its old buckets are unknown.
+        refresh_for_orders([instance])
+    elif loaded != _bucket(instance):
+        old_date, old_customer_id, old_total = loaded
+        moved_day = day_of(old_date) != day_of(instance.order_date)
+        prices = {pid: price for _, _, pid, price in _linked(instance, False)} if moved_day else {}
+        apply_deltas(chain(
+            order_deltas(day_of(old_date), old_customer_id, old_total, prices, sign=-1),
+            order_deltas(day_of(instance.order_date), instance.customer_id,
+                         instance.total_amount, prices),
+        ))
+    instance._loaded_bucket = _bucket(instance)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def update_rollups_on_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        instance._unlinked_rollups = _linked(instance, reverse)
+    elif action == "pre_remove":
+        # pk_set may name products the order never had.
+        instance._unlinked_rollups = _linked(instance, reverse, pk_set)
+    elif action in ("post_clear", "post_remove"):
+        apply_deltas(link_deltas(instance.__dict__.pop("_unlinked_rollups", []), sign=-1))
+    elif action == "post_add":
+        apply_deltas(link_deltas(_linked(instance, reverse, pk_set)))
+    else:
+        return
+    if not reverse and action.startswith("post_") and hasattr(instance, "_loaded_bucket"):
+        instance._loaded_bucket = _bucket(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def remember_rollups_of_deleted_order(sender, instance, **kwargs):
+    # The through rows are gone (without m2m_changed) by the time post_delete runs.
+    instance._deleted_rollup_prices = {pid: price for _, _, pid, price in _linked(instance, False)}
+
+
+@receiver(post_delete, sender=Order)
+def update_rollups_on_order_delete(sender, instance, **kwargs):
+    apply_deltas(order_deltas(
+        day_of(instance.order_date), instance.customer_id, instance.total_amount,
+        instance.__dict__.pop("_deleted_rollup_prices", {}), sign=-1,
+    ))
+
+
+# --- Order reminders ---
+@receiver(pre_save, sender=Order)
+def set_reminder_due(sender, instance, **kwargs):
+    if instance._state.adding and instance.reminder_due_at is None:
+        instance.reminder_due_at = reminder_due_for(instance.order_date)
+
+
+@receiver(post_save, sender=Order)
+def queue_reminder_on_order_created(sender, instance, created, **kwargs):
+    if created:
+        queue_reminders([instance])
+
+
+# --- Response cache ---
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate(sender)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_cached_responses_on_products_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate(Order, Product)
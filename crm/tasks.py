@@ -1,42 +1,24 @@
-from datetime import datetime
-import requests
+from datetime import date, datetime
 from celery import shared_task
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from django.utils import timezone
+
+from .reminders import send_due_reminders
+from .reports import crm_stats
+from .rollups import backfill_rollups
 
 LOG_FILE = "/tmp/crm_report_log.txt"
-GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
 
 @shared_task
 def generate_crm_report():
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     try:
-        # GraphQL client
-        transport = RequestsHTTPTransport(
-            url=GRAPHQL_ENDPOINT,
-            verify=True,
-            retries=3,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-
-        query = gql("""
-        query {
-          allCustomers { id }
-          allOrders { id totalAmount }
-        }
-        """)
-
-        result = client.execute(query)
-
-        total_customers = len(result.get("allCustomers", []))
-        orders = result.get("allOrders", [])
-        total_orders = len(orders)
-        total_revenue = sum(float(order["totalAmount"]) for order in orders)
+        # One aggregate query in-process instead of downloading every order over HTTP.
+        stats = crm_stats()
 
         message = (
-            f"{timestamp} - Report: {total_customers} customers, "
-            f"{total_orders} orders, {total_revenue} revenue"
+            f"{timestamp} - Report: {stats['customer_count']} customers, "
+            f"{stats['order_count']} orders, {stats['revenue']} revenue"
         )
 
     except Exception as e:
@@ -47,3 +29,33 @@ def generate_crm_report():
         f.write(message + "\n")
 
     return message
+
+
+@shared_task
+def backfill_sales_rollups(date_from=None, date_to=None, chunk_days=31):
+    """Rebuild DailySalesRollup rows for ISO dates ``[date_from, date_to)``."""
+    return backfill_rollups(
+        date.fromisoformat(date_from) if date_from else None,
+        date.fromisoformat(date_to) if date_to else None,
+        chunk_days=chunk_days,
+    )
+
+
+@shared_task
+def send_order_reminders(customer_id, due=None):
+    """
+    Send a customer's due order reminders; queued with an ETA on order creation.
+
+    ``due`` (ISO datetime) is the ETA itself, so a worker clock running
+    slightly behind still finds the order due.
+    """
+    now = timezone.now()
+    if due:
+        now = max(now, datetime.fromisoformat(due))
+    return send_due_reminders(customer_id=customer_id, now=now)
+
+
+@shared_task
+def sweep_order_reminders():
+    """Send every reminder that is due but was never sent (Celery Beat)."""
+    return send_due_reminders()
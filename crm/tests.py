@@ -1,3 +1,1697 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from gql.transport.requests import RequestsHTTPTransport
+from graphql import ExecutionResult, GraphQLError, parse, print_schema, validate
+
+from alx_backend_graphql.database import database_settings
+from alx_backend_graphql.schema import schema
+from .benchmarks import compare, run_benchmarks, stress_order_creation
+from .bulk import bulk_create_customers, bulk_create_orders
+from .cost import operation_cost
+from .datagen import generate_dataset
+from .db import ReadReplicaRouter, read_database
+from .export import get_chunk_size, stream_export
+from . import audit, graphql_client
+from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .metrics import registry
+from .loaders import CRMLoaders, get_loaders, load_orders_by_product, load_products_by_order
+from .inventory import InsufficientStock, reserve_stock, restock_low_stock, retry_on_busy
+from .models import AuditEvent, Customer, Product, Order, RestockPolicy, DailySalesRollup
+from .persisted import get_document_cache, get_persisted_queries, query_hash
+from .response_cache import get_response_cache
+from .reports import crm_stats
+from .rollups import day_of, rollups_queryset
+from .search import search_queryset
+from . import schema as crm_schema
+from . import tracing
+from .reminders import pending_reminders
+from .tasks import backfill_sales_rollups, generate_crm_report, send_order_reminders, sweep_order_reminders
+from .views import CRMExecutionContext, CRMGraphQLView, accepts_gzip
+
+
+def run_query(query, variables=None):
+    request = RequestFactory().post("/graphql")
+    return schema.execute(
+        query,
+        variable_values=variables,
+        context_value=request,
+        execution_context_class=CRMExecutionContext,
+    )
+
+
+class CRMDataMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [
+            Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+            for i in range(5)
+        ]
+        cls.products = [
+            Product.objects.create(name=f"Product {i}", price=Decimal("10.00") * (i + 1), stock=i)
+            for i in range(4)
+        ]
+        cls.orders = []
+        for i in range(10):
+            order = Order.objects.create(customer=cls.customers[i % 5])
+            order.products.set(cls.products[: (i % 4) + 1])
+            cls.orders.append(order)
+
+
+# ---------------- DataLoaders ----------------
+class DataLoaderTests(CRMDataMixin, TestCase):
+    def test_batch_functions_group_by_key(self):
+        order_ids = [o.pk for o in self.orders[:4]]
+        with self.assertNumQueries(1):
+            products = load_products_by_order(order_ids)
+        self.assertEqual([len(p) for p in products], [1, 2, 3, 4])
+
+        with self.assertNumQueries(1):
+            orders = load_orders_by_product([self.products[3].pk, 0])
+        self.assertEqual(len(orders[0]), 2)
+        self.assertEqual(orders[1], [])
+
+    def test_loader_is_cached_per_key(self):
+        loaders = CRMLoaders()
+        first = loaders.customer_by_id.load(self.customers[0].pk)
+        second = loaders.customer_by_id.load(self.customers[1].pk)
+        self.assertIs(loaders.customer_by_id.load(self.customers[0].pk), first)
+        with self.assertNumQueries(1):
+            first.deferred_callback()
+        self.assertEqual(first.result(), self.customers[0])
+        self.assertEqual(second.result(), self.customers[1])
+
+
+# ---------------- Query optimizer ----------------
+class QueryOptimizerTests(CRMDataMixin, TestCase):
+    def test_scalar_selection_only_touches_order_table(self):
+        with self.assertNumQueries(1) as ctx:
+            result = run_query("{ orders { id totalAmount } }")
+        self.assertIsNone(result.errors)
+        sql = ctx.captured_queries[0]["sql"]
+        self.assertNotIn("crm_customer", sql)
+        self.assertNotIn("crm_product", sql)
+        self.assertNotIn("order_date", sql)
+
+    def test_order_relations_are_batched(self):
+        # orders JOIN customers + one prefetch for the order/product links
+        with self.assertNumQueries(2):
+            result = run_query("{ orders { id customer { email } products { name price } } }")
+        self.assertIsNone(result.errors)
+        orders = {o["id"]: o for o in result.data["orders"]}
+        self.assertEqual(len(orders), 10)
+        fourth = orders[str(self.orders[3].pk)]
+        self.assertEqual(fourth["customer"]["email"], "c3@example.com")
+        self.assertEqual(sorted(p["name"] for p in fourth["products"]),
+                         ["Product 0", "Product 1", "Product 2", "Product 3"])
+
+    def test_reverse_orders_are_batched(self):
+        with self.assertNumQueries(4):
+            result = run_query(
+                "{ customers { id orders { id } } products { id orders { id } } }"
+            )
+        self.assertIsNone(result.errors)
+        by_customer = {c["id"]: c for c in result.data["customers"]}
+        self.assertEqual(len(by_customer[str(self.customers[0].pk)]["orders"]), 2)
+        by_product = {p["id"]: p for p in result.data["products"]}
+        self.assertEqual(len(by_product[str(self.products[0].pk)]["orders"]), 10)
+        self.assertEqual(len(by_product[str(self.products[3].pk)]["orders"]), 2)
+
+    def test_fragments_are_followed(self):
+        query = """
+            fragment OrderBits on OrderType { customer { email } }
+            { orders { id ...OrderBits ... on OrderType { products { name } } } }
+        """
+        with self.assertNumQueries(2) as ctx:
+            result = run_query(query)
+        self.assertIsNone(result.errors)
+        self.assertIn("crm_customer", ctx.captured_queries[0]["sql"])
+        self.assertNotIn("price", ctx.captured_queries[1]["sql"])
+        emails = {o["customer"]["email"] for o in result.data["orders"]}
+        self.assertEqual(len(emails), 5)
+
+    def test_nested_prefetches(self):
+        with self.assertNumQueries(3):
+            result = run_query("{ customers { orders { customer { name } products { id } } } }")
+        self.assertIsNone(result.errors)
+        for customer in result.data["customers"]:
+            names = {o["customer"]["name"] for o in customer["orders"]}
+            self.assertEqual(len(names), 1)
+
+
+# ---------------- Keyset pagination ----------------
+class KeysetPaginationTests(CRMDataMixin, TestCase):
+    PAGE = """
+        query Page($first: Int, $after: String, $last: Int, $before: String) {
+          allOrders(first: $first, after: $after, last: $last, before: $before) {
+            edges { cursor node { id totalAmount } }
+            pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+          }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Identical order dates force the id tie-breaker to do its job.
+        Order.objects.filter(pk__in=[o.pk for o in cls.orders[:6]]).update(
+            order_date=cls.orders[0].order_date
+        )
+        cls.expected = list(
+            Order.objects.order_by("order_date", "id").values_list("id", flat=True)
+        )
+
+    def _page(self, **variables):
+        result = run_query(self.PAGE, variables)
+        self.assertIsNone(result.errors)
+        return result.data["allOrders"]
+
+    def test_forward_pages_cover_every_row_once(self):
+        seen, after = [], None
+        while True:
+            with self.assertNumQueries(1) as ctx:
+                page = self._page(first=3, after=after)
+            sql = ctx.captured_queries[0]["sql"]
+            self.assertIn("LIMIT 4", sql)
+            self.assertNotIn("OFFSET", sql)
+            seen += [int(e["node"]["id"]) for e in page["edges"]]
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(seen, self.expected)
+
+    def test_backward_page(self):
+        last_page = self._page(last=4)
+        self.assertEqual([int(e["node"]["id"]) for e in last_page["edges"]], self.expected[-4:])
+        self.assertTrue(last_page["pageInfo"]["hasPreviousPage"])
+
+        before = last_page["pageInfo"]["startCursor"]
+        previous = self._page(last=4, before=before)
+        self.assertEqual([int(e["node"]["id"]) for e in previous["edges"]], self.expected[-8:-4])
+        self.assertTrue(previous["pageInfo"]["hasNextPage"])
+
+    def test_invalid_cursor_is_reported(self):
+        result = run_query(self.PAGE, {"first": 2, "after": "bm9wZQ=="})
+        self.assertIn("Invalid cursor", result.errors[0].message)
+
+
+# ---------------- Filters & indexes ----------------
+class FilterConnectionTests(CRMDataMixin, TestCase):
+    def test_all_orders_filters(self):
+        result = run_query(
+            """{ allOrders(productName: "duct 3", first: 50) { edges { node { id } } } }"""
+        )
+        self.assertIsNone(result.errors)
+        ids = sorted(int(e["node"]["id"]) for e in result.data["allOrders"]["edges"])
+        self.assertEqual(ids, [self.orders[3].pk, self.orders[7].pk])
+
+    def test_phone_pattern_is_a_prefix_match(self):
+        Customer.objects.filter(pk=self.customers[0].pk).update(phone="+1234567890")
+        Customer.objects.filter(pk=self.customers[1].pk).update(phone="+1299999999")
+        Customer.objects.filter(pk=self.customers[2].pk).update(phone="0+123")
+        result = run_query(
+            """{ allCustomers(phonePattern: "+123") { edges { node { email } } } }"""
+        )
+        self.assertIsNone(result.errors)
+        emails = [e["node"]["email"] for e in result.data["allCustomers"]["edges"]]
+        self.assertEqual(emails, ["c0@example.com"])
+
+    def test_recent_orders_window(self):
+        old = [o.pk for o in self.orders[:3]]
+        Order.objects.filter(pk__in=old).update(order_date=timezone.now() - timedelta(days=8))
+        with self.assertNumQueries(1) as ctx:
+            result = run_query("{ recentOrders(days: 7) { id customer { email } } }")
+        self.assertIsNone(result.errors)
+        self.assertIn("order_date", ctx.captured_queries[0]["sql"])
+        ids = [int(o["id"]) for o in result.data["recentOrders"]]
+        self.assertEqual(ids, [o.pk for o in self.orders[3:]])
+
+        result = run_query("{ recentOrders(days: 0) { id } }")
+        self.assertEqual(result.errors[0].message, "`days` must be at least 1.")
+
+
+class FilterIndexTests(TestCase):
+    """The common filters must be answered from an index, not a table scan."""
+
+    def assertUsesIndex(self, queryset, index, table):
+        plan = queryset.explain()
+        self.assertIn(f"INDEX {index}", plan)
+        self.assertNotRegex(plan, rf"SCAN {table}\b")
+
+    def test_order_date_range(self):
+        qs = OrderFilter(
+            {"order_date__gte": "2025-01-01T00:00:00Z"},
+            queryset=Order.objects.order_by("order_date", "id"),
+        ).qs[:10]
+        self.assertUsesIndex(qs, "crm_order_date_id_idx", "crm_order")
+
+    def test_customer_created_at_range(self):
+        qs = CustomerFilter(
+            {"created_at__gte": "2025-01-01T00:00:00Z", "created_at__lte": "2025-06-01T00:00:00Z"},
+            queryset=Customer.objects.order_by("created_at", "id"),
+        ).qs[:10]
+        self.assertUsesIndex(qs, "crm_customer_created_id_idx", "crm_customer")
+
+    def test_phone_pattern(self):
+        qs = CustomerFilter({"phone_pattern": "+123"}, queryset=Customer.objects.all()).qs
+        self.assertUsesIndex(qs, "crm_customer_phone_idx", "crm_customer")
+
+    def test_product_price_and_stock(self):
+        qs = ProductFilter({"price__gte": "10", "price__lte": "20"}, queryset=Product.objects.all()).qs
+        self.assertUsesIndex(qs, "crm_product_price_idx", "crm_product")
+        qs = ProductFilter({"stock__lte": 9}, queryset=Product.objects.all()).qs
+        self.assertUsesIndex(qs, "crm_product_stock_idx", "crm_product")
+
+
+# ---------------- Search ----------------
+class SearchTests(CRMDataMixin, TestCase):
+    def test_search_argument_on_lists(self):
+        result = run_query('{ customers(search: "C3@EXAMPLE") { email } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["customers"], [{"email": "c3@example.com"}])
+
+        result = run_query('{ orders(search: "duct 3") { id } }')
+        ids = sorted(int(o["id"]) for o in result.data["orders"])
+        self.assertEqual(ids, [self.orders[3].pk, self.orders[7].pk])
+
+    def test_search_argument_on_connections(self):
+        result = run_query('{ allOrders(search: "customer 1") { edges { node { id } } } }')
+        self.assertIsNone(result.errors)
+        ids = sorted(int(e["node"]["id"]) for e in result.data["allOrders"]["edges"])
+        self.assertEqual(ids, [self.orders[1].pk, self.orders[6].pk])
+
+    def test_index_follows_saves_and_deletes(self):
+        product = self.products[0]
+        product.name = "Gadget"
+        product.save()
+        result = run_query('{ products(search: "adge") { id } }')
+        self.assertEqual(result.data["products"], [{"id": str(product.pk)}])
+        result = run_query('{ products(search: "Product 0") { id } }')
+        self.assertEqual(result.data["products"], [])
+
+        product.delete()
+        result = run_query('{ products(search: "adge") { id } }')
+        self.assertEqual(result.data["products"], [])
+
+    def test_short_terms_fall_back_to_icontains(self):
+        result = run_query('{ customers(search: "c4") { email } }')
+        self.assertEqual(result.data["customers"], [{"email": "c4@example.com"}])
+
+    def test_search_uses_fts_index(self):
+        plan = search_queryset(Order.objects.all(), "duct").explain()
+        self.assertIn("VIRTUAL TABLE INDEX", plan)
+        self.assertNotRegex(plan, r"SCAN crm_product\b")
+        self.assertNotRegex(plan, r"SCAN crm_customer\b")
+
+
+# ---------------- Bulk mutations ----------------
+class BulkMutationTests(CRMDataMixin, TestCase):
+    CUSTOMERS = """
+        mutation Bulk($input: [CustomerInput!]!) {
+          bulkCreateCustomers(input: $input) { customers { id email } errors }
+        }
+    """
+    ORDERS = """
+        mutation Bulk($input: [OrderInput!]!) {
+          bulkCreateOrders(input: $input) { orders { id totalAmount } errors }
+        }
+    """
+
+    def test_bulk_create_customers_reports_rows(self):
+        rows = [
+            {"name": "Bob", "email": "bob@example.com", "phone": "123-456-7890"},
+            {"name": "Carol", "email": "carol@example.com"},
+            {"name": "Dup", "email": "bob@example.com"},
+            {"name": "Old", "email": "c0@example.com"},
+            {"name": "Bad", "email": "not-an-email"},
+        ]
+        with self.settings(CRM_BULK_CHUNK_SIZE=2):
+            result = run_query(self.CUSTOMERS, {"input": rows})
+        self.assertIsNone(result.errors)
+        payload = result.data["bulkCreateCustomers"]
+        self.assertEqual([c["email"] for c in payload["customers"]],
+                         ["bob@example.com", "carol@example.com"])
+        self.assertEqual([e.split(":")[0] for e in payload["errors"]], ["Row 3", "Row 4", "Row 5"])
+        self.assertTrue(Customer.objects.filter(email="carol@example.com").exists())
+        # bulk_create bypasses signals; the search index must still see new rows.
+        search = run_query('{ customers(search: "carol") { email } }')
+        self.assertEqual(search.data["customers"], [{"email": "carol@example.com"}])
+
+    def test_bulk_create_customers_query_count_is_per_chunk(self):
+        rows = [{"name": f"N{i}", "email": f"n{i}@example.com"} for i in range(50)]
+        with self.settings(CRM_BULK_CHUNK_SIZE=25):
+            # 2 existence checks + 2 inserts (+ savepoints) + 2 index statements
+            with self.assertNumQueries(10):
+                created, errors = bulk_create_customers(rows)
+        self.assertEqual(len(created), 50)
+        self.assertEqual(errors, [])
+
+    def test_bulk_create_orders(self):
+        Product.objects.update(stock=10)  # orders now take stock
+        rows = [
+            {"customerId": str(self.customers[0].pk),
+             "productIds": [str(self.products[0].pk), str(self.products[1].pk)]},
+            {"customerId": "999999", "productIds": [str(self.products[0].pk)]},
+            {"customerId": str(self.customers[1].pk), "productIds": ["424242"]},
+            {"customerId": str(self.customers[1].pk), "productIds": []},
+        ]
+        result = run_query(self.ORDERS, {"input": rows})
+        self.assertIsNone(result.errors)
+        payload = result.data["bulkCreateOrders"]
+        self.assertEqual(len(payload["orders"]), 1)
+        self.assertEqual(len(payload["errors"]), 3)
+        order = Order.objects.get(pk=payload["orders"][0]["id"])
+        self.assertEqual(order.total_amount, Decimal("30.00"))
+        self.assertEqual(order.products.count(), 2)
+
+
+# ---------------- Stock reservations ----------------
+class StockReservationTests(CRMDataMixin, TestCase):
+    CREATE = """
+        mutation Create($input: OrderInput!) {
+          createOrder(input: $input) { order { id totalAmount products { id } } }
+        }
+    """
+
+    def stock(self):
+        return list(Product.objects.order_by("pk").values_list("stock", flat=True))
+
+    def test_create_order_takes_stock(self):
+        # stock is 0..3 for the fixture products
+        ids = [str(self.products[2].pk), str(self.products[3].pk)]
+        result = run_query(self.CREATE, {"input": {"customerId": str(self.customers[0].pk), "productIds": ids}})
+        self.assertIsNone(result.errors)
+        order = result.data["createOrder"]["order"]
+        self.assertEqual(order["totalAmount"], "70.00")
+        self.assertEqual(sorted(p["id"] for p in order["products"]), ids)
+        self.assertEqual(self.stock(), [0, 1, 1, 2])
+
+    def test_insufficient_stock_takes_nothing(self):
+        ids = [str(self.products[3].pk), str(self.products[0].pk)]
+        result = run_query(self.CREATE, {"input": {"customerId": str(self.customers[0].pk), "productIds": ids}})
+        self.assertEqual(result.errors[0].message, f"insufficient stock for products [{self.products[0].pk}]")
+        self.assertEqual(self.stock(), [0, 1, 2, 3])
+        self.assertEqual(Order.objects.count(), len(self.orders))
+
+    def test_reserve_is_one_statement(self):
+        quantities = {self.products[3].pk: 2, self.products[2].pk: 1}
+        with CaptureQueriesContext(connection) as queries:
+            prices = reserve_stock(quantities)
+        self.assertEqual(prices, {self.products[3].pk: Decimal("40.00"), self.products[2].pk: Decimal("30.00")})
+        updates = [q["sql"] for q in queries.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("CASE", updates[0])
+        self.assertEqual(self.stock(), [0, 1, 1, 1])
+        with self.assertRaises(InsufficientStock):
+            reserve_stock({self.products[3].pk: 1, self.products[1].pk: 2})
+        self.assertEqual(self.stock(), [0, 1, 1, 1])
+
+    def test_bulk_rejects_only_rows_out_of_stock(self):
+        customer, p1, p2 = self.customers[0].pk, self.products[1].pk, self.products[2].pk
+        rows = [
+            {"customer_id": customer, "product_ids": [p1]},
+            {"customer_id": customer, "product_ids": [p1, p2]},
+            {"customer_id": customer, "product_ids": [p2]},
+        ]
+        orders, errors = bulk_create_orders(rows)
+        self.assertEqual(errors, [f"Row 2: insufficient stock for products [{p1}]"])
+        self.assertEqual([order.total_amount for order in orders], [Decimal("20.00"), Decimal("30.00")])
+        self.assertEqual(self.stock(), [0, 0, 1, 3])
+
+    def test_retry_on_busy(self):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError("database is locked")
+            return "ok"
+
+        with mock.patch.object(connection, "in_atomic_block", False), \
+                mock.patch("crm.inventory.time.sleep") as sleep:
+            self.assertEqual(retry_on_busy(write), "ok")
+            self.assertEqual(sleep.call_count, 2)
+            with self.assertRaises(OperationalError):
+                retry_on_busy(mock.Mock(side_effect=OperationalError("no such table: crm_order")))
+        # Inside a transaction only the outermost caller may start over.
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            retry_on_busy(write)
+        self.assertEqual(len(calls), 1)
+
+    def test_stress_needs_shared_database(self):
+        with self.assertRaisesMessage(RuntimeError, "file or server database"):
+            stress_order_creation(processes=1, attempts=1)
+
+
+# ---------------- Restocking ----------------
+class RestockTests(CRMDataMixin, TestCase):
+    MUTATION = """
+        mutation Restock($inc: Int, $threshold: Int) {
+          updateLowStockProducts(increment: $inc, threshold: $threshold) {
+            message
+            updatedProducts { id name stock }
+          }
+        }
+    """
+
+    def test_single_update_statement(self):
+        # stock is 0..3 for the fixture products
+        with CaptureQueriesContext(connection) as ctx:
+            result = run_query(self.MUTATION, {"inc": 5, "threshold": 2})
+        self.assertIsNone(result.errors)
+        payload = result.data["updateLowStockProducts"]
+        self.assertEqual(payload["message"], "Updated 2 products")
+        self.assertEqual([p["stock"] for p in payload["updatedProducts"]], [5, 6])
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("RETURNING", updates[0])
+        self.assertEqual(
+            list(Product.objects.order_by("pk").values_list("stock", flat=True)), [5, 6, 2, 3]
+        )
+
+    def test_policy_overrides_defaults(self):
+        RestockPolicy.objects.create(product=self.products[3], threshold=50, increment=100)
+        updated = restock_low_stock(increment=1, threshold=1)
+        self.assertEqual([(p.pk, p.stock, p.restocked_by) for p in updated],
+                         [(self.products[0].pk, 1, 1), (self.products[3].pk, 103, 100)])
+        self.assertEqual(updated[0].price, Decimal("10.00"))
+
+    @override_settings(CRM_RESTOCK_INCREMENT=4, CRM_LOW_STOCK_THRESHOLD=2)
+    def test_mutation_defaults_from_settings(self):
+        result = run_query(self.MUTATION)
+        self.assertIsNone(result.errors)
+        stocks = [p["stock"] for p in result.data["updateLowStockProducts"]["updatedProducts"]]
+        self.assertEqual(stocks, [4, 5])
+
+    def test_fallback_without_returning(self):
+        with mock.patch("crm.inventory.supports_update_returning", return_value=False):
+            updated = restock_low_stock(increment=10, threshold=10)
+        self.assertEqual([p.stock for p in updated], [10, 11, 12, 13])
+        self.assertEqual({p.restocked_by for p in updated}, {10})
+        self.assertEqual(updated[0].price, Decimal("10.00"))
+
+
+# ---------------- Order totals ----------------
+class OrderTotalTests(CRMDataMixin, TestCase):
+    def total(self, order):
+        return Order.objects.values_list("total_amount", flat=True).get(pk=order.pk)
+
+    def order_updates(self, ctx):
+        return sum(q["sql"].startswith('UPDATE "crm_order"') for q in ctx.captured_queries)
+
+    def test_totals_follow_product_links(self):
+        order = self.orders[0]
+        self.assertEqual(self.total(order), Decimal("10.00"))
+        order.products.add(self.products[2])
+        self.assertEqual(self.total(order), Decimal("40.00"))
+        self.assertEqual(order.total_amount, Decimal("40.00"))
+        order.products.remove(self.products[0])
+        self.assertEqual(self.total(order), Decimal("30.00"))
+        order.products.clear()
+        self.assertEqual(self.total(order), Decimal("0.00"))
+
+    def test_reverse_changes(self):
+        product = self.products[3]
+        product.orders.add(self.orders[0])
+        self.assertEqual(self.total(self.orders[0]), Decimal("50.00"))
+        product.orders.clear()
+        self.assertEqual(self.total(self.orders[0]), Decimal("10.00"))
+        self.assertEqual(self.total(self.orders[3]), Decimal("60.00"))
+
+    def test_price_change_is_one_update(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.price = Decimal("15.00")
+        with CaptureQueriesContext(connection) as ctx:
+            product.save()
+        self.assertEqual(self.order_updates(ctx), 1)
+        self.assertEqual(self.total(self.orders[3]), Decimal("105.00"))
+        with CaptureQueriesContext(connection) as ctx:
+            product.save()
+        self.assertEqual(self.order_updates(ctx), 0)
+
+    def test_product_delete(self):
+        self.products[1].delete()
+        self.assertEqual(self.total(self.orders[1]), Decimal("10.00"))
+
+    def test_rebuild_command(self):
+        Order.objects.update(total_amount=0)
+        call_command("rebuild_order_totals", chunk_size=3, stdout=StringIO())
+        self.assertEqual(self.total(self.orders[3]), Decimal("100.00"))
+        self.assertEqual(self.total(self.orders[9]), Decimal("30.00"))
+
+
+class CleanupCommandTests(CRMDataMixin, TestCase):
+    def setUp(self):
+        self.old_day = timezone.now() - timedelta(days=400)
+        stale = [o.pk for o in self.orders if o.customer_id in (self.customers[0].pk, self.customers[1].pk)]
+        Order.objects.filter(pk__in=stale).update(order_date=self.old_day)
+        backfill_sales_rollups()
+        self.idle = Customer.objects.create(name="Idle", email="idle@example.com")
+
+    def cleanup(self, *args):
+        out = StringIO()
+        call_command("clean_inactive_customers", *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.cleanup("--dry-run")
+        self.assertIn("Would delete 3 inactive customers.", output)
+        self.assertEqual(Customer.objects.count(), 6)
+
+    def test_batched_delete(self):
+        self.assertTrue(DailySalesRollup.objects.filter(day=day_of(self.old_day)).exists())
+        output = self.cleanup("--batch-size", "2")
+        self.assertIn("Deleted 2 customers", output)
+        self.assertIn("Deleted 3 inactive customers.", output)
+        self.assertEqual(
+            sorted(Customer.objects.values_list("email", flat=True)),
+            ["c2@example.com", "c3@example.com", "c4@example.com"],
+        )
+        self.assertEqual(Order.objects.count(), 6)
+        self.assertFalse(Order.products.through.objects.filter(order__customer__isnull=True).exists())
+        self.assertEqual(search_queryset(Customer.objects.all(), "c0@example").count(), 0)
+        self.assertFalse(DailySalesRollup.objects.filter(day__lt=timezone.now() - timedelta(days=1)).exists())
+        self.assertEqual(
+            rollups_queryset(day_of(timezone.now()), day_of(timezone.now()) + timedelta(days=1))
+            .values_list("order_count", "revenue").get(),
+            (6, Decimal("310.00")),
+        )
+
+    def test_batch_size_must_be_positive(self):
+        with self.assertRaisesMessage(CommandError, "--batch-size must be at least 1."):
+            self.cleanup("--batch-size", "0")
+        self.assertEqual(Customer.objects.count(), 6)
+
+
+# ---------------- GraphQL view ----------------
+class PersistedQueryTests(CRMDataMixin, TestCase):
+    QUERY = "{ products { name } }"
+
+    def setUp(self):
+        cache.clear()
+        get_document_cache().clear()
+        get_persisted_queries.cache_clear()
+        self.addCleanup(get_persisted_queries.cache_clear)
+
+    def post(self, payload):
+        response = self.client.post("/graphql", json.dumps(payload), content_type="application/json")
+        return response.json()
+
+    def persisted(self, sha256):
+        return {"persistedQuery": {"version": 1, "sha256Hash": sha256}}
+
+    def test_repeat_query_skips_parse_and_validate(self):
+        with mock.patch("crm.views.parse", wraps=parse) as parse_mock, \
+                mock.patch("crm.views.validate", wraps=validate) as validate_mock:
+            first = self.post({"query": self.QUERY})
+            second = self.post({"query": self.QUERY})
+        self.assertEqual(first, second)
+        self.assertEqual(len(first["data"]["products"]), 4)
+        self.assertEqual((parse_mock.call_count, validate_mock.call_count), (1, 1))
+
+    def test_invalid_documents_are_not_cached(self):
+        for _ in range(2):
+            body = self.post({"query": "{ products { nope } }"})
+            self.assertIn("nope", body["errors"][0]["message"])
+        self.assertEqual(len(get_document_cache()), 0)
+
+    def test_automatic_persisted_query_round_trip(self):
+        sha256 = query_hash(self.QUERY)
+        body = self.post({"extensions": self.persisted(sha256)})
+        self.assertEqual(body["errors"][0]["message"], "PersistedQueryNotFound")
+
+        body = self.post({"query": self.QUERY, "extensions": self.persisted(sha256)})
+        self.assertEqual(len(body["data"]["products"]), 4)
+        body = self.post({"extensions": self.persisted(sha256)})
+        self.assertEqual(len(body["data"]["products"]), 4)
+
+        body = self.post({"query": "{ customers { id } }", "extensions": self.persisted(sha256)})
+        self.assertEqual(body["errors"][0]["message"], "Provided sha256Hash does not match query.")
+
+    def test_malformed_persisted_query(self):
+        for persisted, message in [
+            ("x", "persistedQuery must be a JSON object."),
+            (["x"], "persistedQuery must be a JSON object."),
+            ({"version": 1, "sha256Hash": 123}, "Unsupported persisted query."),
+        ]:
+            with self.subTest(persisted=persisted):
+                response = self.client.post(
+                    "/graphql",
+                    json.dumps({"query": self.QUERY, "extensions": {"persistedQuery": persisted}}),
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["errors"][0]["message"], message)
+
+    def test_allowlist_manifest(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as manifest:
+            json.dump([self.QUERY], manifest)
+            manifest.flush()
+            with override_settings(CRM_PERSISTED_QUERY_MANIFEST=manifest.name,
+                                   CRM_PERSISTED_QUERY_ALLOWLIST_ONLY=True):
+                get_persisted_queries.cache_clear()
+                body = self.post({"extensions": self.persisted(query_hash(self.QUERY))})
+                self.assertEqual(len(body["data"]["products"]), 4)
+                body = self.post({"query": "{ customers { id } }"})
+                self.assertEqual(body["errors"][0]["message"],
+                                 "Query is not in the persisted query allowlist.")
+
+
+class ResponseCacheTests(CRMDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        get_document_cache().clear()
+        get_response_cache.cache_clear()
+
+    def post(self, query, variables=None):
+        payload = {"query": query, "variables": variables}
+        response = self.client.post("/graphql", json.dumps(payload), content_type="application/json")
+        return response.json()
+
+    def test_repeat_read_is_served_from_cache(self):
+        first = self.post("{ products { id name price stock } }")
+        with self.assertNumQueries(0):
+            second = self.post("{products{id name price stock}}")
+        self.assertEqual(first, second)
+        self.assertEqual(get_response_cache().stats(), {"hits": 1, "misses": 1})
+
+    def test_writes_invalidate_dependent_queries(self):
+        query = "{ orders { id totalAmount } products { id price } }"
+        self.post(query)
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.price = Decimal("11.00")
+        product.save()
+        body = self.post(query)
+        self.assertIn("11.00", [p["price"] for p in body["data"]["products"]])
+        self.assertIn("11.00", [o["totalAmount"] for o in body["data"]["orders"]])
+
+        restock_low_stock()  # queryset UPDATE, no signals
+        body = self.post("{ products { stock } }")
+        self.assertEqual([p["stock"] for p in body["data"]["products"]], [10, 11, 12, 13])
+        self.assertEqual(get_response_cache().stats()["hits"], 0)
+
+    def test_unrelated_writes_keep_entries(self):
+        self.post("{ products { name } }")
+        Customer.objects.create(name="New", email="new@example.com")
+        self.post("{ products { name } }")
+        self.assertEqual(get_response_cache().stats(), {"hits": 1, "misses": 1})
+
+    def test_variables_mutations_and_clock_dependent_fields(self):
+        page = "query ($n: Int) { allProducts(first: $n) { edges { node { id } } } }"
+        self.assertEqual(len(self.post(page, {"n": 1})["data"]["allProducts"]["edges"]), 1)
+        self.assertEqual(len(self.post(page, {"n": 2})["data"]["allProducts"]["edges"]), 2)
+        self.post("{ recentOrders { id } }")
+        self.post('mutation { createCustomer(name: "M", email: "m@example.com") { customer { id } } }')
+        self.assertEqual(get_response_cache().stats(), {"hits": 0, "misses": 2})
+
+
+class AsyncViewTests(CRMDataMixin, TransactionTestCase):
+    # Pool threads use their own connections, so the fixture must be committed.
+
+    def setUp(self):
+        cache.clear()
+        self.setUpTestData()
+        # Committed mutations buffer audit events; don't leave them for exit.
+        self.addCleanup(audit.get_audit_log().clear)
+
+    async def post(self, query):
+        response = await self.async_client.post(
+            "/graphql/async", {"query": query}, content_type="application/json"
+        )
+        return response.status_code, json.loads(response.content)
+
+    async def test_root_fields_resolve_concurrently(self):
+        # Each root field waits for the other one; serial execution would time out.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def search_queryset_together(queryset, value):
+            barrier.wait()
+            return search_queryset(queryset, value)
+
+        with mock.patch.object(crm_schema, "search_queryset", side_effect=search_queryset_together):
+            status, body = await self.post(
+                "{ customers { email orders { id } } products { name orders { id } } }"
+            )
+        self.assertEqual(status, 200)
+        self.assertNotIn("errors", body)
+        self.assertEqual(list(body["data"]), ["customers", "products"])
+        self.assertEqual(len(body["data"]["customers"][0]["orders"]), 2)
+        self.assertEqual(len(body["data"]["products"][0]["orders"]), 10)
+
+    async def test_errors_and_mutations(self):
+        status, body = await self.post("{ products { name } recentOrders(days: 0) { id } }")
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body["data"]["products"]), 4)
+        self.assertIsNone(body["data"]["recentOrders"])
+        self.assertEqual(body["errors"][0]["path"], ["recentOrders"])
+
+        status, body = await self.post(
+            'mutation { createCustomer(name: "Async", email: "async@example.com") { customer { email } } }'
+        )
+        self.assertEqual(body["data"]["createCustomer"]["customer"]["email"], "async@example.com")
+
+        status, body = await self.post("{ nope }")
+        self.assertEqual(status, 400)
+
+
+class QueryCostTests(CRMDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def cost(self, query):
+        document = parse(query)
+        return operation_cost(schema.graphql_schema, document, document.definitions[0])
+
+    def post(self, query, variables=None):
+        payload = {"query": query, "variables": variables}
+        response = self.client.post("/graphql", json.dumps(payload), content_type="application/json")
+        return response.status_code, response.json()
+
+    def test_static_cost(self):
+        self.assertEqual(self.cost("{ products { name } }").cost, 1)
+        # orders (1) + 100 x (customer (1) + products (1))
+        result = self.cost("{ orders { id customer { email } products { name } } }")
+        self.assertEqual((result.cost, result.depth), (201, 3))
+        # Connection: allOrders (1) + 5 x customer (1); edges/node are free.
+        result = self.cost("{ allOrders(first: 5) { edges { node { customer { email } } } } }")
+        self.assertEqual((result.cost, result.depth), (6, 5))
+        paged = "query ($n: Int = 7) { allOrders(first: $n) { edges { node { customer { id } } } } }"
+        self.assertEqual(self.cost(paged).cost, 8)
+        self.assertEqual(self.cost("{ __schema { types { fields { name } } } }").cost, 0)
+
+    def test_cost_is_reported_in_extensions(self):
+        status, body = self.post("{ orders { id customer { email } products { name } } }")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["extensions"]["cost"],
+                         {"requestedCost": 201, "maxCost": 10000, "depth": 3, "maxDepth": 10})
+
+    def test_expensive_and_deep_queries_are_rejected(self):
+        with self.assertNumQueries(0):
+            status, body = self.post(
+                "query Fanout { customers { orders { products { orders { id } } } } }"
+            )
+        self.assertEqual(status, 400)
+        self.assertEqual(body["errors"][0]["message"],
+                         "Operation 'Fanout' has cost 1010101, exceeding the budget of 10000.")
+        self.assertEqual(body["errors"][0]["extensions"]["code"], "QUERY_TOO_EXPENSIVE")
+
+        with override_settings(CRM_QUERY_MAX_DEPTH=2):
+            get_document_cache().clear()
+            status, body = self.post("{ orders { customer { email } } }")
+        self.assertEqual(status, 400)
+        self.assertEqual(body["errors"][0]["extensions"]["code"], "QUERY_TOO_DEEP")
+
+
+# ---------------- Tracing ----------------
+class TracingTests(CRMDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+
+    def post(self, query, trace=True, **extra):
+        if trace:
+            extra["HTTP_X_CRM_TRACE"] = "1"
+        response = self.client.post(
+            "/graphql", json.dumps({"query": query}), content_type="application/json", **extra
+        )
+        return response.json()
+
+    @override_settings(CRM_TRACING_EXTENSIONS=True)
+    def test_trace_extensions(self):
+        body = self.post("{ orders { id customer { email } products { name } } }")
+        extensions = body["extensions"]
+        self.assertIn("cost", extensions)
+        resolvers = {tuple(entry["path"]): entry for entry in extensions["tracing"]["execution"]["resolvers"]}
+        self.assertEqual(resolvers[("orders",)]["sqlCount"], 2)
+        self.assertEqual(resolvers[("orders", 0, "customer")]["fieldName"], "customer")
+        self.assertEqual(extensions["sql"]["count"], 2)
+        self.assertEqual(extensions["nPlusOne"], [])
+
+    def test_trace_requires_opt_in(self):
+        with override_settings(CRM_TRACING_EXTENSIONS=False):
+            body = self.post("{ products { name } }")
+        self.assertNotIn("tracing", body["extensions"])
+        with override_settings(CRM_TRACING_EXTENSIONS=True):
+            body = self.post("{ products { name } }", trace=False)
+        self.assertNotIn("tracing", body["extensions"])
+
+    def test_n_plus_one_detection(self):
+        tracer = tracing.Tracer(detailed=True)
+        for index in range(3):
+            path = ["orders", index, "customer"]
+            token = tracing._current_path.set(path)
+            tracer.add_query('SELECT * FROM "crm_customer" WHERE "id" = %s', 0.001)
+            tracing._current_path.reset(token)
+            info = mock.Mock(parent_type=mock.Mock(), field_name="customer", return_type="CustomerType")
+            info.parent_type.name = "OrderType"
+            info.path.as_list.return_value = path
+            tracer.add_resolver(info, tracer.start, tracer.start)
+        tracer.add_query('SELECT * FROM "crm_product" WHERE "id" IN (%s, %s)', 0.001)
+        result = tracer.finish("query")
+        self.assertEqual(result["nPlusOne"], [{
+            "path": "orders.*.customer",
+            "field": "OrderType.customer",
+            "sql": 'SELECT * FROM "crm_customer" WHERE "id" = %s',
+            "count": 3,
+        }])
+        self.assertEqual(result["sql"]["deferredCount"], 1)
+        self.assertEqual(registry.value("crm_graphql_n_plus_one_total", field="OrderType.customer"), 1)
+
+    def test_metrics_endpoint(self):
+        self.post("{ products { name } }", trace=False)
+        self.post('mutation { createCustomer(name: "Eve", email: "eve@example.com") { customer { id } } }',
+                  trace=False)
+        self.assertEqual(registry.value("crm_graphql_requests_total", operation="query"), 1)
+        self.assertEqual(registry.value("crm_graphql_requests_total", operation="mutation"), 1)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('crm_graphql_requests_total{operation="query"} 1', text)
+        self.assertIn('crm_graphql_sql_queries_total{field="Query.products"} 1', text)
+        self.assertIn("# TYPE crm_graphql_resolver_duration_seconds summary", text)
+        self.assertIn("crm_response_cache_misses_total", text)
+
+    def test_metrics_endpoint_access(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.5").status_code, 403)
+        with override_settings(CRM_METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.client.force_login(User.objects.create_user("ops", password="x", is_staff=True))
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+# ---------------- Reporting ----------------
+class CRMStatsTests(CRMDataMixin, TestCase):
+    def test_totals_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats = crm_stats()
+        self.assertEqual(stats["customer_count"], 5)
+        self.assertEqual(stats["order_count"], 10)
+        self.assertEqual(stats["revenue"], Decimal("440.00"))
+
+    def test_empty_range(self):
+        stats = crm_stats(date_from=timezone.now() + timedelta(days=1))
+        self.assertEqual((stats["customer_count"], stats["order_count"], stats["revenue"]),
+                         (0, 0, Decimal("0")))
+
+    def test_graphql_group_by(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(order_date=timezone.now() - timedelta(days=3))
+        result = run_query("""
+            { crmStats(groupBy: DAY) { orderCount revenue groups { key orderCount customerCount revenue } } }
+        """)
+        self.assertIsNone(result.errors)
+        stats = result.data["crmStats"]
+        self.assertEqual(stats["orderCount"], 10)
+        self.assertEqual([g["orderCount"] for g in stats["groups"]], [1, 9])
+        self.assertEqual(stats["groups"][0]["revenue"], "10.00")
+
+        result = run_query("{ crmStats(groupBy: CUSTOMER) { groups { key orderCount } } }")
+        groups = result.data["crmStats"]["groups"]
+        self.assertEqual(groups[0], {"key": str(self.customers[0].pk), "orderCount": 2})
+
+    def test_report_task_uses_orm(self):
+        with tempfile.NamedTemporaryFile("r", suffix=".txt") as log, \
+                mock.patch("crm.tasks.LOG_FILE", log.name):
+            message = generate_crm_report()
+            self.assertIn("Report: 5 customers, 10 orders, 440.00 revenue", message)
+            self.assertIn(message, log.read())
+
+
+class SalesRollupTests(CRMDataMixin, TestCase):
+    def rollup(self, day=None, **lookup):
+        row = DailySalesRollup.objects.get(day=day or day_of(timezone.now()), **lookup)
+        return row.order_count, row.revenue
+
+    def test_signals_keep_buckets_current(self):
+        self.assertEqual(self.rollup(customer=None, product=None), (10, Decimal("440.00")))
+        self.assertEqual(self.rollup(customer=self.customers[0]), (2, Decimal("40.00")))
+        self.assertEqual(self.rollup(product=self.products[3]), (2, Decimal("80.00")))
+
+        self.orders[3].products.remove(self.products[3])
+        self.assertEqual(self.rollup(product=self.products[3]), (1, Decimal("40.00")))
+        self.assertEqual(self.rollup(customer=self.customers[3]), (2, Decimal("70.00")))
+
+        self.products[3].orders.clear()
+        self.assertFalse(DailySalesRollup.objects.filter(product=self.products[3]).exists())
+        self.assertEqual(self.rollup(customer=None, product=None), (10, Decimal("360.00")))
+
+    def test_redated_and_deleted_orders_leave_their_buckets(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        order = Order.objects.get(pk=self.orders[0].pk)
+        order.order_date = yesterday
+        order.save()
+        self.assertEqual(self.rollup(customer=self.customers[0]), (1, Decimal("30.00")))
+        self.assertEqual(self.rollup(customer=self.customers[0], day=day_of(yesterday)),
+                         (1, Decimal("10.00")))
+
+        order.delete()
+        self.assertFalse(DailySalesRollup.objects.filter(day=day_of(yesterday)).exists())
+
+    def test_order_writes_apply_deltas_without_aggregating(self):
+        with mock.patch("crm.rollups.refresh_rollups") as refresh, \
+                CaptureQueriesContext(connection) as queries:
+            order = Order.objects.create(customer=self.customers[1])
+            order.products.set(self.products[:2])
+        refresh.assert_not_called()
+        # Two upserts on create; the link upsert and one UPDATE on set().
+        self.assertEqual(len([q for q in queries if "crm_dailysalesrollup" in q["sql"]]), 4)
+        self.assertEqual(self.rollup(customer=self.customers[1]), (3, Decimal("120.00")))
+        self.assertEqual(self.rollup(product=self.products[1]), (8, Decimal("160.00")))
+
+    def test_incremental_rollups_match_a_recompute(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        order = Order.objects.get(pk=self.orders[5].pk)
+        order.customer = self.customers[2]
+        order.save()
+        order.products.remove(self.products[0], self.products[3])
+        order.order_date = yesterday
+        order.save()
+        order.products.add(self.products[2])
+        self.products[1].orders.remove(*self.orders[:4])
+        self.products[2].orders.add(self.orders[0])
+        self.orders[7].products.clear()
+        self.orders[8].delete()
+        self.customers[4].delete()
+
+        def snapshot():
+            return list(DailySalesRollup.objects.order_by("day", "customer", "product").values_list(
+                "day", "customer", "product", "order_count", "revenue"
+            ))
+
+        incremental = snapshot()
+        backfill_sales_rollups()
+        self.assertEqual(incremental, snapshot())
+
+    def test_bulk_create_applies_deltas(self):
+        Product.objects.filter(pk=self.products[0].pk).update(stock=3)
+        rows = [{"customer_id": self.customers[4].pk, "product_ids": [self.products[0].pk]}] * 3
+        orders, errors = bulk_create_orders(rows)
+        self.assertEqual((len(orders), errors), (3, []))
+        self.assertEqual(self.rollup(customer=self.customers[4]), (5, Decimal("70.00")))
+        self.assertEqual(self.rollup(product=self.products[0]), (13, Decimal("130.00")))
+
+    def test_backfill_task_repairs_ranges(self):
+        last_week = timezone.now() - timedelta(days=7)
+        Order.objects.filter(pk__in=[o.pk for o in self.orders[:4]]).update(order_date=last_week)
+        DailySalesRollup.objects.all().delete()
+
+        backfill_sales_rollups(chunk_days=2)
+        days = rollups_queryset(day_of(last_week), day_of(timezone.now()) + timedelta(days=1))
+        self.assertEqual([(r.order_count, r.revenue) for r in days],
+                         [(4, Decimal("200.00")), (6, Decimal("240.00"))])
+
+        DailySalesRollup.objects.all().delete()
+        start = day_of(last_week).isoformat()
+        backfill_sales_rollups(start, (day_of(last_week) + timedelta(days=1)).isoformat())
+        self.assertEqual(DailySalesRollup.objects.filter(customer=None, product=None).count(), 1)
+
+    def test_graphql_sales_rollups(self):
+        today = day_of(timezone.now())
+        with self.assertNumQueries(1):
+            result = run_query(
+                """
+                query ($from: Date!, $to: Date!) {
+                  salesRollups(dateFrom: $from, dateTo: $to, dimension: CUSTOMER) {
+                    day customer { email } orderCount revenue
+                  }
+                }
+                """,
+                {"from": today.isoformat(), "to": (today + timedelta(days=1)).isoformat()},
+            )
+        self.assertIsNone(result.errors)
+        rows = result.data["salesRollups"]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0], {"day": today.isoformat(), "customer": {"email": "c0@example.com"},
+                                   "orderCount": 2, "revenue": "40.00"})
+
+        result = run_query(
+            "query ($d: Date!) { salesRollups(dateFrom: $d, dateTo: $d, dimension: PRODUCT) { day } }",
+            {"d": today.isoformat()},
+        )
+        self.assertEqual(result.data["salesRollups"], [])
+
+
+class DataGeneratorTests(TestCase):
+    END = datetime(2024, 6, 1, tzinfo=dt_timezone.utc)
+
+    def snapshot(self):
+        return (
+            list(Customer.objects.order_by("pk").values_list("pk", "name", "email", "phone")),
+            list(Product.objects.order_by("pk").values_list("pk", "price", "stock")),
+            list(Order.objects.order_by("pk").values_list("pk", "customer_id", "order_date", "total_amount")),
+            list(Order.products.through.objects.order_by("order_id", "product_id")
+                 .values_list("order_id", "product_id")),
+        )
+
+    def generate(self, seed):
+        return generate_dataset(customers=30, products=10, orders=200, seed=seed, end=self.END, chunk_size=64)
+
+    def test_deterministic_per_seed(self):
+        counts = self.generate(seed=7)
+        first = self.snapshot()
+        self.assertEqual(len(first[2]), 200)
+        self.assertEqual(counts["order_products"], len(first[3]))
+        Customer.objects.all().delete()
+        Product.objects.all().delete()
+        self.generate(seed=7)
+        self.assertEqual(self.snapshot(), first)
+        Customer.objects.all().delete()
+        Product.objects.all().delete()
+        self.generate(seed=8)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_derived_data_is_consistent(self):
+        self.generate(seed=1)
+        totals = {order.pk: order.total_amount for order in Order.objects.all()}
+        Order.objects.all().refresh_totals()
+        self.assertEqual({order.pk: order.total_amount for order in Order.objects.all()}, totals)
+        self.assertEqual(
+            rollups_queryset(date(2023, 1, 1), date(2025, 1, 1)).aggregate(n=Sum("order_count"))["n"], 200
+        )
+        self.assertEqual(search_queryset(Customer.objects.all(), "customer1@").count(), 1)
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_dataset(customers=20, products=5, orders=50, seed=0)
+
+    def test_run_and_compare(self):
+        results = run_benchmarks(["nested_orders", "create_customer"], iterations=2, warmup=0)
+        nested = results["scenarios"]["nested_orders"]
+        self.assertEqual(nested["queries"], 2)
+        self.assertLessEqual(nested["p50_ms"], nested["p99_ms"])
+        self.assertEqual(results["dataset"], {"customers": 20, "products": 5, "orders": 50})
+        # Scenarios roll back their writes.
+        self.assertEqual(Customer.objects.count(), 20)
+        self.assertEqual(compare(results, results), [])
+
+        slower = json.loads(json.dumps(results))
+        slower["scenarios"]["nested_orders"]["queries"] += 1
+        slower["scenarios"]["create_customer"]["p95_ms"] += 1000
+        self.assertEqual(len(compare(slower, results)), 2)
+
+    def test_command_requires_a_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            args = ["run_benchmarks", "--scenario", "list_products", "--iterations", "1", "--baseline", path]
+            with self.assertRaisesMessage(CommandError, "No baseline"):
+                call_command(*args, stdout=StringIO())
+            call_command(*args, "--update-baseline", stdout=StringIO())
+            call_command(*args, stdout=StringIO())
+
+
+class GraphQLClientTests(CRMDataMixin, TestCase):
+    def tearDown(self):
+        graphql_client.reset_client()
+
+    def test_local_mode_inside_django(self):
+        self.assertEqual(graphql_client.get_mode(), graphql_client.MODE_LOCAL)
+        with self.assertNumQueries(1):
+            data = graphql_client.execute("query ($days: Int!) { recentOrders(days: $days) { id } }", {"days": 30})
+        self.assertEqual(len(data["recentOrders"]), Order.objects.count())
+        with self.assertRaises(TransportQueryError):
+            graphql_client.execute("{ recentOrders(days: 0) { id } }")
+
+    @override_settings(CRM_GRAPHQL_CLIENT_MODE="http", CRM_GRAPHQL_POOL_SIZE=4)
+    def test_http_client_reuses_session_and_cached_schema(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".graphql", delete=False) as f:
+            f.write(print_schema(schema.graphql_schema))
+        self.addCleanup(os.unlink, f.name)
+
+        with override_settings(CRM_GRAPHQL_SCHEMA_FILE=f.name), \
+                mock.patch.object(RequestsHTTPTransport, "execute",
+                                  return_value=ExecutionResult(data={"__typename": "Query"})) as transport_execute:
+            client = graphql_client.get_client()
+            self.assertIsInstance(client, graphql_client.HTTPClient)
+            self.assertEqual(graphql_client.execute("{ __typename }"), {"__typename": "Query"})
+            session = client._client.transport.session
+            graphql_client.execute("{ __typename }")
+            self.assertIs(client._client.transport.session, session)
+            self.assertEqual(session.get_adapter("http://example.com")._pool_maxsize, 4)
+            # Validated against the cached schema, never sent.
+            with self.assertRaises(GraphQLError):
+                graphql_client.execute("{ noSuchField }")
+        self.assertEqual(transport_execute.call_count, 2)
+
+    @override_settings(CRM_GRAPHQL_CLIENT_MODE="http", CRM_GRAPHQL_RETRIES=2)
+    def test_http_client_retries_only_queries(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".graphql", delete=False) as f:
+            f.write(print_schema(schema.graphql_schema))
+        self.addCleanup(os.unlink, f.name)
+        bad_gateway = TransportServerError("Bad Gateway", 502)
+        ok = ExecutionResult(data={"__typename": "Query"})
+
+        with override_settings(CRM_GRAPHQL_SCHEMA_FILE=f.name), \
+                mock.patch("crm.graphql_client.time.sleep"), \
+                mock.patch.object(RequestsHTTPTransport, "execute", side_effect=[bad_gateway, ok]) as transport_execute:
+            client = graphql_client.get_client()
+            self.assertEqual(graphql_client.execute("{ __typename }"), {"__typename": "Query"})
+            self.assertEqual(transport_execute.call_count, 2)
+            # POSTs are never retried by the adapter once sent.
+            retry = client._client.transport.session.get_adapter("http://example.com").max_retries
+            self.assertNotIn("POST", retry.allowed_methods)
+
+            transport_execute.side_effect = [bad_gateway, ok]
+            transport_execute.reset_mock()
+            with self.assertRaises(TransportServerError):
+                graphql_client.execute("mutation { updateLowStockProducts { message } }")
+            self.assertEqual(transport_execute.call_count, 1)
+
+
+class BatchRequestTests(CRMDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post(self, payload, path="/graphql"):
+        response = self.client.post(path, json.dumps(payload), content_type="application/json")
+        return response.status_code, response.json()
+
+    def test_batch_runs_operations_in_order(self):
+        status, body = self.post([
+            {"query": "{ customers { email } }", "id": "a"},
+            {"query": "query ($d: Int!) { recentOrders(days: $d) { id } }", "variables": {"d": 30}},
+            {"query": "{ products { name } }"},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual([entry["id"] for entry in body], ["a", None, None])
+        self.assertEqual(len(body[0]["data"]["customers"]), Customer.objects.count())
+        self.assertEqual(len(body[1]["data"]["recentOrders"]), Order.objects.count())
+        self.assertEqual(len(body[2]["data"]["products"]), Product.objects.count())
+
+    def test_batch_shares_loaders_until_a_mutation(self):
+        customer = Customer.objects.first()
+        contexts = []
+        execute_prepared = CRMGraphQLView.execute_prepared
+
+        def spy(view, request, prepared, *args):
+            # Stand in for a resolver that uses the request's loaders.
+            loaders = get_loaders(mock.Mock(context=request))
+            contexts.append((request, loaders))
+            return execute_prepared(view, request, prepared, *args)
+
+        with mock.patch.object(CRMGraphQLView, "execute_prepared", spy):
+            status, body = self.post([
+                {"query": "{ customers { name } }"},
+                {"query": "{ products { name } }"},
+                {"query": f'mutation {{ updateCustomer(id: {customer.pk}, name: "Renamed") {{ customer {{ name }} }} }}'},
+                {"query": "{ customers { name } }"},
+            ])
+        self.assertEqual(status, 200)
+        self.assertIn("Renamed", [c["name"] for c in body[3]["data"]["customers"]])
+        self.assertEqual(len({id(request) for request, _ in contexts}), 1)
+        loaders = [id(loaders) for _, loaders in contexts]
+        self.assertEqual(loaders[0], loaders[1])
+        self.assertEqual(loaders[1], loaders[2])
+        self.assertNotEqual(loaders[2], loaders[3])
+
+    def test_batch_limits(self):
+        with override_settings(CRM_GRAPHQL_MAX_BATCH_SIZE=2):
+            status, body = self.post([{"query": "{ products { name } }"}] * 3)
+        self.assertEqual(status, 400)
+        self.assertEqual(body["errors"][0]["message"], "Batch of 3 operations exceeds the limit of 2.")
+        status, _ = self.post([])
+        self.assertEqual(status, 400)
+        status, _ = self.post(["{ products { name } }"])
+        self.assertEqual(status, 400)
+
+    def test_batch_cost_is_summed(self):
+        query = "{ products { name } }"
+        cost = operation_cost(schema.graphql_schema, parse(query), parse(query).definitions[0]).cost
+        mutation = 'mutation { createCustomer(name: "B", email: "b@example.com") { customer { id } } }'
+        with override_settings(CRM_QUERY_MAX_COST=cost * 2):
+            status, body = self.post([{"query": mutation}, {"query": query}, {"query": query}])
+            self.assertEqual(status, 400)
+            self.assertIn(f"exceeding the budget of {cost * 2}", body["errors"][0]["message"])
+            self.assertFalse(Customer.objects.filter(email="b@example.com").exists())
+
+            status, body = self.post([{"query": query}, {"query": query}])
+            self.assertEqual(status, 200)
+
+    def test_failed_operation_gets_its_own_status(self):
+        status, body = self.post([{"query": "{ products { name } }"}, {"query": "{ nope }"}])
+        self.assertEqual(status, 400)
+        self.assertEqual([entry["status"] for entry in body], [200, 400])
+        self.assertIn("data", body[0])
+
+    def test_local_client_batch(self):
+        first, second = graphql_client.LocalClient().execute_batch([
+            ("{ products { name } }", None),
+            ("query ($d: Int!) { recentOrders(days: $d) { id } }", {"d": 30}),
+        ])
+        self.assertEqual(len(first["products"]), Product.objects.count())
+        self.assertEqual(len(second["recentOrders"]), Order.objects.count())
+
+
+class ExportTests(CRMDataMixin, TestCase):
+    def setUp(self):
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+
+    def export(self, kind, **params):
+        response = self.client.get(f"/export/{kind}", params)
+        return response, b"".join(response.streaming_content) if response.streaming else response.content
+
+    def test_orders_ndjson(self):
+        with self.assertNumQueries(2 + 2):  # session/user + orders + one product query per chunk
+            response, content = self.export("orders")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row["id"] for row in rows], sorted(o.pk for o in self.orders))
+        first = self.orders[0]
+        self.assertEqual(rows[0]["customer_email"], first.customer.email)
+        self.assertEqual([p["id"] for p in rows[0]["products"]], sorted(p.pk for p in first.products.all()))
+
+    def test_orders_chunking(self):
+        # One orders query, then one product query per chunk of two orders.
+        with self.assertNumQueries(1 + len(self.orders) // 2):
+            content = b"".join(stream_export("orders", chunk_size=2))
+        self.assertEqual(len(content.decode().splitlines()), len(self.orders))
+
+    def test_customers_csv_with_filters(self):
+        customer = self.customers[0]
+        response, content = self.export("customers", format="csv", email=customer.email)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(rows[0], ["id", "name", "email", "phone", "created_at"])
+        self.assertEqual([row[2] for row in rows[1:]], [customer.email])
+
+    def test_gzip(self):
+        response = self.client.get("/export/orders", {"format": "csv"}, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        rows = list(csv.reader(gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()))
+        self.assertEqual(rows[0][-1], "product_ids")
+        self.assertEqual(len(rows), len(self.orders) + 1)
+
+        response = self.client.get("/export/orders", HTTP_ACCEPT_ENCODING="gzip;q=0, deflate")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_accept_encoding(self):
+        for header, expected in [
+            ("gzip", True), ("deflate, gzip;q=0.5", True), ("*", True), ("br, *;q=0.1", True),
+            ("", False), ("deflate", False), ("gzip;q=0", False), ("gzip; q=0.0, *", False),
+            ("*;q=0", False), ("identity, GZIP", True),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(accepts_gzip(header), expected)
+
+    def test_errors(self):
+        response, content = self.export("orders", order_date__gte="not a date")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("order_date__gte", json.loads(content)["errors"][0])
+        self.assertEqual(self.client.get("/export/invoices").status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get("/export/orders").status_code, 403)
+
+    def test_management_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "orders.ndjson.gz")
+            call_command("export_crm_data", "orders", "--output", path, "--chunk-size", "3",
+                         "--filter", f"customer_name={self.customers[0].name}", stdout=StringIO())
+            with gzip.open(path, "rt") as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual({row["customer_id"] for row in rows}, {self.customers[0].pk})
+
+    @override_settings(CRM_EXPORT_CHUNK_SIZE=4)
+    def test_management_command_chunk_size_setting(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch("crm.export.get_chunk_size", wraps=get_chunk_size) as chunk_size:
+            call_command("export_crm_data", "customers", "--output", os.path.join(directory, "c.ndjson"),
+                         stdout=StringIO())
+        chunk_size.assert_called_once()
+
+
+class ReminderTests(CRMDataMixin, TestCase):
+    def setUp(self):
+        log = tempfile.NamedTemporaryFile("r", suffix=".txt")
+        self.addCleanup(log.close)
+        patcher = mock.patch("crm.reminders.REMINDER_LOG_FILE", log.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.log = log
+
+    def logged(self):
+        self.log.seek(0)
+        return self.log.read().splitlines()
+
+    def test_due_time_set_on_create(self):
+        order = self.orders[0]
+        self.assertEqual(order.reminder_due_at, order.order_date + timedelta(days=1))
+        self.assertIsNone(order.reminder_sent_at)
+        Product.objects.filter(pk=self.products[0].pk).update(stock=1)
+        moment = timezone.now() - timedelta(days=3)
+        created, errors = bulk_create_orders(
+            [{"customer_id": self.customers[0].pk, "product_ids": [self.products[0].pk], "order_date": moment}]
+        )
+        self.assertEqual(errors, [])
+        self.assertEqual(Order.objects.get(pk=created[0].pk).reminder_due_at, moment + timedelta(days=1))
+
+    @override_settings(CRM_ORDER_REMINDER_QUEUE=True)
+    def test_creation_queues_task_with_eta(self):
+        customer = self.customers[0]
+        with mock.patch.object(send_order_reminders, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.create(customer=customer)
+                apply_async.assert_not_called()  # only once the order is committed
+        apply_async.assert_called_once_with(
+            (customer.pk, order.reminder_due_at.isoformat()), eta=order.reminder_due_at, retry=False
+        )
+
+    @override_settings(CRM_ORDER_REMINDER_QUEUE=False)
+    def test_queueing_disabled(self):
+        with mock.patch.object(send_order_reminders, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                Order.objects.create(customer=self.customers[0])
+        apply_async.assert_not_called()
+
+    @override_settings(
+        CRM_ORDER_REMINDER_QUEUE=True, CRM_ORDER_REMINDER_DELAY=0, CELERY_TASK_ALWAYS_EAGER=True
+    )
+    def test_eager_pipeline_batches_per_customer(self):
+        customer = self.customers[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Order.objects.create(customer=customer, order_date=timezone.now() - timedelta(minutes=5))
+            second = Order.objects.create(customer=customer)
+        # Two tasks ran; the first sent both orders, the second found nothing left.
+        lines = self.logged()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith(f"Reminder to {customer.email} - Orders {first.pk}, {second.pk}"))
+        self.assertEqual(
+            Order.objects.filter(pk__in=[first.pk, second.pk], reminder_sent_at__isnull=False).count(), 2
+        )
+
+    def test_sweep_sends_each_order_once(self):
+        Order.objects.filter(pk__in=[o.pk for o in self.orders[:6]]).update(
+            reminder_due_at=timezone.now() - timedelta(hours=2)
+        )
+        self.assertEqual(sweep_order_reminders(), 6)
+        lines = self.logged()
+        # Customers 0 and 1 have two due orders each, sent as one reminder.
+        self.assertEqual(len(lines), 5)
+        self.assertIn(f"Orders {self.orders[0].pk}, {self.orders[5].pk}", lines[0])
+
+        self.assertEqual(sweep_order_reminders(), 0)
+        self.assertEqual(send_order_reminders(self.customers[0].pk), 0)
+        self.assertEqual(len(self.logged()), 5)
+        self.assertEqual(Order.objects.filter(reminder_sent_at__isnull=False).count(), 6)
+
+    def test_sweep_waits_for_due_orders(self):
+        now = timezone.now()
+        first, second, third = self.orders[0], self.orders[5], self.orders[1]
+        Order.objects.filter(pk__in=[o.pk for o in self.orders]).update(reminder_due_at=now + timedelta(days=2))
+        Order.objects.filter(pk__in=[second.pk, third.pk]).update(reminder_due_at=now + timedelta(minutes=50))
+        self.assertEqual(sweep_order_reminders(), 0)
+        self.assertEqual(send_order_reminders(third.customer_id), 0)
+        self.assertEqual(self.logged(), [])
+
+        # Once one of the customer's orders is due, the window pulls in the other.
+        Order.objects.filter(pk=first.pk).update(reminder_due_at=now - timedelta(minutes=1))
+        self.assertEqual(sweep_order_reminders(), 2)
+        self.assertIn(f"Orders {first.pk}, {second.pk}", self.logged()[0])
+        self.assertIsNone(Order.objects.get(pk=third.pk).reminder_sent_at)
+
+    def test_delivery_after_claim_commits(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(reminder_due_at=timezone.now())
+        with mock.patch("crm.reminders.deliver", side_effect=OSError("mail down")) as deliver, \
+                self.assertLogs("crm.reminders", "ERROR"):
+            self.assertEqual(sweep_order_reminders(), 1)
+        deliver.assert_called_once()
+        # Claimed all the same: a failed delivery is never repeated.
+        self.assertIsNotNone(Order.objects.get(pk=self.orders[0].pk).reminder_sent_at)
+        self.assertEqual(sweep_order_reminders(), 0)
+
+    def test_sweep_uses_partial_index(self):
+        plan = pending_reminders(timezone.now()).explain()
+        self.assertIn("INDEX crm_order_reminder_due_idx", plan)
+        self.assertNotRegex(plan, r"SCAN crm_order\b")
+
+
+class DatabaseProfileTests(TestCase):
+    def test_settings_from_environment(self):
+        databases = database_settings("/srv/crm", {})
+        self.assertEqual(set(databases), {"default"})
+        self.assertEqual(str(databases["default"]["NAME"]), "/srv/crm/db.sqlite3")
+        self.assertEqual(databases["default"]["CONN_MAX_AGE"], 600)
+        self.assertTrue(databases["default"]["CONN_HEALTH_CHECKS"])
+
+        databases = database_settings("/srv/crm", {"CRM_DATABASE_READ_ONLY": "1"})
+        self.assertEqual(databases["replica"]["NAME"], "file:///srv/crm/db.sqlite3?mode=ro")
+        self.assertEqual(databases["replica"]["TEST"], {"MIRROR": "default"})
+
+        databases = database_settings("/srv/crm", {
+            "CRM_DATABASE_PATH": "/data/primary.sqlite3",
+            "CRM_DATABASE_READ_PATH": "/data/replica.sqlite3",
+            "CRM_DATABASE_CONN_MAX_AGE": "0",
+        })
+        self.assertEqual(databases["default"]["NAME"], "/data/primary.sqlite3")
+        self.assertEqual(databases["replica"]["NAME"], "/data/replica.sqlite3")
+        self.assertFalse(databases["replica"]["CONN_HEALTH_CHECKS"])
+
+    def test_pragmas_on_connect(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "crm.sqlite3")
+            settings_dict = dict(connection.settings_dict, TEST={})
+            primary = DatabaseWrapper(dict(settings_dict, NAME=path), alias="profile")
+            replica = DatabaseWrapper(
+                dict(settings_dict, **database_settings(directory, {
+                    "CRM_DATABASE_PATH": path, "CRM_DATABASE_READ_ONLY": "1",
+                })["replica"]),
+                alias="profile_replica",
+            )
+            try:
+                with primary.cursor() as cursor:
+                    pragmas = [
+                        cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                        for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size")
+                    ]
+                    cursor.execute("CREATE TABLE t (x INTEGER)")
+                    cursor.execute("INSERT INTO t VALUES (1)")
+                self.assertEqual(pragmas, ["wal", 1, 5000, 256 * 1024 * 1024])
+                with replica.cursor() as cursor:
+                    self.assertEqual(cursor.execute("SELECT x FROM t").fetchall(), [(1,)])
+                    self.assertEqual(cursor.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+                    with self.assertRaisesMessage(OperationalError, "readonly"):
+                        cursor.execute("INSERT INTO t VALUES (2)")
+            finally:
+                primary.close()
+                replica.close()
+
+    @override_settings(CRM_READ_DATABASE="replica")
+    def test_router(self):
+        router = ReadReplicaRouter()
+        self.assertIsNone(router.db_for_read(Customer))
+        with read_database():
+            self.assertEqual(router.db_for_read(Customer), "replica")
+            with read_database(False):
+                self.assertIsNone(router.db_for_read(Customer))
+            self.assertEqual(router.db_for_write(Customer), "default")
+        self.assertFalse(router.allow_migrate("replica", "crm"))
+        self.assertTrue(router.allow_migrate("default", "crm"))
+        with override_settings(CRM_READ_DATABASE=None), read_database():
+            self.assertIsNone(router.db_for_read(Customer))
+
+    def test_view_routes_only_queries_to_read_database(self):
+        routed = []
+
+        @contextmanager
+        def spy(active=True):
+            routed.append(active)
+            with read_database(active):
+                yield
+
+        with mock.patch("crm.views.read_database", spy):
+            for query in (
+                "{ customers { id } }",
+                'mutation { createCustomer(name: "R", email: "r@example.com") { customer { id } } }',
+            ):
+                response = self.client.post("/graphql", {"query": query}, content_type="application/json")
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(routed, [True, False])
+
+        # A batch reads from the primary once a mutation has written to it.
+        routed.clear()
+        with mock.patch("crm.views.read_database", spy):
+            response = self.client.post("/graphql", [
+                {"query": "{ customers { id } }"},
+                {"query": 'mutation { createCustomer(name: "B", email: "b@example.com") { customer { id } } }'},
+                {"query": "{ customers { email } }"},
+            ], content_type="application/json")
+        self.assertIn("b@example.com", [c["email"] for c in response.json()[2]["data"]["customers"]])
+        self.assertEqual(routed, [True, False, False])
+
+    def test_replica_reads_are_not_cached(self):
+        cache.clear()
+        get_response_cache.cache_clear()
+        query = {"query": "{ products { name } }"}
+        with mock.patch("crm.views.get_read_alias", return_value="replica"):
+            self.client.post("/graphql", query, content_type="application/json")
+            self.client.post("/graphql", query, content_type="application/json")
+        self.assertEqual(get_response_cache().stats(), {"hits": 0, "misses": 2})
+        self.client.post("/graphql", query, content_type="application/json")
+        self.client.post("/graphql", query, content_type="application/json")
+        self.assertEqual(get_response_cache().stats(), {"hits": 1, "misses": 3})
+
+
+# ---------------- Audit log ----------------
+class AuditTests(CRMDataMixin, TestCase):
+    def setUp(self):
+        self.audit_log = audit.get_audit_log()
+        self.audit_log.clear()
+        self.addCleanup(self.audit_log.clear)
+
+    def mutate(self, query, variables=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = run_query(query, variables)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_mutation_buffers_without_writing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.mutate('mutation { createCustomer(name: "New", email: "new@example.com") { customer { id } } }')
+        self.assertFalse([q for q in queries if "crm_auditevent" in q["sql"]])
+        self.assertEqual(len(self.audit_log), 1)
+        self.assertFalse(AuditEvent.objects.exists())
+
+        self.assertEqual(self.audit_log.flush(), 1)
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.actor, event.action, event.target_type), ("anonymous", "createCustomer", "Customer"))
+        self.assertEqual(event.target_id, str(Customer.objects.get(email="new@example.com").pk))
+        self.assertEqual(event.changes, {"email": [None, "new@example.com"], "name": [None, "New"]})
+
+    def test_update_records_diff(self):
+        customer = self.customers[0]
+        self.mutate(
+            "mutation ($id: ID!) { updateCustomer(id: $id, name: \"Renamed\") { customer { id } } }",
+            {"id": customer.pk},
+        )
+        self.audit_log.flush()
+        event = AuditEvent.objects.get()
+        self.assertEqual(event.changes, {"name": [customer.name, "Renamed"]})
+
+    def test_delete_and_restock(self):
+        customer = self.customers[4]
+        RestockPolicy.objects.create(product=self.products[0], threshold=5, increment=7)
+        self.mutate("mutation ($id: ID!) { deleteCustomer(id: $id) { ok } }", {"id": customer.pk})
+        self.mutate("mutation { updateLowStockProducts(increment: 3) { message } }")
+        self.audit_log.flush()
+
+        deleted = AuditEvent.objects.get(action="deleteCustomer")
+        self.assertEqual(deleted.target_id, str(customer.pk))
+        self.assertEqual(deleted.changes["email"], [customer.email, None])
+        restocked = {
+            e.target_id: e.changes["stock"]
+            for e in AuditEvent.objects.filter(action="updateLowStockProducts")
+        }
+        self.assertEqual(restocked[str(self.products[0].pk)], [0, 7])
+        self.assertEqual(restocked[str(self.products[1].pk)], [1, 4])
+
+    def test_rolled_back_mutation_not_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = run_query(
+                "mutation ($id: ID!) { updateCustomer(id: $id, name: \"X\") { customer { id } } }",
+                {"id": 0},
+            )
+        self.assertTrue(result.errors)
+        self.assertEqual(len(self.audit_log), 0)
+
+    def test_flush_thresholds(self):
+        audit_log = audit.AuditLog(buffer_size=10, flush_size=3, flush_interval=60)
+        make = lambda i: AuditEvent(created_at=timezone.now(), actor="a", action="x", target_type="T", target_id=str(i))
+        audit_log.append(make(1))
+        audit_log.append(make(2))
+        self.assertEqual(audit_log.flush_if_due(), 0)
+        audit_log.append(make(3))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(audit_log.flush_if_due(), 3)
+        self.assertEqual([q["sql"].split()[0] for q in queries].count("INSERT"), 1)
+        self.assertEqual(AuditEvent.objects.count(), 3)
+
+        audit_log.append(make(4))
+        with mock.patch("crm.audit.time.monotonic", return_value=audit_log._oldest + 60):
+            self.assertEqual(audit_log.flush_if_due(), 1)
+
+    def test_timer_flushes_an_idle_buffer(self):
+        audit_log = audit.AuditLog(buffer_size=10, flush_size=10, flush_interval=0.01)
+        flushed = threading.Event()
+        with mock.patch.object(audit_log, "flush_if_due", side_effect=flushed.set):
+            audit_log.append(AuditEvent(created_at=timezone.now(), actor="a", action="x", target_type="T"))
+            # No request or task finishes, yet the interval still holds.
+            self.assertTrue(flushed.wait(5))
+            audit_log.clear()
+
+    def test_ring_buffer_drops_oldest(self):
+        audit_log = audit.AuditLog(buffer_size=2, flush_size=10, flush_interval=60)
+        before = registry.value("crm_audit_dropped_total")
+        for i in range(3):
+            audit_log.append(AuditEvent(created_at=timezone.now(), actor="a", action="x", target_type="T", target_id=str(i)))
+        audit_log.flush()
+        self.assertEqual(sorted(AuditEvent.objects.values_list("target_id", flat=True)), ["1", "2"])
+        self.assertEqual(registry.value("crm_audit_dropped_total"), before + 1)
+
+    def test_failed_flush_keeps_events(self):
+        self.audit_log.append(AuditEvent(created_at=timezone.now(), actor="a", action="x", target_type="T"))
+        with mock.patch.object(AuditEvent.objects, "bulk_create", side_effect=OperationalError("locked")), \
+                self.assertLogs("crm.audit", "ERROR"):
+            self.assertEqual(self.audit_log.flush(), 0)
+        self.assertEqual(len(self.audit_log), 1)
+        self.assertEqual(self.audit_log.flush(), 1)
+
+    def test_request_finished_flushes_when_due(self):
+        self.mutate('mutation { createCustomer(name: "A", email: "a@example.com") { customer { id } } }')
+        with mock.patch.object(self.audit_log, "flush_interval", 0):
+            self.client.post("/graphql", {"query": "{ customers { id } }"}, content_type="application/json")
+        self.assertEqual(AuditEvent.objects.count(), 1)
+
+    def test_audit_events_query(self):
+        for i in range(3):
+            self.mutate(f'mutation {{ createCustomer(name: "A{i}", email: "a{i}@example.com") {{ customer {{ id }} }} }}')
+        query = """query ($after: String) {
+          auditEvents(first: 2, after: $after, action: "createCustomer") {
+            edges { node { actor targetId changes } }
+            pageInfo { hasNextPage endCursor }
+          }
+        }"""
+        result = run_query(query)
+        self.assertIn("Only staff", result.errors[0].message)
+
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.post("/graphql", {"query": query}, content_type="application/json")
+        page = response.json()["data"]["auditEvents"]
+        self.assertEqual(len(page["edges"]), 2)
+        self.assertTrue(page["pageInfo"]["hasNextPage"])
+        response = self.client.post(
+            "/graphql", {"query": query, "variables": {"after": page["pageInfo"]["endCursor"]}},
+            content_type="application/json",
+        )
+        page = response.json()["data"]["auditEvents"]
+        self.assertEqual([json.loads(e["node"]["changes"])["email"][1] for e in page["edges"]], ["a2@example.com"])
+        self.assertFalse(page["pageInfo"]["hasNextPage"])
+
+    def test_local_client_actor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            graphql_client.LocalClient().execute(
+                'mutation { createCustomer(name: "S", email: "s@example.com") { customer { id } } }'
+            )
+        self.audit_log.flush()
+        self.assertEqual(AuditEvent.objects.get().actor, "system")
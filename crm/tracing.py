@@ -0,0 +1,229 @@
+"""
+Per-resolver tracing and SQL accounting for the CRM GraphQL views.
+
+``TracingMiddleware`` times every resolver and remembers which resolver is
+running; ``capture_sql`` installs a ``connection.execute_wrapper`` that
+charges each SQL statement to that resolver. Statements run by DataLoader
+callbacks after their resolvers returned are charged to ``(deferred)``.
+
+After the operation the trace feeds the metrics registry (crm.metrics) and,
+for requests sending ``X-CRM-Trace: 1`` (when ``CRM_TRACING_EXTENSIONS`` is
+on, or for staff users), is returned in ``extensions``:
+
+- ``tracing``: Apollo tracing format, each resolver entry extended with
+  ``sqlCount``/``sqlDuration`` (nanoseconds)
+- ``sql``: total statement count and time
+- ``nPlusOne``: SQL shapes repeated ``N_PLUS_ONE_THRESHOLD`` or more times
+  under the same list field path (``orders.*.customer``), with the schema
+  field that ran them (``OrderType.customer``)
+
+Metrics are labelled by schema field, never by response path: paths carry
+client-chosen aliases and would make the label set unbounded.
+
+Leaf fields are only traced when the header asks for a trace.
+"""
+
+import contextvars
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+from graphql import get_named_type, is_leaf_type
+
+from .metrics import registry
+
+TRACER_ATTR = "_crm_tracer"
+TRACE_HEADER = "HTTP_X_CRM_TRACE"
+DEFERRED = "(deferred)"
+UNKNOWN_FIELD = "(unknown)"
+N_PLUS_ONE_THRESHOLD = 3
+
+_current_path = contextvars.ContextVar("crm_current_resolver", default=None)
+
+_IN_LIST = re.compile(r"\bIN \((?:%s, )*%s\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def sql_shape(sql):
+    """SQL with IN (...) lists of any length folded together."""
+    return _IN_LIST.sub("IN (...)", _WHITESPACE.sub(" ", sql.strip()))
+
+
+def _list_path(path):
+    return ".".join("*" if isinstance(key, int) else str(key) for key in path)
+
+
+def _rfc3339(moment):
+    return moment.isoformat().replace("+00:00", "Z")
+
+
+class Tracer:
+    def __init__(self, detailed=False):
+        self.detailed = detailed
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.resolvers = []
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def add_resolver(self, info, start, end):
+        entry = {
+            "path": info.path.as_list(),
+            "parentType": info.parent_type.name,
+            "fieldName": info.field_name,
+            "returnType": str(info.return_type),
+            "startOffset": int((start - self.start) * 1e9),
+            "duration": int((end - start) * 1e9),
+        }
+        with self._lock:
+            self.resolvers.append(entry)
+
+    def add_query(self, sql, seconds):
+        path = _current_path.get()
+        with self._lock:
+            self.queries.append((tuple(path) if path else None, sql, seconds))
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query(sql, time.perf_counter() - start)
+
+    # --- Results ---
+    def fields_by_path(self):
+        return {
+            tuple(entry["path"]): f"{entry['parentType']}.{entry['fieldName']}"
+            for entry in self.resolvers
+        }
+
+    def n_plus_one(self):
+        fields = self.fields_by_path()
+        shapes = Counter()
+        field_of = {}
+        for path, sql, _ in self.queries:
+            if path and any(isinstance(key, int) for key in path):
+                key = (_list_path(path), sql_shape(sql))
+                shapes[key] += 1
+                field_of.setdefault(key, fields.get(path, UNKNOWN_FIELD))
+        return [
+            {"path": path, "field": field_of[path, shape], "sql": shape, "count": count}
+            for (path, shape), count in shapes.items()
+            if count >= N_PLUS_ONE_THRESHOLD
+        ]
+
+    def sql_by_path(self):
+        totals = defaultdict(lambda: [0, 0.0])
+        for path, _, seconds in self.queries:
+            total = totals[path]
+            total[0] += 1
+            total[1] += seconds
+        return totals
+
+    def finish(self, operation_type):
+        """Record metrics; return the extensions for a detailed trace, else ``None``."""
+        duration = time.perf_counter() - self.start
+        sql_by_path = self.sql_by_path()
+        n_plus_one = self.n_plus_one()
+
+        registry.inc("crm_graphql_requests_total", operation=operation_type)
+        registry.observe("crm_graphql_request_duration_seconds", duration, operation=operation_type)
+        for entry in self.resolvers:
+            field = f"{entry['parentType']}.{entry['fieldName']}"
+            registry.observe("crm_graphql_resolver_duration_seconds", entry["duration"] / 1e9, field=field)
+            count, seconds = sql_by_path.get(tuple(entry["path"]), (0, 0.0))
+            if count:
+                registry.inc("crm_graphql_sql_queries_total", count, field=field)
+                registry.inc("crm_graphql_sql_duration_seconds_total", seconds, field=field)
+        deferred_count, deferred_seconds = sql_by_path.get(None, (0, 0.0))
+        if deferred_count:
+            registry.inc("crm_graphql_sql_queries_total", deferred_count, field=DEFERRED)
+            registry.inc("crm_graphql_sql_duration_seconds_total", deferred_seconds, field=DEFERRED)
+        for problem in n_plus_one:
+            registry.inc("crm_graphql_n_plus_one_total", field=problem["field"])
+
+        if not self.detailed:
+            return None
+        resolvers = []
+        for entry in self.resolvers:
+            count, seconds = sql_by_path.get(tuple(entry["path"]), (0, 0.0))
+            resolvers.append({**entry, "sqlCount": count, "sqlDuration": int(seconds * 1e9)})
+        return {
+            "tracing": {
+                "version": 1,
+                "startTime": _rfc3339(self.started_at),
+                "endTime": _rfc3339(datetime.now(timezone.utc)),
+                "duration": int(duration * 1e9),
+                "execution": {"resolvers": resolvers},
+            },
+            "sql": {
+                "count": len(self.queries),
+                "duration": int(sum(seconds for _, _, seconds in self.queries) * 1e9),
+                "deferredCount": deferred_count,
+            },
+            "nPlusOne": n_plus_one,
+        }
+
+
+def tracing_enabled():
+    return getattr(settings, "CRM_TRACING_ENABLED", True)
+
+
+def wants_trace(request):
+    if request.META.get(TRACE_HEADER) not in ("1", "true"):
+        return False
+    user = getattr(request, "user", None)
+    return getattr(settings, "CRM_TRACING_EXTENSIONS", False) or bool(user and user.is_staff)
+
+
+def start_trace(request):
+    tracer = Tracer(detailed=wants_trace(request)) if tracing_enabled() else None
+    setattr(request, TRACER_ATTR, tracer)
+    return tracer
+
+
+def get_tracer(context):
+    return getattr(context, TRACER_ATTR, None)
+
+
+@contextmanager
+def capture_sql(tracer):
+    """Charge SQL run in this thread, on every database, to ``tracer``."""
+    if tracer is None:
+        yield
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(tracer.sql_wrapper))
+        yield
+
+
+class TracingMiddleware:
+    """Graphene middleware timing resolvers and tagging the SQL they run."""
+
+    def resolve(self, next, root, info, **args):
+        tracer = get_tracer(info.context)
+        if tracer is None or (
+            not tracer.detailed and is_leaf_type(get_named_type(info.return_type))
+        ):
+            return next(root, info, **args)
+
+        token = _current_path.set(info.path.as_list())
+        start = time.perf_counter()
+        try:
+            result = next(root, info, **args)
+            if isinstance(result, QuerySet):
+                # Evaluate here, not during list completion, so the rows are
+                # charged to this field.
+                result._fetch_all()
+            return result
+        finally:
+            end = time.perf_counter()
+            _current_path.reset(token)
+            tracer.add_resolver(info, start, end)
@@ -1,3 +1,566 @@
-from django.shortcuts import render
+import asyncio
+import copy
+import json
 
-# Create your views here.
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed,
+    HttpResponseNotFound,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionContext,
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    execute,
+    get_operation_ast,
+    parse,
+    specified_rules,
+    validate,
+    validate_schema,
+)
+from graphql.execution.collect_fields import collect_fields
+from graphql.execution.middleware import MiddlewareManager
+from graphql.pyutils import Path
+from graphql_sync_dataloaders import DeferredExecutionContext
+
+from .concurrency import run_in_pool
+from .cost import QueryCostRule, cached_operation_cost, get_max_cost
+from .db import get_read_alias, mark_written, may_read_replica, read_database
+from .export import CONTENT_TYPES, EXPORTS, FORMAT_NDJSON, ExportError, stream_export
+from .loaders import LOADERS_ATTR
+from .metrics import registry
+from .tracing import TracingMiddleware, capture_sql, get_tracer, start_trace
+from .persisted import get_document_cache, get_persisted_queries, parse_extensions, query_hash
+from .response_cache import get_response_cache, response_cache_enabled, user_cache_key
+
+
+DEFAULT_MAX_BATCH_SIZE = 10
+DEFAULT_METRICS_ALLOWED_IPS = ("127.0.0.1", "::1")
+
+
+class CRMExecutionContext(DeferredExecutionContext):
+    """
+    DeferredExecutionContext adapted to the installed graphql-core.
+
+    graphql-core 3.2.4+ needs the field path in ``handle_field_error``, which
+    graphql-sync-dataloaders does not pass; rebuild it from the located error.
+    """
+
+    def handle_field_error(self, error, return_type, path=None):
+        if path is None:
+            for key in error.path or ():
+                path = Path(path, key, None)
+        return super().handle_field_error(error, return_type, path)
+
+
+class RootFieldsExecutionContext(CRMExecutionContext):
+    """CRMExecutionContext that only executes some of the operation's root fields."""
+
+    root_keys = frozenset()
+
+    @classmethod
+    def for_keys(cls, keys):
+        return type(cls.__name__, (cls,), {"root_keys": frozenset(keys)})
+
+    def execute_fields(self, parent_type, source_value, path, fields):
+        if path is None:
+            fields = {key: nodes for key, nodes in fields.items() if key in self.root_keys}
+        return super().execute_fields(parent_type, source_value, path, fields)
+
+
+class PreparedOperation:
+    """A parsed and validated operation, ready to execute."""
+
+    def __init__(self, schema, document, operation_ast, variables, operation_name, cost=None):
+        self.schema = schema
+        self.document = document
+        self.operation_ast = operation_ast
+        self.variables = variables
+        self.operation_name = operation_name
+        self.cost = cost
+        self.cache_key = None
+        self.read_replica = False
+
+    @property
+    def extensions(self):
+        return {"cost": self.cost.as_extension()} if self.cost else None
+
+    @property
+    def is_query(self):
+        return self.operation_ast is not None and self.operation_ast.operation == OperationType.QUERY
+
+    @property
+    def operation_type(self):
+        return self.operation_ast.operation.value if self.operation_ast is not None else "unknown"
+
+    @property
+    def is_mutation(self):
+        return (
+            self.operation_ast is not None
+            and self.operation_ast.operation == OperationType.MUTATION
+        )
+
+    def root_keys(self):
+        """Response keys of the root selection, or ``None`` if variables don't coerce."""
+        context = ExecutionContext.build(
+            self.schema,
+            self.document,
+            raw_variable_values=self.variables,
+            operation_name=self.operation_name,
+        )
+        if isinstance(context, list):
+            return None
+        return list(collect_fields(
+            self.schema,
+            context.fragments,
+            context.variable_values,
+            self.schema.query_type,
+            context.operation.selection_set,
+        ))
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQL endpoint for the CRM.
+
+    Runs operations with ``CRMExecutionContext`` so that resolvers can return
+    DataLoader futures (see ``crm.loaders``) and have sibling lookups batched
+    into a single query. Accepts Automatic Persisted Queries and serves
+    repeated queries from a cache of validated documents (see
+    ``crm.persisted``); results of read queries are cached until a write
+    touches one of the models they read (see ``crm.response_cache``).
+    Operations over the depth/cost budget are rejected during validation and
+    every response reports its cost in ``extensions`` (see ``crm.cost``).
+    Resolvers and their SQL are traced for ``/metrics`` and, on request, for
+    the response ``extensions`` (see ``crm.tracing``).
+
+    A JSON array body is a batch: up to ``CRM_GRAPHQL_MAX_BATCH_SIZE``
+    operations run in order within this one request, sharing its DataLoader
+    caches and database connection, and the response is an array of results.
+    The batch as a whole must fit in the ``CRM_QUERY_MAX_COST`` budget.
+    """
+
+    execution_context_class = CRMExecutionContext
+    validation_rules = (*specified_rules, QueryCostRule)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method.lower() == "post" and is_batch_request(self, request):
+            try:
+                return self.dispatch_batch(request)
+            except HttpError as e:
+                response = e.response
+                response["Content-Type"] = "application/json"
+                response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+                return response
+        return super().dispatch(request, *args, **kwargs)
+
+    def dispatch_batch(self, request):
+        try:
+            operations = json.loads(request.body.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            raise HttpError(HttpResponseBadRequest("POST body sent invalid JSON."))
+        max_size = getattr(settings, "CRM_GRAPHQL_MAX_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE)
+        if not operations:
+            raise HttpError(HttpResponseBadRequest("Received an empty list in the batch request."))
+        if len(operations) > max_size:
+            raise HttpError(HttpResponseBadRequest(
+                f"Batch of {len(operations)} operations exceeds the limit of {max_size}."
+            ))
+        if not all(isinstance(operation, dict) for operation in operations):
+            raise HttpError(HttpResponseBadRequest("Every operation in a batch must be a JSON object."))
+        # Checked up front: nothing runs unless the whole batch is affordable.
+        total_cost, max_cost = self.batch_cost(request, operations), get_max_cost()
+        if total_cost > max_cost:
+            raise HttpError(HttpResponseBadRequest(
+                f"Batch has cost {total_cost}, exceeding the budget of {max_cost}."
+            ))
+
+        responses = []
+        for operation in operations:
+            # A failed mutation earlier in the batch must not flag the ones after it.
+            request.__dict__.pop(MUTATION_ERRORS_FLAG, None)
+            query, variables, operation_name, id = self.get_graphql_params(request, operation)
+            execution_result = self.execute_graphql_request(
+                request, operation, query, variables, operation_name
+            )
+            responses.append(self.render_result(request, execution_result, id, batched=True))
+        status_code = max(status for _, status in responses)
+        content = "[{}]".format(",".join(result for result, _ in responses))
+        return HttpResponse(status=status_code, content=content, content_type="application/json")
+
+    def batch_cost(self, request, operations):
+        """Summed static cost of a batch; operations that don't validate count 0."""
+        schema = self.schema.graphql_schema
+        total = 0
+        for operation in operations:
+            query, _, operation_name, _ = self.get_graphql_params(request, operation)
+            try:
+                extensions = parse_extensions(request.GET.get("extensions") or operation.get("extensions"))
+                query = get_persisted_queries().resolve(query, extensions)
+            except GraphQLError:
+                continue
+            if not query:
+                continue
+            document, errors = self.get_document(schema, query)
+            operation_ast = None if errors else get_operation_ast(document, operation_name)
+            if operation_ast is not None:
+                total += cached_operation_cost(schema, document, operation_ast, query_hash(query)).cost
+        return total
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.render_result(request, execution_result, id, show_graphiql)
+
+    def render_result(self, request, execution_result, id=None, show_graphiql=False, batched=False):
+        """Serialize an ExecutionResult the way GraphQLView.get_response does."""
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if not execution_result:
+            return None, status_code
+
+        response = {}
+        if execution_result.errors:
+            set_rollback()
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+
+        if self.batch or batched:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        prepared = self.prepare_operation(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+        start_trace(request)
+        result = self.execute_prepared(request, prepared)
+        self.cache_result(prepared, result)
+        return self.finish_result(request, prepared, result)
+
+    def prepare_operation(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        """
+        Resolve, parse and validate the request's operation.
+
+        Returns a ``PreparedOperation``, or the final ExecutionResult (errors,
+        cached response, or ``None`` for GraphiQL) when there's nothing to run.
+        """
+        try:
+            extensions = parse_extensions(request.GET.get("extensions") or data.get("extensions"))
+            query = get_persisted_queries().resolve(query, extensions)
+        except GraphQLError as error:
+            return ExecutionResult(errors=[error])
+        if not query:
+            return super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+
+        schema = self.schema.graphql_schema
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document, errors = self.get_document(schema, query)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    f"Can only perform a {operation_ast.operation.value} operation from a POST request.",
+                )
+            )
+
+        cost = None
+        if operation_ast is not None:
+            cost = cached_operation_cost(schema, document, operation_ast, query_hash(query))
+        prepared = PreparedOperation(
+            schema, document, operation_ast, variables, operation_name, cost
+        )
+        if prepared.is_query and response_cache_enabled():
+            response_cache = get_response_cache()
+            normalized, dependencies = response_cache.plan(schema, document, query_hash(query))
+            if dependencies:
+                prepared.cache_key = response_cache.key(
+                    normalized, dependencies, operation_name, variables, user_cache_key(request)
+                )
+                data = response_cache.get(prepared.cache_key)
+                if data is not None:
+                    return ExecutionResult(data=data, extensions=prepared.extensions)
+        return prepared
+
+    def execute_prepared(self, request, prepared, execution_context_class=None):
+        # Queries may read from the replica; mutations, and whatever follows
+        # one in a batch, stay on the primary.
+        replica = may_read_replica(request, prepared.is_query)
+        with capture_sql(get_tracer(request)), read_database(replica):
+            prepared.read_replica = get_read_alias() is not None
+            result = self._execute_prepared(request, prepared, execution_context_class)
+        if prepared.is_mutation:
+            mark_written(request)
+        return result
+
+    def _execute_prepared(self, request, prepared, execution_context_class):
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": prepared.variables,
+                "operation_name": prepared.operation_name,
+                "middleware": self.get_middleware(request),
+                "execution_context_class": execution_context_class or self.execution_context_class,
+            }
+            if prepared.is_mutation and (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            ):
+                with transaction.atomic():
+                    result = execute(prepared.schema, prepared.document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+            return execute(prepared.schema, prepared.document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def finish_result(self, request, prepared, result):
+        """Attach cost and, when requested, trace extensions; record metrics."""
+        if prepared.is_mutation:
+            # Later operations in a batch must not see pre-mutation loader caches.
+            request.__dict__.pop(LOADERS_ATTR, None)
+        extensions = dict(prepared.extensions or {})
+        tracer = get_tracer(request)
+        if tracer is not None:
+            extensions.update(tracer.finish(prepared.operation_type) or {})
+        result.extensions = extensions or None
+        return result
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if isinstance(middleware, MiddlewareManager):
+            return middleware
+        return [*(middleware or ()), TracingMiddleware()]
+
+    def cache_result(self, prepared, result):
+        # A replica may lag behind the versions the key was built from.
+        if prepared.cache_key is not None and not prepared.read_replica and not result.errors:
+            get_response_cache().set(prepared.cache_key, result.data)
+
+    def get_document(self, schema, query):
+        """Return ``(document, errors)``, parsing and validating only on a cache miss."""
+        cache = get_document_cache()
+        key = (query_hash(query), tuple(self.validation_rules or ()))
+        document = cache.get(key)
+        if document is not None:
+            return document, None
+
+        try:
+            document = parse(query)
+        except GraphQLError as error:
+            return None, [error]
+        errors = validate(
+            schema, document, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS
+        )
+        if errors:
+            return None, errors
+        cache.set(key, document)
+        return document, None
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    Async variant of ``CRMGraphQLView`` for ASGI deployments.
+
+    The request waits on the event loop, not on a worker thread: parsing,
+    validation and execution run on the bounded pool from
+    ``crm.concurrency``. Each root field of a query executes as its own
+    pooled task, so independent root fields resolve concurrently; mutations
+    keep the serial execution the spec requires. DataLoaders batch as usual
+    within each task.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        sync_dispatch = run_in_pool(super().dispatch)
+        if (
+            self.batch
+            or request.method.lower() not in ("get", "post")
+            or is_batch_request(self, request)
+        ):
+            return await sync_dispatch(request, *args, **kwargs)
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_dispatch(request, *args, **kwargs)
+
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+            execution_result = await self.execute_graphql_request_async(
+                request, data, query, variables, operation_name
+            )
+            result, status_code = self.render_result(request, execution_result, id)
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        prepared = await run_in_pool(self.prepare_operation)(
+            request, data, query, variables, operation_name
+        )
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+
+        start_trace(request)
+        keys = prepared.root_keys() if prepared.is_query else None
+        if not keys or len(keys) == 1:
+            result = await run_in_pool(self.execute_prepared)(request, prepared)
+        else:
+            results = await asyncio.gather(*(
+                run_in_pool(self.execute_prepared)(
+                    _request_copy(request), prepared, RootFieldsExecutionContext.for_keys([key])
+                )
+                for key in keys
+            ))
+            result = _merge_root_results(keys, results)
+
+        await run_in_pool(self.cache_result)(prepared, result)
+        return self.finish_result(request, prepared, result)
+
+
+def is_batch_request(view, request):
+    """Whether ``request`` carries a JSON array of operations."""
+    return (
+        view.get_content_type(request) == "application/json"
+        and request.body.lstrip()[:1] == b"["
+    )
+
+
+def _request_copy(request):
+    # Each task gets its own context so DataLoaders aren't shared across threads.
+    clone = copy.copy(request)
+    clone.__dict__.pop(LOADERS_ATTR, None)
+    return clone
+
+
+def _merge_root_results(keys, results):
+    errors = [error for result in results for error in result.errors or ()]
+    if any(result.data is None for result in results):
+        # A non-null root field failed, which nulls the whole response.
+        return ExecutionResult(data=None, errors=errors)
+    data = {key: result.data.get(key) for key, result in zip(keys, results)}
+    return ExecutionResult(data=data, errors=errors or None)
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip (``q=0`` refuses a coding)."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    quality = qualities.get("gzip", qualities.get("x-gzip", qualities.get("*", 0.0)))
+    return quality > 0
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint for the GraphQL metrics (see ``crm.metrics``).
+
+    Open to staff users and to scrapers from ``CRM_METRICS_ALLOWED_IPS``.
+    """
+    if not getattr(settings, "CRM_METRICS_ENABLED", True):
+        return HttpResponseNotFound()
+    allowed_ips = getattr(settings, "CRM_METRICS_ALLOWED_IPS", DEFAULT_METRICS_ALLOWED_IPS)
+    if request.META.get("REMOTE_ADDR") not in allowed_ips and not request.user.is_staff:
+        return HttpResponseForbidden()
+    stats = get_response_cache().stats()
+    extra = [
+        ("crm_response_cache_hits_total", stats["hits"]),
+        ("crm_response_cache_misses_total", stats["misses"]),
+    ]
+    return HttpResponse(
+        registry.render(extra), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@require_GET
+def export_view(request, kind):
+    """
+    Stream every ``kind`` row matching the FilterSet params in the query string.
+
+    ``?format=ndjson`` (default) or ``csv``; gzipped when the client accepts
+    it. Staff only unless ``CRM_EXPORT_STAFF_ONLY`` is off.
+    """
+    if kind not in EXPORTS:
+        raise Http404(f"Unknown export '{kind}'.")
+    if getattr(settings, "CRM_EXPORT_STAFF_ONLY", True) and not request.user.is_staff:
+        return HttpResponseForbidden()
+
+    params = request.GET.copy()
+    output_format = params.pop("format", [FORMAT_NDJSON])[-1]
+    compress = accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    try:
+        blocks = stream_export(kind, params, output_format, compress)
+    except ExportError as e:
+        return JsonResponse({"errors": [str(e)]}, status=400)
+
+    response = StreamingHttpResponse(blocks, content_type=CONTENT_TYPES[output_format])
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{output_format}"'
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
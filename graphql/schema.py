@@ -65,4 +65,18 @@ mutation {
       orderDate
     }
   }
-}
\ No newline at end of file
+}
+
+# Bulk create orders (rows are validated up front; bad rows are reported in errors)
+mutation {
+  bulkCreateOrders(input: [
+    { customerId: "1", productIds: ["1", "2"] },
+    { customerId: "2", productIds: ["2"] }
+  ]) {
+    orders {
+      id
+      totalAmount
+    }
+    errors
+  }
+}